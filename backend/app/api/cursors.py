@@ -0,0 +1,29 @@
+import base64
+import uuid
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+from fastapi import HTTPException
+
+KeyT = TypeVar("KeyT")
+
+
+def encode_cursor(*parts: Any) -> str:
+    """
+    Opaque cursor of a keyset paginated listing: the sort key of the last
+    row of a page, in one or more parts, then the row's id.
+    """
+    return base64.urlsafe_b64encode("|".join(str(part) for part in parts).encode()).decode()
+
+
+def decode_cursor(cursor: str, parse_key: Callable[[str], KeyT]) -> tuple[KeyT, uuid.UUID]:
+    """
+    Sort key and row id of a cursor from encode_cursor, a 400 when it isn't
+    one. The key parts are passed to parse_key joined as they were, which
+    raises ValueError on a key it doesn't accept.
+    """
+    try:
+        key, _, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rpartition("|")
+        return parse_key(key), uuid.UUID(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -8,7 +8,9 @@ from app.api.routes import (items,
                             companies,
                             company,
                             employee,
-                            tag)
+                            tag,
+                            upload,
+                            design_item)
 from app.core.config import settings
 
 api_router = APIRouter()
@@ -20,6 +22,8 @@ api_router.include_router(companies.router)
 api_router.include_router(company.router)
 api_router.include_router(employee.router)
 api_router.include_router(tag.router)
+api_router.include_router(upload.router)
+api_router.include_router(design_item.router)
 
 if settings.ENVIRONMENT == "local":
     api_router.include_router(private.router)
@@ -1,27 +1,49 @@
+import hashlib
+import threading
 import uuid
-from typing import Any
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Any, Literal, TypeVar
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select, delete
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select, delete, update
 from sqlalchemy.orm import noload
 from app import crud
 
+from app.api.cursors import decode_cursor, encode_cursor
 from app.api.deps import CurrentUser, SessionDep, CurrentEmployee
+from app.api.routes.employee import list_employees_page
+from app.core.config import settings
+from app.core.db import engine, overview_engine
 from app.models import (Company,
                         EmployeesPublic,
-                        EmployeePublic,
+                        EmployeesQuery,
                         CompanyPublic,
+                        CompanyDetailPublic,
+                        CompanyOverviewPublic,
+                        CompanyQuotaUpdate,
+                        CompanyUsage,
+                        CompanyUsagePublic,
                         CompanyCreate,
                         CompanyUpdate,
                         UserCompanyLink,
                         CompanyRole,
                         Message,
-                        User,
-                        Tag,
-                        TagsPublic)
+                        TagsPublic,
+                        TagsQuery)
 
 router = APIRouter(prefix="/company", tags=["company"])
 
+T = TypeVar("T")
+
+# Shared by all overview requests, as many threads as overview_engine has
+# connections. A part is only handed over when a thread is free, so it
+# never queues behind other requests' parts
+overview_executor = ThreadPoolExecutor(
+    max_workers=settings.COMPANY_OVERVIEW_WORKERS, thread_name_prefix="company-overview")
+overview_slots = threading.Semaphore(settings.COMPANY_OVERVIEW_WORKERS)
+
 
 @router.post("/", response_model=CompanyPublic)
 def create_company(
@@ -42,63 +64,175 @@ def create_company(
     )
     session.add(company)
     session.add(link)
+    session.add(CompanyUsage(company_id=company.id))
     session.commit()
     session.refresh(company)
     return company
 
 
-@router.get("/{company_id}", response_model=CompanyPublic)
+@router.get("/{company_id}", response_model=CompanyDetailPublic)
 def read_company(session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee) -> Any:
     """
-    Get Company by ID.
+    Get Company by ID with its storage usage.
     """
     company = session.get(Company, company_id)
-    return company
+    usage = crud.get_company_usage(session=session, company_id=company_id)
+    return CompanyDetailPublic.model_validate(company, update={"usage": usage})
 
 
-@router.get("/{company_id}/employees", response_model=EmployeesPublic)
-def read_company_employees(session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, skip: int = 0, limit: int = 100) -> Any:
+def _in_overview_session(run: Callable[[Session], T]) -> T:
+    try:
+        with Session(overview_engine) as session:
+            return run(session)
+    finally:
+        overview_slots.release()
+
+
+def _start_overview_part(session: Session, run: Callable[[Session], T]) -> Callable[[], T]:
+    """
+    Start run on an overview thread when one is free, the returned
+    function waits for its result. With every thread busy, the returned
+    function runs it on the request's session instead.
+    """
+    if overview_slots.acquire(blocking=False):
+        return overview_executor.submit(_in_overview_session, run).result
+    return lambda: run(session)
+
+
+@router.get("/{company_id}/overview", response_model=CompanyOverviewPublic)
+def read_company_overview(
+    request: Request, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 20,
+) -> Any:
+    """
+    Get Company with its storage usage, the caller's role, its employee
+    and tag counts and the first page of its tags and of its employees.
+
+    The counts and pages are read in parallel on connections of their own
+    while the request's session reads the company, those that find no free
+    connection after it. Send the returned ETag in If-None-Match to get 304
+    Not Modified when nothing changed.
+    """
+    tags = _start_overview_part(
+        session, lambda other: list_tags_page(other, company_id, TagsQuery(limit=limit)))
+    employees = _start_overview_part(
+        session, lambda other: list_employees_page(other, company_id, EmployeesQuery(limit=limit)))
+    counts = _start_overview_part(
+        session, lambda other: crud.count_company_employees_and_tags(session=other, company_id=company_id))
+
+    company = session.exec(
+        select(Company).where(Company.id == company_id).options(noload(Company.employee))).one()
+    usage = crud.get_company_usage(session=session, company_id=company_id)
+    employee_count, tag_count = counts()
+    overview = CompanyOverviewPublic(
+        company=CompanyDetailPublic.model_validate(company, update={"usage": usage}),
+        role=current_employee.role,
+        employee_count=employee_count,
+        tag_count=tag_count,
+        tags=tags(),
+        employees=employees(),
+    )
+
+    body = overview.model_dump_json().encode()
+    # Weak, the same overview may serialize differently after an upgrade
+    etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.put("/{company_id}/quota", response_model=CompanyUsagePublic)
+def update_company_quota(
+    *,
+    session: SessionDep,
+    company_id: uuid.UUID,
+    quota_in: CompanyQuotaUpdate,
+    current_employee: CurrentEmployee
+) -> Any:
     """
-    Get Company Employees.
+    Set Company quotas, null falls back to the default.
     """
-    count_statement = (
-        select(func.count())
-        .select_from(UserCompanyLink)
-        .where(UserCompanyLink.company_id == company_id)
+    if not current_employee.is_superuser:
+        raise HTTPException(
+            status_code=403, detail="The user doesn't have enough privileges")
+
+    session.exec(
+        update(Company)
+        .where(Company.id == company_id)
+        .values(**quota_in.model_dump(exclude_unset=True))
     )
-    count = session.exec(count_statement).one()
+    session.commit()
+    return crud.get_company_usage(session=session, company_id=company_id)
+
+
+@router.get("/{company_id}/employees", response_model=EmployeesPublic)
+def read_company_employees(
+    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee,
+    query: Annotated[EmployeesQuery, Query()],
+) -> Any:
+    """
+    Get Company Employees, same as GET /{company_id}/employee/.
+    """
+    return list_employees_page(session, company_id, query)
 
-    results = session.exec(
-        select(User.id,
-               User.email,
-               User.full_name,
-               UserCompanyLink.role.label("role"))
-        .join(UserCompanyLink)
-        .where(UserCompanyLink.company_id == company_id).offset(skip)
-        .limit(limit)
-    ).all()
 
-    employees = [EmployeePublic(**row._mapping) for row in results]
+def decode_tag_cursor(cursor: str, sort: str) -> tuple[Any, uuid.UUID]:
+    def parse_key(key: str) -> Any:
+        # Cursors lead with the sort they were made for
+        cursor_sort, _, value = key.partition("|")
+        if cursor_sort != sort:
+            raise ValueError(sort)
+        return value if sort == "title" else int(value)
 
-    return EmployeesPublic(data=employees, count=count)
+    return decode_cursor(cursor, parse_key)
+
+
+def list_tags_page(session: Session, company_id: uuid.UUID, query: TagsQuery) -> TagsPublic:
+    after = decode_tag_cursor(query.cursor, query.sort) if query.cursor else None
+    tags = crud.list_tags(
+        session=session, company_id=company_id, sort=query.sort, after=after, limit=query.limit + 1)
+    next_cursor = None
+    if len(tags) > query.limit:
+        last, key = tags[query.limit - 1]
+        next_cursor = encode_cursor(query.sort, key, last.id)
+    return TagsPublic(data=[tag for tag, _ in tags[:query.limit]], next_cursor=next_cursor)
 
 
 @router.get("/{company_id}/tags", response_model=TagsPublic)
-def read_company_tags(session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee) -> Any:
+def read_company_tags(
+    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee,
+    query: Annotated[TagsQuery, Query()],
+) -> Any:
     """
-    Get Company Tags.
+    Get Company Tags by title, or most used first with sort=usage.
     """
+    return list_tags_page(session, company_id, query)
 
-    results = session.exec(
-        select(Tag)
-        .where(Tag.company_id == company_id)
-        .options(
-            noload(Tag.company),
-            noload(Tag.design_items)
-        )
-    ).all()
 
-    return TagsPublic(data=results)
+def ndjson_tags(company_id: uuid.UUID, sort: Literal["title", "usage"], batch_size: int = 1000) -> Iterator[bytes]:
+    with Session(engine) as session:
+        batch = []
+        for tag in crud.iter_tags(session=session, company_id=company_id, sort=sort, batch_size=batch_size):
+            batch.append(tag.model_dump_json())
+            if len(batch) == batch_size:
+                yield ("\n".join(batch) + "\n").encode()
+                batch.clear()
+        if batch:
+            yield ("\n".join(batch) + "\n").encode()
+
+
+@router.get("/{company_id}/tags/stream")
+def stream_company_tags(
+    company_id: uuid.UUID, current_employee: CurrentEmployee, sort: Literal["title", "usage"] = "title"
+) -> Any:
+    """
+    All Company Tags as newline delimited JSON, one tag per line.
+
+    Tags are read from a server side cursor while the response is sent,
+    so memory use doesn't grow with the number of tags.
+    """
+    return StreamingResponse(ndjson_tags(company_id, sort), media_type="application/x-ndjson")
 
 
 @router.put("/{company_id}", response_model=CompanyPublic)
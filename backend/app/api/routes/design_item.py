@@ -0,0 +1,420 @@
+import re
+import uuid
+from collections.abc import Iterator
+from datetime import date, datetime, time
+from functools import partial
+from pathlib import PurePosixPath
+from typing import Annotated, Any
+
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from sqlmodel import exists, or_, select
+from sqlalchemy.orm import noload
+
+from app import crud, related_items, similarity, tag_index, thumbnails, versions
+from app.api.cursors import decode_cursor, encode_cursor
+from app.api.deps import SessionDep, CurrentEmployee
+from app.core.config import settings
+from app.models import (CompanyRole,
+                        DesignItem,
+                        DesignItemExport,
+                        DesignItemFacetsQuery,
+                        DesignItemInSprite,
+                        DesignItemPublic,
+                        DesignItemsPage,
+                        DesignItemsQuery,
+                        DesignItemsSpritePage,
+                        DesignItemTagsResult,
+                        DesignItemTagsUpdate,
+                        DesignItemVersionPublic,
+                        DesignItemVersionsPublic,
+                        Message,
+                        RelatedDesignItemsPublic,
+                        SimilarDesignItemsPublic,
+                        TagFacetsPublic,
+                        TagItemLink)
+from app.storage import get_storage
+from app.storage.base import content_disposition
+from app.zipstream import ZipEntry, stream_zip
+
+router = APIRouter(prefix="/{company_id}/item", tags=["design_item"])
+
+
+def get_company_item(session: SessionDep, company_id: uuid.UUID, item_id: uuid.UUID) -> DesignItem:
+    item = session.exec(
+        select(DesignItem)
+        .where(DesignItem.id == item_id, DesignItem.company_id == company_id)
+        .options(
+            noload(DesignItem.creator),
+            noload(DesignItem.company),
+            noload(DesignItem.tags)
+        )
+    ).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Design item not found")
+    return item
+
+
+def list_design_items_page(
+    session: SessionDep, company_id: uuid.UUID, query: DesignItemsQuery
+) -> tuple[list[DesignItem], str | None]:
+    after = decode_cursor(query.cursor, date.fromisoformat) if query.cursor else None
+    items = None
+    if query.tags_all or query.tags_any or query.tags_none:
+        items = tag_index.find_design_items(
+            session=session, company_id=company_id, item_filter=query, after=after, limit=query.limit + 1)
+    if items is None:
+        items = crud.list_design_items(
+            session=session,
+            company_id=company_id,
+            item_filter=query,
+            after=after,
+            limit=query.limit + 1,
+        )
+    next_cursor = None
+    if len(items) > query.limit:
+        last = items[query.limit - 1]
+        next_cursor = encode_cursor(last.created_date.isoformat(), last.id)
+    return items[:query.limit], next_cursor
+
+
+@router.get("/", response_model=DesignItemsPage)
+def read_design_items(
+    session: SessionDep,
+    company_id: uuid.UUID,
+    current_employee: CurrentEmployee,
+    query: Annotated[DesignItemsQuery, Query()],
+) -> Any:
+    """
+    Retrieve Company design items, newest first.
+    """
+    items, next_cursor = list_design_items_page(session, company_id, query)
+    return DesignItemsPage(data=items, next_cursor=next_cursor)
+
+
+@router.get("/sprite", response_model=DesignItemsSpritePage)
+def read_design_items_sprite(
+    request: Request,
+    session: SessionDep,
+    company_id: uuid.UUID,
+    current_employee: CurrentEmployee,
+    query: Annotated[DesignItemsQuery, Query()],
+) -> Any:
+    """
+    Retrieve a page of Company design items like the listing, with their
+    thumbnails packed into one image at sprite_url.
+
+    Each item's sprite cell is where its thumbnail is in that image. The
+    image is cached by the thumbnails it holds, so the same page is only
+    composed once.
+    """
+    items, next_cursor = list_design_items_page(session, company_id, query)
+    sprite = thumbnails.page_sprite(session=session, company_id=company_id, items=items)
+    page = DesignItemsSpritePage(
+        data=[DesignItemInSprite.model_validate(item, update={
+            "sprite": sprite.cells.get(item.thumbnail_hash or "") if sprite else None}) for item in items],
+        next_cursor=next_cursor,
+        sprite_url=request.app.url_path_for(
+            "read_design_item_sprite", company_id=str(company_id), sprite_hash=sprite.hash) if sprite else None,
+    )
+    # Thumbnails made for this page
+    session.commit()
+    return page
+
+
+@router.get("/sprite/{sprite_hash}")
+def read_design_item_sprite(
+    company_id: uuid.UUID,
+    sprite_hash: Annotated[str, Path(pattern="^[0-9a-f]{64}$")],
+    current_employee: CurrentEmployee,
+) -> Any:
+    """
+    Sprite image of a page from read_design_items_sprite.
+
+    Its URL changes with its content, so clients may cache it for good.
+    """
+    path = thumbnails.sprite_path(company_id, sprite_hash)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Sprite not found")
+    return FileResponse(
+        path, media_type="image/webp", headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
+
+@router.get("/facets", response_model=TagFacetsPublic)
+def read_design_item_facets(
+    session: SessionDep,
+    company_id: uuid.UUID,
+    current_employee: CurrentEmployee,
+    query: Annotated[DesignItemFacetsQuery, Query()],
+) -> Any:
+    """
+    Count design items per tag within the filter, most used tags first.
+
+    With approximate=true, filters matching more than FACETS_SAMPLE_ITEMS
+    items get counts estimated from a table sample instead of a full scan.
+    Smaller result sets are always counted exactly.
+    """
+    sample_percent = None
+    if query.approximate:
+        usage = crud.get_company_usage(session=session, company_id=company_id)
+        if usage.items > settings.FACETS_SAMPLE_ITEMS and crud.count_design_items(
+                session=session, company_id=company_id, item_filter=query,
+                limit=settings.FACETS_SAMPLE_ITEMS + 1) > settings.FACETS_SAMPLE_ITEMS:
+            sample_percent = 100 * settings.FACETS_SAMPLE_ITEMS / usage.items
+    facets = crud.count_design_item_tags(
+        session=session,
+        company_id=company_id,
+        item_filter=query,
+        limit=query.limit,
+        sample_percent=sample_percent,
+    )
+    return TagFacetsPublic(data=facets, approximate=sample_percent is not None)
+
+
+@router.post("/export")
+def export_design_items(
+    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, export_in: DesignItemExport
+) -> Any:
+    """
+    Download selected design items as one ZIP archive.
+
+    The archive is built while the response is sent, files are read from
+    storage chunk by chunk as the client consumes them.
+    """
+    if not export_in.ids and not export_in.tag_ids:
+        raise HTTPException(
+            status_code=400, detail="Select design items by ids or tags")
+
+    selection = []
+    if export_in.ids:
+        selection.append(DesignItem.id.in_(export_in.ids))
+    if export_in.tag_ids:
+        selection.append(exists().where(
+            TagItemLink.design_item_id == DesignItem.id,
+            TagItemLink.tag_id.in_(export_in.tag_ids)))
+
+    items = session.exec(
+        select(DesignItem.id, DesignItem.file_path, DesignItem.file_size, DesignItem.file_codec,
+               DesignItem.created_date)
+        .where(DesignItem.company_id == company_id, or_(*selection))
+        .order_by(DesignItem.created_date, DesignItem.id)
+        .limit(settings.EXPORT_MAX_ITEMS + 1)
+    ).all()
+    if len(items) > settings.EXPORT_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"Can't export more than {settings.EXPORT_MAX_ITEMS} design items at once")
+
+    storage = get_storage()
+    names: set[str] = set()
+
+    def entries() -> Iterator[ZipEntry]:
+        for item in items:
+            name = PurePosixPath(item.file_path).name
+            if name in names:
+                name = f"{item.id}/{name}"
+            names.add(name)
+            yield ZipEntry(
+                name=name,
+                size=item.file_size,
+                mtime=datetime.combine(item.created_date, time()).timestamp(),
+                open=partial(storage.iter_content, item.file_path, item.file_codec),
+            )
+
+    return StreamingResponse(
+        stream_zip(entries()),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="designs.zip"'},
+    )
+
+
+@router.post("/tags", response_model=DesignItemTagsResult)
+def update_design_items_tags(
+    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, tags_in: DesignItemTagsUpdate
+) -> Any:
+    """
+    Attach tags to and detach tags from many design items at once.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+    if len(tags_in.ids) > settings.TAG_LINK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"Can't retag more than {settings.TAG_LINK_MAX_ITEMS} design items at once")
+    if set(tags_in.add) & set(tags_in.remove):
+        raise HTTPException(
+            status_code=400, detail="Can't both add and remove a tag")
+
+    return crud.update_design_item_tags(
+        session=session, company_id=company_id, item_ids=list(dict.fromkeys(tags_in.ids)),
+        add=tags_in.add, remove=tags_in.remove)
+
+
+@router.get("/{item_id}", response_model=DesignItemPublic)
+def read_design_item(
+    session: SessionDep, company_id: uuid.UUID, item_id: uuid.UUID, current_employee: CurrentEmployee
+) -> Any:
+    """
+    Get design item by ID.
+    """
+    return get_company_item(session, company_id, item_id)
+
+
+@router.get("/{item_id}/similar", response_model=SimilarDesignItemsPublic)
+def read_similar_design_items(
+    session: SessionDep,
+    company_id: uuid.UUID,
+    item_id: uuid.UUID,
+    current_employee: CurrentEmployee,
+    max_distance: Annotated[int, Query(ge=0, le=32)] = settings.SIMILARITY_MAX_DISTANCE,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> Any:
+    """
+    Design items whose preview differs in at most max_distance of the 64
+    perceptual hash bits, closest first. Empty for items without an image
+    preview.
+    """
+    item = get_company_item(session, company_id, item_id)
+    if item.perceptual_hash is None:
+        return SimilarDesignItemsPublic(data=[])
+    data = similarity.find_similar(
+        session=session,
+        company_id=company_id,
+        perceptual_hash=item.perceptual_hash,
+        max_distance=max_distance,
+        limit=limit,
+        exclude=item.id,
+    )
+    return SimilarDesignItemsPublic(data=data)
+
+
+@router.get("/{item_id}/related", response_model=RelatedDesignItemsPublic)
+def read_related_design_items(
+    session: SessionDep,
+    company_id: uuid.UUID,
+    item_id: uuid.UUID,
+    current_employee: CurrentEmployee,
+    limit: Annotated[int, Query(ge=1, le=100)] = settings.RELATED_ITEMS_TOP_K,
+) -> Any:
+    """
+    Design items with the most similar tags, closest first, as of the last
+    run of the related items job. At most RELATED_ITEMS_TOP_K are kept,
+    items sharing only tags on more than RELATED_ITEMS_MAX_TAG_ITEMS items
+    aren't among them.
+    """
+    item = get_company_item(session, company_id, item_id)
+    return RelatedDesignItemsPublic(
+        data=related_items.find_related(session=session, design_item_id=item.id, limit=limit))
+
+
+def accepts_encoding(accept_encoding: str | None, encoding: str) -> bool:
+    for entry in (accept_encoding or "").split(","):
+        name, _, params = entry.partition(";")
+        if name.strip().lower() == encoding:
+            return not re.fullmatch(r"\s*q=0(\.0*)?\s*", params)
+    return False
+
+
+@router.get("/{item_id}/file")
+def read_design_item_file(
+    request: Request, session: SessionDep, company_id: uuid.UUID, item_id: uuid.UUID, current_employee: CurrentEmployee
+) -> Any:
+    """
+    Download the design file.
+
+    With an object store the client is redirected to a presigned URL and
+    the bytes never pass through the API. Files stored compressed go out
+    as they are to clients accepting their encoding, the others get them
+    decompressed on the fly.
+    """
+    item = get_company_item(session, company_id, item_id)
+    storage = get_storage()
+    filename = PurePosixPath(item.file_path).name
+    encoded = item.file_codec is not None and accepts_encoding(request.headers.get("accept-encoding"), item.file_codec)
+
+    if not item.file_codec or encoded:
+        url = storage.presigned_get_url(
+            item.file_path, settings.STORAGE_PRESIGN_EXPIRE_SECONDS, filename, item.file_codec)
+        if url:
+            return RedirectResponse(url, status_code=307)
+
+    stored = storage.stat(item.file_path)
+    if not stored:
+        raise HTTPException(status_code=404, detail="File not found")
+    headers = {"Content-Disposition": content_disposition(filename)}
+    if not item.file_codec or encoded:
+        chunks = storage.iter_chunks(item.file_path)
+        headers["Content-Length"] = str(stored.size)
+    else:
+        chunks = storage.iter_content(item.file_path, item.file_codec)
+        headers["Content-Length"] = str(item.file_size)
+    if item.file_codec:
+        headers["Vary"] = "Accept-Encoding"
+        if encoded:
+            headers["Content-Encoding"] = item.file_codec
+    return StreamingResponse(chunks, media_type="application/octet-stream", headers=headers)
+
+
+@router.get("/{item_id}/versions", response_model=DesignItemVersionsPublic)
+def read_design_item_versions(
+    session: SessionDep, company_id: uuid.UUID, item_id: uuid.UUID, current_employee: CurrentEmployee
+) -> Any:
+    """
+    Version history of a design item, newest first. The newest is the
+    item's current file.
+    """
+    get_company_item(session, company_id, item_id)
+    return DesignItemVersionsPublic(data=[
+        DesignItemVersionPublic.model_validate(version, update={"is_delta": version.base_number is not None})
+        for version in crud.list_design_item_versions(session=session, design_item_id=item_id)
+    ])
+
+
+@router.get("/{item_id}/versions/{number}/file")
+def read_design_item_version_file(
+    session: SessionDep,
+    company_id: uuid.UUID,
+    item_id: uuid.UUID,
+    number: Annotated[int, Path(ge=1)],
+    current_employee: CurrentEmployee,
+) -> Any:
+    """
+    Download a version of the design file.
+
+    Versions stored as patches are rebuilt from the last whole version
+    before them while the response is sent.
+    """
+    item = get_company_item(session, company_id, item_id)
+    chain = versions.version_chain(session, item_id, number)
+    if not chain or chain[-1].number != number:
+        raise HTTPException(status_code=404, detail="Version not found")
+    version = chain[-1]
+    if versions.latest_version(session, item_id).number == number:
+        chunks = get_storage().iter_content(item.file_path, item.file_codec)
+    else:
+        chunks = versions.iter_version_content(chain)
+    return StreamingResponse(chunks, media_type="application/octet-stream", headers={
+        "Content-Disposition": content_disposition(version.filename),
+        "Content-Length": str(version.file_size),
+    })
+
+
+@router.delete("/{item_id}")
+def delete_design_item(
+    session: SessionDep, company_id: uuid.UUID, item_id: uuid.UUID, current_employee: CurrentEmployee
+) -> Message:
+    """
+    Delete a design item and its files.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+
+    item = get_company_item(session, company_id, item_id)
+    keys = {item.file_path, item.preview_path}
+    keys.update(version.file_path for version in crud.list_design_item_versions(session=session, design_item_id=item.id))
+    crud.delete_design_item(session=session, db_item=item)
+    # Files go after the commit, a failure here leaves orphans for the GC
+    storage = get_storage()
+    for key in keys:
+        storage.delete(key)
+    return Message(message="Design item deleted successfully")
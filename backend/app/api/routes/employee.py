@@ -1,43 +1,41 @@
 import uuid
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from fastapi import APIRouter, HTTPException, Query
+from sqlmodel import select
 
+from app import crud
+from app.api.cursors import decode_cursor, encode_cursor
 from app.api.deps import SessionDep, CurrentEmployee
-from app.models import User, EmployeePublic, EmployeesPublic, UserCompanyLink, UserCompanyLinkCreate, Message, CompanyRole
+from app.core.config import settings
+from app.models import (EmployeesPublic, EmployeesQuery, EmployeesBulkPublic, EmployeesBulkUpdate, UserCompanyLink,
+                        UserCompanyLinkCreate, Message, CompanyRole)
 
 router = APIRouter(prefix="/{company_id}/employee", tags=["employee"])
 
 
+def list_employees_page(session: SessionDep, company_id: uuid.UUID, query: EmployeesQuery) -> EmployeesPublic:
+    after = decode_cursor(query.cursor, str) if query.cursor else None
+    employees = crud.list_employees(
+        session=session, company_id=company_id, email=query.email, name=query.name,
+        role=CompanyRole[query.role] if query.role else None, after=after, limit=query.limit + 1)
+    next_cursor = None
+    if len(employees) > query.limit:
+        last, key = employees[query.limit - 1]
+        next_cursor = encode_cursor(key, last.id)
+    return EmployeesPublic(data=[employee for employee, _ in employees[:query.limit]], next_cursor=next_cursor)
+
+
 @router.get("/", response_model=EmployeesPublic)
 def read_employees(
-    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, skip: int = 0, limit: int = 100
+    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee,
+    query: Annotated[EmployeesQuery, Query()],
 ) -> Any:
     """
-    Retrieve Company employees.
+    Retrieve Company employees by email, filtered by email prefix, part of
+    the full name and role.
     """
-
-    count_statement = (
-        select(func.count())
-        .select_from(UserCompanyLink)
-        .where(UserCompanyLink.company_id == company_id)
-    )
-    count = session.exec(count_statement).one()
-
-    results = session.exec(
-        select(User.id,
-               User.email,
-               User.full_name,
-               UserCompanyLink.role.label("role"))
-        .join(UserCompanyLink)
-        .where(UserCompanyLink.company_id == company_id).offset(skip)
-        .limit(limit)
-    ).all()
-
-    employees = [EmployeePublic(**row._mapping) for row in results]
-
-    return EmployeesPublic(data=employees, count=count)
+    return list_employees_page(session, company_id, query)
 
 
 @router.post("/", response_model=UserCompanyLink)
@@ -62,6 +60,27 @@ def add_employee(
     return employee
 
 
+@router.post("/bulk", response_model=EmployeesBulkPublic)
+def add_employees(
+    *, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, employees_in: EmployeesBulkUpdate
+) -> Any:
+    """
+    Add many employees or change their role at once, by user id or email.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+    if len(employees_in.data) > settings.EMPLOYEE_BULK_MAX_ENTRIES:
+        raise HTTPException(
+            status_code=400, detail=f"Can't add more than {settings.EMPLOYEE_BULK_MAX_ENTRIES} employees at once")
+
+    results = crud.upsert_employees(
+        session=session, company_id=company_id, employees_in=employees_in.data, max_role=current_employee.role)
+    counts = {status: sum(result.status == status for result in results)
+              for status in ("added", "updated", "unchanged", "skipped")}
+    return EmployeesBulkPublic(data=results, **counts)
+
+
 @router.put("/", response_model=UserCompanyLink)
 def update_employee(
     *, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, employee_in: UserCompanyLinkCreate
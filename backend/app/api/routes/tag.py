@@ -1,17 +1,62 @@
 import uuid
+from collections.abc import Iterator
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select, exists, delete
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, func, select, exists
 from sqlalchemy.orm import noload
 from sqlalchemy.exc import IntegrityError
 
+from app import crud, similarity, tag_completion, tag_cooccurrence, tag_index
 from app.api.deps import SessionDep, CurrentEmployee
-from app.models import TagPublic, TagCreate, Tag, TagUpdate, Message, CompanyRole
+from app.core.config import settings
+from app.core.db import engine
+from app.models import (
+    TagPublic, TagCreate, Tag, TagUpdate, Message, CompanyRole, TagCompletionsPublic, TagsBulkCreate, TagsBulkPublic,
+    TagMerge, TagSuggestionsPublic
+)
 
 router = APIRouter(prefix="/{company_id}/tag", tags=["tag"])
 
 
+def _tags_changed(company_id: uuid.UUID, revision: int | None) -> None:
+    # Tag rows aren't part of the item indexes, they only follow the revision
+    tag_index.links_changed(company_id, revision)
+    similarity.revision_changed(company_id, revision)
+
+
+@router.get("/complete", response_model=TagCompletionsPublic)
+def complete_tags(
+    session: SessionDep,
+    company_id: uuid.UUID,
+    current_employee: CurrentEmployee,
+    prefix: str = Query(default="", max_length=31),
+    limit: int = Query(default=10, ge=1, le=50),
+) -> Any:
+    """
+    Most used tags whose title starts with prefix, ignoring case.
+    """
+    return TagCompletionsPublic(data=tag_completion.complete(
+        session=session, company_id=company_id, prefix=prefix, limit=limit))
+
+
+@router.get("/suggest", response_model=TagSuggestionsPublic)
+def suggest_tags(
+    session: SessionDep,
+    company_id: uuid.UUID,
+    current_employee: CurrentEmployee,
+    tag_ids: list[uuid.UUID] = Query(min_length=1, max_length=100),
+    limit: int = Query(default=10, ge=1, le=50),
+) -> Any:
+    """
+    Tags most often used together with tag_ids, e.g. the ones already on
+    the design item being tagged.
+    """
+    return TagSuggestionsPublic(data=tag_cooccurrence.suggest(
+        session=session, company_id=company_id, tag_ids=tag_ids, limit=limit))
+
+
 @router.post("/", response_model=TagPublic)
 def create_tag(
     *, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, tag_in: TagCreate
@@ -28,20 +73,43 @@ def create_tag(
 
     try:
         session.add(tag)
+        revision = crud.update_company_usage(session=session, company_id=company_id)
         session.commit()
     except IntegrityError:
         session.rollback()
         raise HTTPException(
             409, f"Tag with title\"{tag.title}\" already exists")
+    _tags_changed(company_id, revision)
+    tag_completion.tags_saved(company_id, revision, {tag.id: tag.title})
     return tag
 
 
+@router.post("/bulk", response_model=TagsBulkPublic)
+def create_tags(
+    *, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, tags_in: TagsBulkCreate
+) -> Any:
+    """
+    Create many tags at once, existing titles are updated or skipped.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+    if len(tags_in.data) > settings.TAG_BULK_MAX_TAGS:
+        raise HTTPException(
+            status_code=400, detail=f"Can't create more than {settings.TAG_BULK_MAX_TAGS} tags at once")
+
+    results = crud.upsert_tags(
+        session=session, company_id=company_id, tags_in=tags_in.data, on_conflict=tags_in.on_conflict)
+    counts = {status: sum(result.status == status for result in results) for status in ("created", "updated", "skipped")}
+    return TagsBulkPublic(data=results, **counts)
+
+
 @router.put("/{tag_id}", response_model=TagPublic)
 def update_tag(
     *, session: SessionDep, company_id: uuid.UUID, tag_id: uuid.UUID, current_employee: CurrentEmployee, tag_in: TagUpdate
 ) -> Any:
     """
-    Create/Update tag.
+    Update a tag.
     """
     if not current_employee.role or current_employee.role == CompanyRole.reader:
         raise HTTPException(
@@ -49,7 +117,7 @@ def update_tag(
 
     tag = session.exec(
         select(Tag)
-        .where(Tag.id == tag_id)
+        .where(Tag.id == tag_id, Tag.company_id == company_id)
         .options(
             noload(Tag.company),
             noload(Tag.design_items)
@@ -57,14 +125,15 @@ def update_tag(
     ).first()
 
     if not tag:
-        tag = Tag.model_validate(
-            tag_in, update={"company_id": company_id})
+        raise HTTPException(
+            status_code=404, detail="Didn't find this tag")
 
     update_dict = tag_in.model_dump(exclude_unset=True)
     tag.sqlmodel_update(update_dict)
 
     try:
         session.add(tag)
+        revision = crud.update_company_usage(session=session, company_id=tag.company_id)
         session.commit()
     except IntegrityError:
         session.rollback()
@@ -72,6 +141,8 @@ def update_tag(
             409, f"Tag with title \"{tag_in.title}\" already exists")
 
     session.refresh(tag)
+    _tags_changed(tag.company_id, revision)
+    tag_completion.tags_saved(tag.company_id, revision, {tag.id: tag.title})
     return tag
 
 
@@ -95,6 +166,41 @@ def delete_tag(
         raise HTTPException(
             status_code=404, detail="Didn't find this tag")
 
-    session.exec(delete(Tag).where(Tag.id == tag_id))
-    session.commit()
+    crud.delete_tag(session=session, company_id=company_id, tag_id=tag_id)
     return Message(message="Tag deleted successfully")
+
+
+def ndjson_merge(company_id: uuid.UUID, target_id: uuid.UUID, source_ids: list[uuid.UUID]) -> Iterator[bytes]:
+    with Session(engine) as session:
+        for progress in crud.merge_tags(
+                session=session, company_id=company_id, target_id=target_id, source_ids=source_ids):
+            yield f"{progress.model_dump_json()}\n".encode()
+
+
+@router.post("/{tag_id}/merge")
+def merge_tags(
+    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, tag_id: uuid.UUID, merge_in: TagMerge
+) -> Any:
+    """
+    Merge tags into this one: their design items get this tag and they are
+    deleted.
+
+    Progress is sent as newline delimited JSON after every batch of links,
+    the last line has done set. A merge that is cut short can be repeated.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+    source_ids = list(dict.fromkeys(merge_in.source_ids))
+    if tag_id in source_ids:
+        raise HTTPException(
+            status_code=400, detail="Can't merge a tag into itself")
+
+    found = session.exec(
+        select(func.count()).where(Tag.id.in_(source_ids + [tag_id]), Tag.company_id == company_id)
+    ).one()
+    if found != len(source_ids) + 1:
+        raise HTTPException(
+            status_code=404, detail="Didn't find these tags")
+
+    return StreamingResponse(ndjson_merge(company_id, tag_id, source_ids), media_type="application/x-ndjson")
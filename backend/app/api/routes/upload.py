@@ -0,0 +1,379 @@
+import uuid
+from pathlib import Path
+from typing import Any
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from app import crud, similarity, thumbnails, uploads, versions
+from app.api.deps import SessionDep, CurrentEmployee
+from app.core.config import settings
+from app.image_info import open_preview, read_stored_image_info
+from app.models import (CompanyRole,
+                        DesignItem,
+                        DesignItemUploaded,
+                        DirectUploadComplete,
+                        DirectUploadCreate,
+                        DirectUploadPublic,
+                        Message,
+                        UploadSessionCreate,
+                        UploadSessionPublic,
+                        VersionUploadCreate)
+from app.storage import get_storage
+from app.utils import generate_upload_token, verify_upload_token
+
+router = APIRouter(prefix="/{company_id}/upload", tags=["upload"])
+
+
+def get_upload_session(company_id: uuid.UUID, upload_id: uuid.UUID, current_employee: CurrentEmployee) -> uploads.UploadSession:
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+
+    upload = uploads.get_session(upload_id)
+    if not upload or upload.company_id != str(company_id) or upload.creator_id != str(current_employee.id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+def inspect_preview(key: str, size: int, codec: str | None = None) -> dict[str, Any]:
+    """
+    Perceptual hash, thumbnail and image info of a new item, the preview is
+    decoded once for both the hash and the thumbnail.
+    """
+    preview = open_preview(key, size, codec)
+    return {
+        "perceptual_hash": similarity.dhash(preview) if preview else None,
+        "thumbnail_hash": thumbnails.store_thumbnail(preview) if preview else thumbnails.NO_THUMBNAIL,
+        "image_info": read_stored_image_info(key, codec),
+    }
+
+
+def with_near_duplicates(session: SessionDep, item: DesignItem) -> DesignItemUploaded:
+    near_duplicates = []
+    if item.perceptual_hash is not None:
+        near_duplicates = similarity.find_similar(
+            session=session,
+            company_id=item.company_id,
+            perceptual_hash=item.perceptual_hash,
+            max_distance=settings.SIMILARITY_MAX_DISTANCE,
+            exclude=item.id,
+        )
+    return DesignItemUploaded.model_validate(item, update={"near_duplicates": near_duplicates})
+
+
+def upload_public(upload: uploads.UploadSession) -> UploadSessionPublic:
+    bitmap = uploads.read_bitmap(upload)
+    return UploadSessionPublic(
+        id=upload.id,
+        filename=upload.filename,
+        size=upload.size,
+        chunk_size=upload.chunk_size,
+        chunk_count=upload.chunk_count,
+        received=uploads.received_ranges(upload, bitmap),
+        complete=uploads.is_complete(upload, bitmap),
+    )
+
+
+@router.post("/", response_model=UploadSessionPublic)
+def create_upload(
+    *, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, upload_in: UploadSessionCreate
+) -> Any:
+    """
+    Open a resumable upload session.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+    try:
+        crud.check_company_quota(
+            session=session, company_id=company_id, size=upload_in.size)
+    except crud.QuotaExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        upload = uploads.create_session(
+            company_id=company_id,
+            creator_id=current_employee.id,
+            filename=upload_in.filename,
+            title=upload_in.title,
+            description=upload_in.description,
+            size=upload_in.size,
+            chunk_size=upload_in.chunk_size,
+        )
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return upload_public(upload)
+
+
+@router.post("/version", response_model=UploadSessionPublic)
+def create_version_upload(
+    *, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, upload_in: VersionUploadCreate
+) -> Any:
+    """
+    Open a resumable upload session for a new version of a design item.
+
+    Completing it replaces the item's file, the one before stays
+    available in the item's version history.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+    item = session.get(DesignItem, upload_in.design_item_id)
+    if not item or item.company_id != company_id:
+        raise HTTPException(status_code=404, detail="Design item not found")
+    try:
+        crud.check_company_quota(
+            session=session, company_id=company_id, size=upload_in.size, items=0)
+    except crud.QuotaExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        upload = uploads.create_session(
+            company_id=company_id,
+            creator_id=current_employee.id,
+            filename=upload_in.filename,
+            title=item.title,
+            description=item.description,
+            size=upload_in.size,
+            chunk_size=upload_in.chunk_size,
+            design_item_id=item.id,
+        )
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return upload_public(upload)
+
+
+@router.post("/direct", response_model=DirectUploadPublic)
+def create_direct_upload(
+    *, session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, upload_in: DirectUploadCreate
+) -> Any:
+    """
+    Get a presigned URL to upload a file straight to the object store.
+    """
+    if not current_employee.role or current_employee.role == CompanyRole.reader:
+        raise HTTPException(
+            status_code=400, detail="Not enough permissions")
+    if upload_in.size > settings.UPLOAD_MAX_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"File is larger than {settings.UPLOAD_MAX_SIZE} bytes")
+    try:
+        crud.check_company_quota(
+            session=session, company_id=company_id, size=upload_in.size)
+    except crud.QuotaExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    filename = Path(upload_in.filename).name
+    if filename in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+
+    item_id = uuid.uuid4()
+    key = f"{company_id}/{item_id}/{filename}"
+    expires_in = settings.STORAGE_PRESIGN_EXPIRE_SECONDS
+    url = get_storage().presigned_put_url(key, expires_in)
+    if not url:
+        raise HTTPException(
+            status_code=400, detail="Storage backend doesn't support direct uploads, use chunked upload")
+
+    token = generate_upload_token({
+        "sub": key,
+        "item_id": str(item_id),
+        "company_id": str(company_id),
+        "creator_id": str(current_employee.id),
+        "title": upload_in.title,
+        "description": upload_in.description,
+        "size": upload_in.size,
+    }, expires_in)
+    return DirectUploadPublic(url=url, key=key, token=token, expires_in=expires_in)
+
+
+@router.post("/direct/complete", response_model=DesignItemUploaded)
+def complete_direct_upload(
+    session: SessionDep, company_id: uuid.UUID, current_employee: CurrentEmployee, upload_in: DirectUploadComplete
+) -> Any:
+    """
+    Record a design item for a file uploaded with a presigned URL.
+
+    Stored items that look the same are listed in near_duplicates.
+    """
+    data = verify_upload_token(upload_in.token)
+    if not data or data["company_id"] != str(company_id) or data["creator_id"] != str(current_employee.id):
+        raise HTTPException(status_code=400, detail="Invalid upload token")
+
+    stored = get_storage().stat(data["sub"])
+    if not stored:
+        raise HTTPException(status_code=400, detail="File was not uploaded")
+    if stored.size != data["size"]:
+        get_storage().delete(data["sub"])
+        raise HTTPException(
+            status_code=400, detail="Uploaded file size doesn't match")
+
+    if session.get(DesignItem, uuid.UUID(data["item_id"])):
+        raise HTTPException(status_code=409, detail="Upload already completed")
+
+    try:
+        item = crud.create_design_item(
+            session=session,
+            company_id=company_id,
+            creator_id=current_employee.id,
+            item_id=uuid.UUID(data["item_id"]),
+            title=data["title"],
+            description=data["description"],
+            file_path=data["sub"],
+            file_size=stored.size,
+            **inspect_preview(data["sub"], stored.size),
+        )
+    except crud.QuotaExceeded as e:
+        get_storage().delete(data["sub"])
+        raise HTTPException(status_code=413, detail=str(e))
+    return with_near_duplicates(session, item)
+
+
+@router.get("/{upload_id}", response_model=UploadSessionPublic)
+def read_upload(company_id: uuid.UUID, upload_id: uuid.UUID, current_employee: CurrentEmployee) -> Any:
+    """
+    Get upload state with the byte ranges received so far.
+    """
+    upload = get_upload_session(company_id, upload_id, current_employee)
+    return upload_public(upload)
+
+
+@router.put("/{upload_id}", response_model=UploadSessionPublic)
+async def upload_chunk(
+    request: Request, company_id: uuid.UUID, upload_id: uuid.UUID, offset: int, current_employee: CurrentEmployee
+) -> Any:
+    """
+    Upload one chunk, the request body is written at the given offset.
+    """
+    # Reads the session file, off the event loop like the write
+    upload = await run_in_threadpool(get_upload_session, company_id, upload_id, current_employee)
+
+    too_large = HTTPException(status_code=413, detail=f"Chunk is larger than {upload.chunk_size} bytes")
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > upload.chunk_size:
+        raise too_large
+
+    # Without a Content-Length, as with chunked transfer encoding, stop
+    # reading as soon as the body is too large
+    body = bytearray()
+    async for part in request.stream():
+        body += part
+        if len(body) > upload.chunk_size:
+            raise too_large
+    try:
+        await run_in_threadpool(uploads.write_chunk, upload, offset, body)
+    except uploads.UploadFinalizing as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_threadpool(upload_public, upload)
+
+
+@router.post("/{upload_id}/complete", response_model=DesignItemUploaded)
+def complete_upload(
+    session: SessionDep, company_id: uuid.UUID, upload_id: uuid.UUID, current_employee: CurrentEmployee
+) -> Any:
+    """
+    Finalize the upload into a design item, or into a new version of one.
+
+    Stored items that look the same are listed in near_duplicates. A
+    second request while the first is finalizing gets 409.
+    """
+    upload = get_upload_session(company_id, upload_id, current_employee)
+    try:
+        uploads.claim(upload)
+    except uploads.UploadFinalizing as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        crud.check_company_quota(
+            session=session, company_id=company_id, size=upload.size, items=0 if upload.design_item_id else 1)
+    except crud.QuotaExceeded as e:
+        uploads.release(upload)
+        raise HTTPException(status_code=413, detail=str(e))
+    if upload.design_item_id:
+        return complete_version_upload(session, company_id, upload, current_employee.id)
+
+    item_id = uuid.uuid4()
+    file_path = f"{company_id}/{item_id}/{upload.filename}"
+    file_codec = uploads.finalize(upload, file_path)
+    try:
+        item = crud.create_design_item(
+            session=session,
+            company_id=company_id,
+            creator_id=current_employee.id,
+            item_id=item_id,
+            title=upload.title,
+            description=upload.description,
+            file_path=file_path,
+            file_size=upload.size,
+            file_codec=file_codec,
+            **inspect_preview(file_path, upload.size, file_codec),
+        )
+    except crud.QuotaExceeded as e:
+        get_storage().delete(file_path)
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        get_storage().delete(file_path)
+        raise
+    return with_near_duplicates(session, item)
+
+
+def complete_version_upload(
+    session: SessionDep, company_id: uuid.UUID, upload: uploads.UploadSession, creator_id: uuid.UUID
+) -> DesignItemUploaded:
+    item = session.get(DesignItem, uuid.UUID(upload.design_item_id))
+    if not item or item.company_id != company_id:
+        uploads.delete_session(upload.id)
+        raise HTTPException(status_code=404, detail="Design item not found")
+
+    file_path = f"{company_id}/{uuid.uuid4()}/{upload.filename}"
+    file_codec = uploads.finalize(upload, file_path)
+    keys = {file_path}
+    try:
+        version, previous = versions.store_version(
+            session=session,
+            item=item,
+            creator_id=creator_id,
+            filename=upload.filename,
+            file_path=file_path,
+            file_size=upload.size,
+            file_codec=file_codec,
+        )
+        keys.add(version.file_path)
+        replaced = item.file_path
+        item = crud.add_design_item_version(
+            session=session,
+            db_item=item,
+            version=version,
+            previous=previous,
+            file_path=file_path,
+            file_codec=file_codec,
+            **inspect_preview(file_path, upload.size, file_codec),
+        )
+    except crud.QuotaExceeded as e:
+        session.rollback()
+        for key in keys:
+            get_storage().delete(key)
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        session.rollback()
+        for key in keys:
+            get_storage().delete(key)
+        raise
+    # The replaced file was only kept whole as the current one, its version
+    # is a patch
+    if previous.base_number is not None:
+        get_storage().delete(replaced)
+    return with_near_duplicates(session, item)
+
+
+@router.delete("/{upload_id}")
+def delete_upload(company_id: uuid.UUID, upload_id: uuid.UUID, current_employee: CurrentEmployee) -> Message:
+    """
+    Abort an upload session.
+    """
+    upload = get_upload_session(company_id, upload_id, current_employee)
+    uploads.delete_session(upload.id)
+    return Message(message="Upload deleted successfully")
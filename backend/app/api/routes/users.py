@@ -1,10 +1,11 @@
 import uuid
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import col, delete, func, select
 
 from app import crud
+from app.api.cursors import decode_cursor, encode_cursor
 from app.api.deps import (
     CurrentUser,
     SessionDep,
@@ -17,6 +18,8 @@ from app.models import (
     Message,
     UpdatePassword,
     User,
+    UserCompaniesPublic,
+    UserCompaniesQuery,
     UserCreate,
     UserPublic,
     UserRegister,
@@ -125,6 +128,24 @@ def read_user_me(current_user: CurrentUser) -> Any:
     return current_user
 
 
+@router.get("/me/companies", response_model=UserCompaniesPublic)
+def read_user_me_companies(
+    session: SessionDep, current_user: CurrentUser, query: Annotated[UserCompaniesQuery, Query()]
+) -> Any:
+    """
+    Get the companies of the current user with their role and the number
+    of employees, tags and design items of each, for the home screen.
+    """
+    after = decode_cursor(query.cursor, str) if query.cursor else None
+    companies = crud.list_user_companies(
+        session=session, user_id=current_user.id, after=after, limit=query.limit + 1)
+    next_cursor = None
+    if len(companies) > query.limit:
+        last, title = companies[query.limit - 1]
+        next_cursor = encode_cursor(title, last.id)
+    return UserCompaniesPublic(data=[company for company, _ in companies[:query.limit]], next_cursor=next_cursor)
+
+
 @router.delete("/me", response_model=Message)
 def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
     """
@@ -90,6 +90,111 @@ class Settings(BaseSettings):
     def emails_enabled(self) -> bool:
         return bool(self.SMTP_HOST and self.EMAILS_FROM_EMAIL)
 
+    MEDIA_ROOT: str = "media"
+    UPLOAD_CHUNK_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024
+    UPLOAD_MAX_SIZE: int = 20 * 1024 * 1024 * 1024
+    UPLOAD_SESSION_EXPIRE_HOURS: int = 24
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def upload_dir(self) -> str:
+        # Kept inside MEDIA_ROOT so finalized uploads can be moved with a rename
+        return f"{self.MEDIA_ROOT}/.uploads"
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def thumbnail_dir(self) -> str:
+        # Local cache of thumbnails and sprite sheets, rebuilt from the
+        # previews when missing
+        return f"{self.MEDIA_ROOT}/.thumbnails"
+
+    # Default per company quotas, None means unlimited
+    COMPANY_QUOTA_BYTES: int | None = None
+    COMPANY_QUOTA_ITEMS: int | None = None
+
+    EXPORT_MAX_ITEMS: int = 1000
+    # Employees added or updated by one bulk request, in one upsert
+    EMPLOYEE_BULK_MAX_ENTRIES: int = 5_000
+    # Threads running the parts of the company overview in parallel, each
+    # with a connection of a pool of their own. Parts that find them all
+    # busy run in the request
+    COMPANY_OVERVIEW_WORKERS: int = 3
+    # Tags of one bulk create request, sent as a single INSERT
+    TAG_BULK_MAX_TAGS: int = 10_000
+    # Design items of one bulk tag attach/detach request, each transaction
+    # covers up to TAG_LINK_CHUNK_ITEMS of them so row locks stay short
+    TAG_LINK_MAX_ITEMS: int = 10_000
+    TAG_LINK_CHUNK_ITEMS: int = 500
+    # Links re-pointed per transaction when merging tags
+    TAG_MERGE_BATCH_LINKS: int = 1_000
+    # Approximate tag facets kick in above this many matching items and
+    # sample about this many items worth of tag links
+    FACETS_SAMPLE_ITEMS: int = 100_000
+    # In-memory tag bitmap indexes for large companies, 0 turns them off.
+    # The budget is per process and shared by all companies, least recently
+    # used indexes are dropped first
+    TAG_INDEX_MAX_BYTES: int = 0
+    TAG_INDEX_MIN_ITEMS: int = 100_000
+    # Incremental changes applied before the index is rebuilt from scratch
+    TAG_INDEX_MAX_CHANGES: int = 10_000
+    # Previews up to this size get a perceptual hash for near-duplicate checks
+    # and a thumbnail
+    SIMILARITY_HASH_MAX_BYTES: int = 64 * 1024 * 1024
+    # Missing thumbnails a sprite request makes from previews, the rest of
+    # the page has no sprite cell until later requests or
+    # app.jobs.thumbnail_backfill make theirs
+    SPRITE_MAX_NEW_THUMBNAILS: int = 20
+    # Differing hash bits up to which uploads are reported as near-duplicates
+    SIMILARITY_MAX_DISTANCE: int = 6
+    # In-memory hash indexes, smaller companies are searched in SQL
+    SIMILARITY_INDEX_MAX_BYTES: int = 64 * 1024 * 1024
+    SIMILARITY_INDEX_MIN_ITEMS: int = 10_000
+    SIMILARITY_INDEX_MAX_CHANGES: int = 10_000
+    # In-memory tag title indexes for autocomplete, companies get one on
+    # their first lookup and are served from SQL until it is built
+    TAG_COMPLETION_INDEX_MAX_BYTES: int = 64 * 1024 * 1024
+    TAG_COMPLETION_INDEX_MAX_CHANGES: int = 10_000
+    # In-memory tag co-occurrence matrices for tag suggestions. They serve
+    # as of their last build and are rebuilt in the background at most
+    # every TAG_SUGGEST_REFRESH_SECONDS while the company changes
+    TAG_SUGGEST_INDEX_MAX_BYTES: int = 256 * 1024 * 1024
+    TAG_SUGGEST_REFRESH_SECONDS: float = 60
+    # An index behind the database, after a write in another worker process,
+    # is rebuilt from scratch at most this often per company and process.
+    # Meanwhile tag filtered listings go to SQL, autocomplete and
+    # near-duplicate checks keep serving the index as it is
+    INDEX_REBUILD_MIN_SECONDS: float = 10
+    # Related design items stored per item by app.jobs.related_items, most
+    # similar tag sets first. Tags on more items than the cap don't propose
+    # candidates but still count towards the similarity of those found
+    RELATED_ITEMS_TOP_K: int = 10
+    RELATED_ITEMS_MAX_TAG_ITEMS: int = 1_000
+    ORPHAN_GC_GRACE_HOURS: float = 24
+    ORPHAN_GC_MAX_OPS_PER_SECOND: float = 100
+
+    STORAGE_BACKEND: Literal["local", "s3"] = "local"
+    # zstd for files of chunked uploads that compress well, direct uploads
+    # go to the object store as they are
+    STORAGE_COMPRESSION: bool = True
+    STORAGE_COMPRESSION_LEVEL: int = 3
+    STORAGE_PRESIGN_EXPIRE_SECONDS: int = 60 * 60
+    # New versions of a design item are stored as a zstd patch against the
+    # previous one, every VERSION_SNAPSHOT_INTERVAL-th version is kept whole
+    # so rebuilding an old one never applies more patches than that
+    VERSION_SNAPSHOT_INTERVAL: int = 10
+    VERSION_DELTA_LEVEL: int = 9
+    # Versions are held in memory to be diffed and patched, larger ones are
+    # always stored whole
+    VERSION_DELTA_MAX_BYTES: int = 64 * 1024 * 1024
+    S3_BUCKET: str = "designs"
+    S3_ENDPOINT_URL: str | None = None
+    # Endpoint used in presigned URLs when clients reach the store on another host
+    S3_PUBLIC_ENDPOINT_URL: str | None = None
+    S3_ACCESS_KEY: str | None = None
+    S3_SECRET_KEY: str | None = None
+    S3_REGION: str = "us-east-1"
+
     EMAIL_TEST_USER: EmailStr = "test@example.com"
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
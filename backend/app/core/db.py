@@ -5,6 +5,10 @@ from app.core.config import settings
 from app.models import User, UserCreate
 
 engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+# The company overview's parallel queries get their own pool, requests
+# holding every connection of the main one can't leave them waiting
+overview_engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), pool_size=settings.COMPANY_OVERVIEW_WORKERS, max_overflow=0)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -1,9 +1,17 @@
 import uuid
-from typing import Any
+from datetime import date
+from collections.abc import Iterator
+from typing import Any, Literal
 
-from sqlmodel import Session, select, func, exists, outerjoin, and_
+from sqlalchemy import Integer, String, Uuid, any_, bindparam, cast, literal, literal_column, true
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, func, exists, outerjoin, and_, or_, update, delete, tuple_
 
+from app import similarity, tag_completion, tag_index
+from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
+from app.image_info import ImageInfo
 from app.models import (
     Item,
     ItemCreate,
@@ -13,10 +21,33 @@ from app.models import (
     Company,
     CompanyRole,
     UserCompanyLink,
-    CompanyStatus
+    EmployeeBulkEntry,
+    EmployeeBulkResult,
+    EmployeePublic,
+    UserCompanyPublic,
+    CompanyStatus,
+    CompanyUsage,
+    CompanyUsagePublic,
+    DesignItem,
+    DesignItemFilter,
+    DesignItemTagsResult,
+    DesignItemVersion,
+    RelatedDesignItem,
+    RelatedDesignItemStale,
+    Tag,
+    TagBulkResult,
+    TagCreate,
+    TagFacet,
+    TagPublic,
+    TagItemLink,
+    TagMergeProgress
 )
 
 
+class QuotaExceeded(Exception):
+    pass
+
+
 def create_user(*, session: Session, user_create: UserCreate) -> User:
     db_obj = User.model_validate(
         user_create, update={
@@ -83,3 +114,852 @@ def get_user_company_role(*, session: Session, company_id: uuid.UUID, user_id: u
         )
     ).first()
     return user_company_role
+
+
+def list_employees(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    email: str | None = None,
+    name: str | None = None,
+    role: CompanyRole | None = None,
+    after: tuple[str, uuid.UUID] | None = None,
+    limit: int = 100,
+) -> list[tuple[EmployeePublic, str]]:
+    """
+    A company's employees with their role, by lowercased email, keyset
+    paginated on (email, id). Returned with their sort key for the next
+    cursor.
+
+    email matches the start of the email ignoring case, name any part of
+    the full name ignoring case, served by the user indexes whatever the
+    number of employees.
+    """
+    # Byte-wise on lower(email) COLLATE "C", like its index
+    key = func.lower(User.email).collate("C")
+    statement = (
+        select(User.id, User.email, User.full_name, UserCompanyLink.role, key.label("key"))
+        .join(UserCompanyLink, UserCompanyLink.user_id == User.id)
+        .where(UserCompanyLink.company_id == company_id)
+    )
+    if email:
+        prefix = email.lower()
+        statement = statement.where(key >= prefix, key < prefix + tag_completion.MAX_CHAR)
+    if name:
+        escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        statement = statement.where(User.full_name.ilike(f"%{escaped}%", escape="\\"))
+    if role:
+        statement = statement.where(UserCompanyLink.role == role)
+    if after:
+        statement = statement.where(tuple_(key, User.id) > tuple_(*after))
+    rows = session.exec(statement.order_by(key, User.id).limit(limit)).all()
+    # Stored emails are valid, validating them again costs more than the query
+    return [(EmployeePublic.model_construct(id=row.id, email=row.email, full_name=row.full_name, role=row.role),
+             row.key) for row in rows]
+
+
+def upsert_employees(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    employees_in: list[EmployeeBulkEntry],
+    max_role: CompanyRole,
+) -> list[EmployeeBulkResult]:
+    """
+    Add many employees or change their role with one multi-row
+    INSERT ... ON CONFLICT, one result per entry.
+
+    Users given by email are looked up along with those given by id in a
+    single query. Roles above max_role are skipped, and so are employees
+    already holding max_role or above, the ceiling of adding or updating
+    one employee. Repeats of a user within employees_in are skipped too.
+    """
+    user_ids = [entry.user_id for entry in employees_in if entry.user_id]
+    emails = [entry.email for entry in employees_in if entry.email]
+    users = session.exec(
+        select(User.id, User.email)
+        .where(or_(User.id == any_(bindparam("user_ids", user_ids, type_=ARRAY(Uuid))),
+                   User.email == any_(bindparam("emails", emails, type_=ARRAY(String)))))
+    ).all()
+    email_of = dict(users)
+    id_of = {email: user_id for user_id, email in users}
+
+    resolved = [entry.user_id if entry.user_id in email_of else id_of.get(entry.email or "")
+                for entry in employees_in]
+    wanted: dict[uuid.UUID, CompanyRole] = {}
+    for user_id, entry in zip(resolved, employees_in):
+        if user_id and entry.role.value <= max_role.value:
+            wanted.setdefault(user_id, entry.role)
+    saved: dict[uuid.UUID, str] = {}
+    if wanted:
+        # Two array parameters, a VALUES row per entry takes longer to compile than to run
+        rows = func.unnest(
+            bindparam("user_ids", list(wanted), type_=ARRAY(Uuid)),
+            bindparam("roles", [role.name for role in wanted.values()], type_=ARRAY(String)),
+        ).table_valued("user_id", "role").render_derived()
+        statement = insert(UserCompanyLink).from_select(
+            ["company_id", "user_id", "role"],
+            select(literal(company_id), rows.c.user_id,
+                   cast(rows.c.role, UserCompanyLink.__table__.c.role.type)),  # type: ignore[attr-defined]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[UserCompanyLink.company_id, UserCompanyLink.user_id],
+            set_={"role": statement.excluded.role},
+            where=and_(UserCompanyLink.role.in_([role for role in CompanyRole if role.value < max_role.value]),
+                       UserCompanyLink.role != statement.excluded.role),
+        )
+        # xmax is 0 on a freshly inserted row version, set on an updated one
+        saved = {
+            row.user_id: "added" if row.created else "updated"
+            for row in session.exec(statement.returning(
+                UserCompanyLink.user_id, literal_column("usercompanylink.xmax = 0").label("created")))
+        }
+    left_alone = [user_id for user_id in wanted if user_id not in saved]
+    current = dict(session.exec(
+        select(UserCompanyLink.user_id, UserCompanyLink.role)
+        .where(UserCompanyLink.company_id == company_id,
+               UserCompanyLink.user_id == any_(bindparam("left_alone", left_alone, type_=ARRAY(Uuid))))
+    ).all()) if left_alone else {}
+    session.commit()
+
+    results, seen = [], set()
+    for user_id, entry in zip(resolved, employees_in):
+        result = EmployeeBulkResult(user_id=user_id, email=email_of.get(user_id) if user_id else entry.email,
+                                    role=entry.role, status="skipped")
+        if user_id is None:
+            result.detail = "User not found"
+        elif entry.role.value > max_role.value:
+            result.detail = "Role higher than your own"
+        elif user_id in seen:
+            result.detail = "User repeated"
+        elif user_id in saved:
+            result.status = saved[user_id]  # type: ignore[assignment]
+        elif current.get(user_id) == entry.role:
+            result.status = "unchanged"
+        else:
+            result.detail = "Employee with the same or higher role than yours"
+        if user_id and entry.role.value <= max_role.value:
+            seen.add(user_id)
+        results.append(result)
+    return results
+
+
+def _employee_count(company_id: Any, link: Any = UserCompanyLink) -> Any:
+    return select(func.count()).select_from(link).where(link.company_id == company_id).scalar_subquery()
+
+
+def _tag_count(company_id: Any) -> Any:
+    return select(func.count()).select_from(Tag).where(Tag.company_id == company_id).scalar_subquery()
+
+
+def count_company_employees_and_tags(*, session: Session, company_id: uuid.UUID) -> tuple[int, int]:
+    row = session.exec(select(_employee_count(company_id), _tag_count(company_id))).one()
+    return row[0], row[1]
+
+
+def list_user_companies(
+    *, session: Session, user_id: uuid.UUID, after: tuple[str, uuid.UUID] | None = None, limit: int = 100
+) -> list[tuple[UserCompanyPublic, str]]:
+    """
+    The companies a user is an employee of with their role, employee, tag
+    and design item counts, by title, keyset paginated on (title, id), in
+    one statement. Returned with their title for the next cursor.
+
+    Counts are computed only for the companies of the page, design items
+    come from the usage counters.
+    """
+    others = aliased(UserCompanyLink)
+    statement = (
+        select(Company.id, Company.title, Company.description, Company.status, UserCompanyLink.role,
+               _employee_count(Company.id, others).label("employee_count"),
+               _tag_count(Company.id).label("tag_count"),
+               func.coalesce(CompanyUsage.items, 0).label("item_count"))
+        .join(UserCompanyLink, UserCompanyLink.company_id == Company.id)
+        .outerjoin(CompanyUsage, CompanyUsage.company_id == Company.id)
+        .where(UserCompanyLink.user_id == user_id)
+    )
+    if after:
+        statement = statement.where(tuple_(Company.title, Company.id) > tuple_(*after))
+    rows = session.exec(statement.order_by(Company.title, Company.id).limit(limit)).all()
+    return [(UserCompanyPublic(**row._mapping), row.title) for row in rows]
+
+
+def get_company_usage(*, session: Session, company_id: uuid.UUID) -> CompanyUsagePublic:
+    row = session.exec(
+        select(CompanyUsage.bytes,
+               CompanyUsage.items,
+               CompanyUsage.previews,
+               Company.quota_bytes,
+               Company.quota_items)
+        .select_from(Company)
+        .outerjoin(CompanyUsage, CompanyUsage.company_id == Company.id)
+        .where(Company.id == company_id)
+    ).first()
+    if not row:
+        return CompanyUsagePublic()
+    return CompanyUsagePublic(
+        bytes=row.bytes or 0,
+        items=row.items or 0,
+        previews=row.previews or 0,
+        quota_bytes=settings.COMPANY_QUOTA_BYTES if row.quota_bytes is None else row.quota_bytes,
+        quota_items=settings.COMPANY_QUOTA_ITEMS if row.quota_items is None else row.quota_items,
+    )
+
+
+def check_company_quota(*, session: Session, company_id: uuid.UUID, size: int, items: int = 1) -> None:
+    """
+    Early quota check before any bytes are accepted, the authoritative one
+    happens in update_company_usage when the item is recorded. New versions
+    of an item pass items=0.
+    """
+    usage = get_company_usage(session=session, company_id=company_id)
+    if usage.quota_bytes is not None and usage.bytes + size > usage.quota_bytes:
+        raise QuotaExceeded("Company storage quota exceeded")
+    if items and usage.quota_items is not None and usage.items + items > usage.quota_items:
+        raise QuotaExceeded("Company design item quota exceeded")
+
+
+def _within_quota(company_id: uuid.UUID, used: Any, quota_column: Any, default: int | None) -> Any:
+    quota = select(quota_column).where(Company.id == company_id).scalar_subquery()
+    if default is not None:
+        quota = func.coalesce(quota, default)
+    return or_(quota.is_(None), used <= quota)
+
+
+def update_company_usage(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    bytes: int = 0,
+    items: int = 0,
+    previews: int = 0,
+    enforce_quota: bool = False,
+) -> int | None:
+    """
+    Apply a delta to the company counters without committing.
+
+    A single-row update, so quota enforcement stays O(1) and concurrent
+    uploads serialize on the counter row instead of racing a read.
+    Returns the new revision of the company data, call it without deltas
+    when only tag links change.
+    """
+    statement = (
+        update(CompanyUsage)
+        .where(CompanyUsage.company_id == company_id)
+        .values(bytes=CompanyUsage.bytes + bytes,
+                items=CompanyUsage.items + items,
+                previews=CompanyUsage.previews + previews,
+                revision=CompanyUsage.revision + 1)
+        .returning(CompanyUsage.revision)
+    )
+    if enforce_quota:
+        statement = statement.where(
+            _within_quota(company_id, CompanyUsage.bytes + bytes,
+                          Company.quota_bytes, settings.COMPANY_QUOTA_BYTES),
+            _within_quota(company_id, CompanyUsage.items + items,
+                          Company.quota_items, settings.COMPANY_QUOTA_ITEMS),
+        )
+    revision = session.exec(statement).scalar()
+    if revision is None and enforce_quota:
+        raise QuotaExceeded("Company quota exceeded")
+    return revision
+
+
+def update_tag_usage(*, session: Session, counts: dict[uuid.UUID, int]) -> None:
+    """
+    Apply per tag deltas to the usage counts without committing.
+
+    All the tags of a transaction in one UPDATE from two arrays. Call it
+    right after update_company_usage: writers of a company already queue
+    on its counter row, so a hot tag's row is held only until the commit
+    and concurrent writers never lock tags in opposite orders.
+    """
+    counts = {tag_id: delta for tag_id, delta in counts.items() if delta}
+    if not counts:
+        return
+    deltas = func.unnest(
+        bindparam("tag_ids", list(counts), type_=ARRAY(Uuid)),
+        bindparam("deltas", list(counts.values()), type_=ARRAY(Integer)),
+    ).table_valued("tag_id", "delta").render_derived()
+    session.exec(
+        update(Tag)
+        .where(Tag.id == deltas.c.tag_id)
+        .values(usage_count=Tag.usage_count + deltas.c.delta)
+        # Loaded tags are expired by the commit, no need to fetch and sync them
+        .execution_options(synchronize_session=False)
+    )
+
+
+def mark_related_stale(*, session: Session, revision: int | None, item_ids: list[uuid.UUID]) -> None:
+    """
+    Queue design items for app.jobs.related_items without committing.
+
+    One upsert from an array, the revision of a marker only goes up so the
+    job can tell a change made while it ran. Call it after
+    update_company_usage like update_tag_usage, so writers of a company
+    upsert markers one at a time.
+    """
+    if not item_ids:
+        return
+    statement = insert(RelatedDesignItemStale).from_select(
+        ["design_item_id", "revision"],
+        select(func.unnest(bindparam("item_ids", list(set(item_ids)), type_=ARRAY(Uuid))), literal(revision or 0)))
+    session.exec(statement.on_conflict_do_update(
+        index_elements=[RelatedDesignItemStale.design_item_id],
+        set_={"revision": statement.excluded.revision}))
+
+
+def _link_counts(
+    added: list[tuple[uuid.UUID, uuid.UUID, date]],
+    removed: list[tuple[uuid.UUID, uuid.UUID, date]],
+) -> dict[uuid.UUID, int]:
+    counts: dict[uuid.UUID, int] = {}
+    for tag_id, _, _ in added:
+        counts[tag_id] = counts.get(tag_id, 0) + 1
+    for tag_id, _, _ in removed:
+        counts[tag_id] = counts.get(tag_id, 0) - 1
+    return counts
+
+
+def create_design_item(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    creator_id: uuid.UUID,
+    item_id: uuid.UUID,
+    title: str,
+    description: str | None,
+    file_path: str,
+    file_size: int,
+    file_codec: str | None = None,
+    perceptual_hash: int | None = None,
+    image_info: ImageInfo | None = None,
+    thumbnail_hash: str | None = None,
+) -> DesignItem:
+    db_item = DesignItem(
+        id=item_id,
+        company_id=company_id,
+        creator_id=creator_id,
+        title=title,
+        description=description,
+        file_path=file_path,
+        # The source doubles as preview until a dedicated one is generated
+        preview_path=file_path,
+        file_size=file_size,
+        file_codec=file_codec,
+        perceptual_hash=perceptual_hash,
+        **(image_info.columns() if image_info else {}),
+        thumbnail_hash=thumbnail_hash,
+    )
+    try:
+        revision = update_company_usage(
+            session=session, company_id=company_id, bytes=file_size, items=1, enforce_quota=True)
+    except QuotaExceeded:
+        session.rollback()
+        raise
+    session.add(db_item)
+    session.add(DesignItemVersion(
+        design_item_id=item_id,
+        number=1,
+        creator_id=creator_id,
+        filename=file_path.rsplit("/", 1)[-1],
+        file_path=file_path,
+        file_size=file_size,
+        # Stored size of compressed files is looked up when they are replaced
+        stored_size=file_size,
+        file_codec=file_codec,
+    ))
+    session.commit()
+    session.refresh(db_item)
+    tag_index.item_added(company_id, revision, db_item.id, db_item.created_date)
+    similarity.item_added(company_id, revision, db_item.id, perceptual_hash)
+    tag_completion.usage_changed(company_id, revision)
+    return db_item
+
+
+def add_design_item_version(
+    *,
+    session: Session,
+    db_item: DesignItem,
+    version: DesignItemVersion,
+    previous: DesignItemVersion,
+    file_path: str,
+    file_codec: str | None = None,
+    perceptual_hash: int | None = None,
+    image_info: ImageInfo | None = None,
+    thumbnail_hash: str | None = None,
+) -> DesignItem:
+    """
+    Make a version from versions.store_version the item's current file.
+
+    Usage counts the item's file at its full size plus what its older
+    versions take in storage, whole or as patches.
+    """
+    bytes = version.file_size - db_item.file_size
+    if previous.file_path == db_item.file_path:
+        bytes += previous.stored_size
+    if version.file_path != file_path:
+        bytes += version.stored_size
+    try:
+        revision = update_company_usage(
+            session=session, company_id=db_item.company_id, bytes=bytes, enforce_quota=True)
+    except QuotaExceeded:
+        session.rollback()
+        raise
+    if db_item.preview_path == db_item.file_path:
+        db_item.preview_path = file_path
+    db_item.sqlmodel_update({
+        "file_path": file_path,
+        "file_size": version.file_size,
+        "file_codec": file_codec,
+        "perceptual_hash": perceptual_hash,
+        **(image_info.columns() if image_info else dict.fromkeys(
+            ["image_width", "image_height", "image_aspect", "image_format", "image_mode"])),
+        "thumbnail_hash": thumbnail_hash,
+    })
+    session.add(db_item)
+    session.commit()
+    session.refresh(db_item)
+    tag_index.links_changed(db_item.company_id, revision)
+    similarity.item_changed(db_item.company_id, revision, db_item.id, perceptual_hash)
+    tag_completion.usage_changed(db_item.company_id, revision)
+    return db_item
+
+
+def list_design_item_versions(*, session: Session, design_item_id: uuid.UUID) -> list[DesignItemVersion]:
+    """
+    Newest first.
+    """
+    return list(session.exec(
+        select(DesignItemVersion)
+        .where(DesignItemVersion.design_item_id == design_item_id)
+        .order_by(DesignItemVersion.number.desc())
+    ).all())
+
+
+def delete_design_item(*, session: Session, db_item: DesignItem) -> None:
+    history_bytes = session.exec(
+        select(func.coalesce(func.sum(DesignItemVersion.stored_size), 0))
+        .where(DesignItemVersion.design_item_id == db_item.id,
+               DesignItemVersion.file_path != db_item.file_path)
+    ).one()
+    tag_ids = session.exec(
+        delete(TagItemLink)
+        .where(TagItemLink.design_item_id == db_item.id)
+        .returning(TagItemLink.tag_id)
+    ).scalars().all()
+    # Their rows for this item go with it, the rest of their list is recomputed
+    listed_by = list(session.exec(
+        select(RelatedDesignItem.design_item_id).where(RelatedDesignItem.related_id == db_item.id)).all())
+    # Versions go with the item, ON DELETE CASCADE
+    session.exec(delete(DesignItem).where(DesignItem.id == db_item.id))
+    revision = update_company_usage(
+        session=session,
+        company_id=db_item.company_id,
+        bytes=-db_item.file_size - history_bytes,
+        items=-1,
+        previews=-int(db_item.preview_path != db_item.file_path),
+    )
+    counts = dict.fromkeys(tag_ids, -1)
+    update_tag_usage(session=session, counts=counts)
+    mark_related_stale(session=session, revision=revision, item_ids=listed_by)
+    session.commit()
+    tag_index.item_removed(db_item.company_id, revision, db_item.id, db_item.created_date)
+    similarity.item_removed(db_item.company_id, revision, db_item.id)
+    tag_completion.usage_changed(db_item.company_id, revision, counts)
+
+
+def update_design_item_tags(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    item_ids: list[uuid.UUID],
+    add: list[uuid.UUID],
+    remove: list[uuid.UUID],
+    chunk_size: int | None = None,
+) -> DesignItemTagsResult:
+    """
+    Attach tags to and detach tags from many design items of a company.
+
+    Each chunk of items is one transaction of an INSERT ... SELECT and a
+    DELETE ... USING, with its own revision. Ids of other companies' items
+    and tags are ignored.
+    """
+    chunk_size = chunk_size or settings.TAG_LINK_CHUNK_ITEMS
+    result = DesignItemTagsResult()
+    for start in range(0, len(item_ids), chunk_size):
+        chunk = item_ids[start:start + chunk_size]
+        created_dates = dict(session.exec(
+            select(DesignItem.id, DesignItem.created_date)
+            .where(DesignItem.company_id == company_id, DesignItem.id.in_(chunk))
+        ).all())
+        result.items += len(created_dates)
+        added = session.exec(
+            insert(TagItemLink)
+            .from_select(
+                ["design_item_id", "tag_id"],
+                # Every tag on every item, a deliberate cross join
+                select(DesignItem.id, Tag.id)
+                .join(Tag, true())
+                .where(DesignItem.company_id == company_id, DesignItem.id.in_(chunk),
+                       Tag.company_id == company_id, Tag.id.in_(add)),
+            )
+            .on_conflict_do_nothing()
+            .returning(TagItemLink.tag_id, TagItemLink.design_item_id)
+        ).all() if add else []
+        removed = session.exec(
+            delete(TagItemLink)
+            .where(TagItemLink.design_item_id == DesignItem.id,
+                   DesignItem.company_id == company_id, DesignItem.id.in_(chunk),
+                   TagItemLink.tag_id.in_(remove))
+            .returning(TagItemLink.tag_id, TagItemLink.design_item_id)
+        ).all() if remove else []
+        if not added and not removed:
+            session.rollback()
+            continue
+        created = [(tag_id, item_id, created_dates[item_id]) for tag_id, item_id in added]
+        deleted = [(tag_id, item_id, created_dates[item_id]) for tag_id, item_id in removed]
+        revision = update_company_usage(session=session, company_id=company_id)
+        update_tag_usage(session=session, counts=_link_counts(created, deleted))
+        mark_related_stale(session=session, revision=revision,
+                           item_ids=[item_id for _, item_id, _ in created + deleted])
+        session.commit()
+        result.added += len(added)
+        result.removed += len(removed)
+        _tag_links_changed(company_id, revision, created, deleted)
+    return result
+
+
+def design_item_filters(*, company_id: uuid.UUID, item_filter: DesignItemFilter) -> list[Any]:
+    """
+    WHERE clauses for a company's design items.
+
+    Every tag condition is a semi-join on TagItemLink, so the planner can
+    start from the rarest tag through the (tag_id, design_item_id) index.
+    """
+    filters: list[Any] = [DesignItem.company_id == company_id]
+    for tag_id in item_filter.tags_all:
+        filters.append(exists().where(
+            TagItemLink.design_item_id == DesignItem.id,
+            TagItemLink.tag_id == tag_id))
+    if item_filter.tags_any:
+        filters.append(exists().where(
+            TagItemLink.design_item_id == DesignItem.id,
+            TagItemLink.tag_id.in_(item_filter.tags_any)))
+    if item_filter.tags_none:
+        filters.append(~exists().where(
+            TagItemLink.design_item_id == DesignItem.id,
+            TagItemLink.tag_id.in_(item_filter.tags_none)))
+    if item_filter.created_from:
+        filters.append(DesignItem.created_date >= item_filter.created_from)
+    if item_filter.created_to:
+        filters.append(DesignItem.created_date <= item_filter.created_to)
+    if item_filter.creator_id:
+        filters.append(DesignItem.creator_id.in_(item_filter.creator_id))
+    for column, low, high in (
+        (DesignItem.image_width, item_filter.width_min, item_filter.width_max),
+        (DesignItem.image_height, item_filter.height_min, item_filter.height_max),
+        (DesignItem.image_aspect, item_filter.aspect_min, item_filter.aspect_max),
+    ):
+        if low is not None:
+            filters.append(column >= low)
+        if high is not None:
+            filters.append(column <= high)
+    if item_filter.image_format:
+        filters.append(DesignItem.image_format.in_([f.upper() for f in item_filter.image_format]))
+    if item_filter.image_mode:
+        filters.append(DesignItem.image_mode.in_(item_filter.image_mode))
+    return filters
+
+
+def list_design_items(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    item_filter: DesignItemFilter,
+    after: tuple[date, uuid.UUID] | None = None,
+    limit: int = 100,
+) -> list[DesignItem]:
+    """
+    Newest first, keyset paginated on (created_date, id).
+    """
+    statement = select(DesignItem).where(
+        *design_item_filters(company_id=company_id, item_filter=item_filter))
+    if after:
+        statement = statement.where(
+            tuple_(DesignItem.created_date, DesignItem.id) < tuple_(*after))
+    statement = statement.order_by(
+        DesignItem.created_date.desc(), DesignItem.id.desc()).limit(limit)
+    return list(session.exec(statement).all())
+
+
+def count_design_items(
+    *, session: Session, company_id: uuid.UUID, item_filter: DesignItemFilter, limit: int | None = None
+) -> int:
+    """
+    Number of matching design items, counting stops at `limit`.
+    """
+    items = select(DesignItem.id).where(
+        *design_item_filters(company_id=company_id, item_filter=item_filter)).limit(limit)
+    return session.exec(select(func.count()).select_from(items.subquery())).one()
+
+
+def count_design_item_tags(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    item_filter: DesignItemFilter,
+    limit: int = 50,
+    sample_percent: float | None = None,
+) -> list[TagFacet]:
+    """
+    Tag counts over the filtered design items, most used first.
+
+    One grouped query over TagItemLink. With `sample_percent` only that
+    many percent of the filtered items, drawn at random, have their links
+    read and the counts are scaled back up, so they are estimates. The
+    sample is of the company's items, the links of the others are never
+    read, whatever the size of the table.
+    """
+    statement = select(DesignItem.id).where(*design_item_filters(company_id=company_id, item_filter=item_filter))
+    if sample_percent is not None:
+        statement = statement.where(func.random() < sample_percent / 100)
+    items = statement.subquery()
+    count = func.count().label("count")
+    rows = session.exec(
+        select(Tag.id, Tag.title, count)
+        .select_from(TagItemLink)
+        .join(items, items.c.id == TagItemLink.design_item_id)
+        .join(Tag, Tag.id == TagItemLink.tag_id)
+        .group_by(Tag.id)
+        .order_by(count.desc(), Tag.title)
+        .limit(limit)
+    ).all()
+    scale = 100 / sample_percent if sample_percent is not None else 1
+    return [TagFacet(id=row.id, title=row.title, count=round(row.count * scale)) for row in rows]
+
+
+def tag_usage() -> Any:
+    """
+    Number of design items with the tag, counted on the (tag_id, design_item_id) index.
+    """
+    return (
+        select(func.count())
+        .where(TagItemLink.tag_id == Tag.id)
+        .correlate(Tag)
+        .scalar_subquery()
+    )
+
+
+def _tag_listing(company_id: uuid.UUID, sort: Literal["title", "usage"]) -> tuple[Any, Any]:
+    """
+    Statement of a company's tags in listing order and its sort key.
+    """
+    key = Tag.title if sort == "title" else Tag.usage_count
+    statement = select(Tag.id, Tag.title, Tag.description, Tag.usage_count, key.label("key")).where(
+        Tag.company_id == company_id)
+    if sort == "title":
+        return statement.order_by(Tag.title, Tag.id), key
+    return statement.order_by(key.desc(), Tag.id), key
+
+
+def list_tags(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    sort: Literal["title", "usage"] = "title",
+    after: tuple[Any, uuid.UUID] | None = None,
+    limit: int = 100,
+) -> list[tuple[TagPublic, Any]]:
+    """
+    A company's tags by title, or most used first, keyset paginated on
+    (sort key, id). Returned with their sort key for the next cursor.
+    """
+    statement, key = _tag_listing(company_id, sort)
+    if after and sort == "title":
+        statement = statement.where(tuple_(Tag.title, Tag.id) > tuple_(*after))
+    elif after:
+        usage, tag_id = after
+        statement = statement.where(or_(key < usage, and_(key == usage, Tag.id > tag_id)))
+    rows = session.exec(statement.limit(limit)).all()
+    return [(TagPublic(id=row.id, title=row.title, description=row.description, usage_count=row.usage_count), row.key)
+            for row in rows]
+
+
+def iter_tags(
+    *, session: Session, company_id: uuid.UUID, sort: Literal["title", "usage"] = "title", batch_size: int = 1000
+) -> Iterator[TagPublic]:
+    """
+    All of a company's tags in listing order from a server side cursor,
+    batch_size rows in memory at a time.
+    """
+    statement, _ = _tag_listing(company_id, sort)
+    for row in session.exec(statement.execution_options(yield_per=batch_size)):
+        yield TagPublic(id=row.id, title=row.title, description=row.description, usage_count=row.usage_count)
+
+
+def _move_tag_links(
+    session: Session,
+    source_ids: list[uuid.UUID],
+    target_id: uuid.UUID | None,
+    limit: int | None = None,
+) -> tuple[list[tuple[uuid.UUID, uuid.UUID, date]], list[tuple[uuid.UUID, uuid.UUID, date]]]:
+    """
+    Delete up to limit links of the source tags, and with a target link
+    their design items to it instead. Returns the (tag_id, design_item_id,
+    created_date) links added and removed, nothing is committed.
+    """
+    batch = select(TagItemLink.tag_id, TagItemLink.design_item_id).where(
+        TagItemLink.tag_id.in_(source_ids)).limit(limit)
+    removed = [tuple(row) for row in session.exec(
+        delete(TagItemLink)
+        .where(tuple_(TagItemLink.tag_id, TagItemLink.design_item_id).in_(batch),
+               TagItemLink.design_item_id == DesignItem.id)
+        .returning(TagItemLink.tag_id, TagItemLink.design_item_id, DesignItem.created_date)
+    )]
+    if not removed or target_id is None:
+        return [], removed
+    created_dates = {item_id: created_date for _, item_id, created_date in removed}
+    added = session.exec(
+        insert(TagItemLink)
+        .from_select(["design_item_id", "tag_id"], select(DesignItem.id, literal(target_id)).where(
+            # One array parameter, batches go past the limit on bind parameters
+            DesignItem.id == any_(bindparam("item_ids", list(created_dates), type_=ARRAY(Uuid)))))
+        .on_conflict_do_nothing()
+        .returning(TagItemLink.design_item_id)
+    ).scalars().all()
+    return [(target_id, item_id, created_dates[item_id]) for item_id in added], removed
+
+
+def _tag_links_changed(
+    company_id: uuid.UUID,
+    revision: int | None,
+    added: list[tuple[uuid.UUID, uuid.UUID, date]],
+    removed: list[tuple[uuid.UUID, uuid.UUID, date]],
+    removed_tags: list[uuid.UUID] | None = None,
+) -> None:
+    tag_index.links_changed(company_id, revision, added=added, removed=removed)
+    similarity.revision_changed(company_id, revision)
+    tag_completion.usage_changed(company_id, revision, _link_counts(added, removed), removed_tags)
+
+
+def delete_tag(*, session: Session, company_id: uuid.UUID, tag_id: uuid.UUID) -> None:
+    """
+    Delete a tag along with its links, in one transaction.
+    """
+    _, removed = _move_tag_links(session, [tag_id], None)
+    session.exec(delete(Tag).where(Tag.id == tag_id))
+    revision = update_company_usage(session=session, company_id=company_id)
+    mark_related_stale(session=session, revision=revision, item_ids=[item_id for _, item_id, _ in removed])
+    session.commit()
+    _tag_links_changed(company_id, revision, [], removed, [tag_id])
+
+
+def merge_tags(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    target_id: uuid.UUID,
+    source_ids: list[uuid.UUID],
+    batch_size: int | None = None,
+) -> Iterator[TagMergeProgress]:
+    """
+    Move the links of the source tags to the target, then delete them.
+
+    Links move batch_size at a time, one transaction and revision each,
+    so huge tags don't hold locks for long, progress is yielded after every
+    batch. Design items that already have the target just lose the source.
+    A merge cut short leaves the rest of the links on the sources, running
+    it again carries on.
+    """
+    batch_size = batch_size or settings.TAG_MERGE_BATCH_LINKS
+    progress = TagMergeProgress(total=session.exec(
+        select(func.count()).where(TagItemLink.tag_id.in_(source_ids))).one())
+    while not progress.done:
+        added, removed = _move_tag_links(session, source_ids, target_id, batch_size)
+        progress.done = len(removed) < batch_size
+        if progress.done:
+            # The last batch goes with the tags, along with links added meanwhile
+            more_added, more_removed = _move_tag_links(session, source_ids, target_id)
+            added += more_added
+            removed += more_removed
+            session.exec(delete(Tag).where(Tag.id.in_(source_ids)))
+        revision = update_company_usage(session=session, company_id=company_id)
+        # The sources' counts go with them on the last batch
+        update_tag_usage(session=session, counts={
+            tag_id: count for tag_id, count in _link_counts(added, removed).items()
+            if not progress.done or tag_id not in source_ids})
+        mark_related_stale(session=session, revision=revision, item_ids=[item_id for _, item_id, _ in removed])
+        session.commit()
+        _tag_links_changed(company_id, revision, added, removed, source_ids if progress.done else None)
+        progress.moved += len(removed)
+        progress.duplicates += len(removed) - len(added)
+        yield progress.model_copy()
+
+
+def upsert_tags(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    tags_in: list[TagCreate],
+    on_conflict: Literal["update", "skip"] = "skip",
+) -> list[TagBulkResult]:
+    """
+    Create many tags with one INSERT ... ON CONFLICT, one result per entry.
+
+    Titles are unique ignoring case across companies: a title the company
+    has is updated or skipped, one another company has is always skipped,
+    as are repeats of a title within tags_in.
+    """
+    first: dict[str, TagCreate] = {}
+    for tag_in in tags_in:
+        first.setdefault(tag_in.title.lower(), tag_in)
+    rows = func.unnest(
+        bindparam("titles", [tag_in.title for tag_in in first.values()], type_=ARRAY(String)),
+        bindparam("descriptions", [tag_in.description for tag_in in first.values()], type_=ARRAY(String)),
+    ).table_valued("title", "description").render_derived()
+    statement = insert(Tag).from_select(
+        ["id", "company_id", "title", "description"],
+        select(func.gen_random_uuid(), literal(company_id), rows.c.title, rows.c.description),
+    )
+    if on_conflict == "update":
+        statement = statement.on_conflict_do_update(
+            index_elements=[func.lower(Tag.title)],
+            set_={"title": statement.excluded.title, "description": statement.excluded.description},
+            where=and_(
+                Tag.company_id == statement.excluded.company_id,
+                tuple_(Tag.title, Tag.description).is_distinct_from(
+                    tuple_(statement.excluded.title, statement.excluded.description)),
+            ),
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=[func.lower(Tag.title)])
+    # xmax is 0 on a freshly inserted row version, set on an updated one
+    saved = {
+        row.title.lower(): (row.id, row.title, "created" if row.created else "updated")
+        for row in session.exec(statement.returning(
+            Tag.id, Tag.title, literal_column("tag.xmax = 0").label("created")))
+    }
+    skipped = [key for key in first if key not in saved]
+    existing = dict(session.exec(
+        select(func.lower(Tag.title), Tag.id)
+        .where(Tag.company_id == company_id, func.lower(Tag.title).in_(skipped))
+    ).all()) if skipped else {}
+    revision = update_company_usage(session=session, company_id=company_id) if saved else None
+    session.commit()
+    if saved:
+        tag_index.links_changed(company_id, revision)
+        similarity.revision_changed(company_id, revision)
+        tag_completion.tags_saved(company_id, revision, {tag_id: title for tag_id, title, _ in saved.values()})
+
+    results, seen = [], set()
+    for tag_in in tags_in:
+        key = tag_in.title.lower()
+        if key in saved and key not in seen:
+            tag_id, title, status = saved[key]
+            results.append(TagBulkResult(id=tag_id, title=title, status=status))
+        else:
+            tag_id = saved[key][0] if key in saved else existing.get(key)
+            results.append(TagBulkResult(id=tag_id, title=tag_in.title, status="skipped"))
+        seen.add(key)
+    return results
@@ -0,0 +1,129 @@
+import io
+import logging
+import struct
+from dataclasses import dataclass
+from typing import Any
+
+from PIL import Image, ImageFile, UnidentifiedImageError
+
+from app.core.config import settings
+from app.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Enough for the headers of common formats, including JPEGs with large
+# EXIF / ICC segments in front of the frame header
+HEADER_BYTES = 256 * 1024
+
+
+@dataclass
+class ImageInfo:
+    width: int
+    height: int
+    format: str
+    mode: str
+
+    def columns(self) -> dict[str, Any]:
+        """
+        Values of the DesignItem image_* columns.
+        """
+        return {
+            "image_width": self.width,
+            "image_height": self.height,
+            "image_aspect": self.width / self.height if self.height else None,
+            "image_format": self.format,
+            "image_mode": self.mode,
+        }
+
+
+def _webp_info(head: bytes) -> ImageInfo | None:
+    # Pillow sets up a full animation decoder, canvas included, just to
+    # report the size. The size is in the first chunk header.
+    if len(head) < 30 or head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return ImageInfo(width=width & 0x3FFF, height=height & 0x3FFF, format="WEBP", mode="RGB")
+    if chunk == b"VP8L" and head[20] == 0x2F:
+        bits = int.from_bytes(head[21:25], "little")
+        return ImageInfo(
+            width=(bits & 0x3FFF) + 1,
+            height=(bits >> 14 & 0x3FFF) + 1,
+            format="WEBP",
+            mode="RGBA" if bits >> 28 & 1 else "RGB",
+        )
+    if chunk == b"VP8X":
+        return ImageInfo(
+            width=int.from_bytes(head[24:27], "little") + 1,
+            height=int.from_bytes(head[27:30], "little") + 1,
+            format="WEBP",
+            mode="RGBA" if head[20] & 0x10 else "RGB",
+        )
+    return None
+
+
+def _open_header(head: bytes) -> ImageFile.ImageFile | None:
+    # Image.open without its decompression bomb check, which would reject
+    # large designs although nothing here decodes pixels. Formats that
+    # recognize their signature go first, guessing ones like TGA last.
+    Image.init()
+    prefix = head[:16]
+    for format_id in sorted(Image.ID, key=lambda format_id: Image.OPEN[format_id][1] is None):
+        factory, accept = Image.OPEN[format_id]
+        try:
+            accepted = not accept or accept(prefix)
+            if accepted and not isinstance(accepted, str):
+                return factory(io.BytesIO(head), "")  # type: ignore[no-any-return]
+        except (SyntaxError, IndexError, TypeError, ValueError, EOFError, OSError, struct.error):
+            continue
+    return None
+
+
+def read_image_info(head: bytes) -> ImageInfo | None:
+    """
+    Dimensions, format and color mode from the start of an image file,
+    None when Pillow doesn't recognize it. Pixels are never decoded.
+    """
+    if head[:4] == b"RIFF" and (info := _webp_info(head)):
+        return info
+    image = _open_header(head)
+    if image is None or not image.format:
+        return None
+    width, height = image.size
+    return ImageInfo(width=width, height=height, format=image.format, mode=image.mode)
+
+
+def read_stored_image_info(key: str, codec: str | None = None) -> ImageInfo | None:
+    head = next(get_storage().iter_content(key, codec, HEADER_BYTES), b"")
+    return read_image_info(head)
+
+
+def open_preview(key: str, size: int, codec: str | None = None) -> Image.Image | None:
+    """
+    Stored preview decoded at 256 px at most, the common source of
+    perceptual hashes and thumbnails. None when it isn't an image Pillow
+    reads or is larger than SIMILARITY_HASH_MAX_BYTES.
+    """
+    if size > settings.SIMILARITY_HASH_MAX_BYTES:
+        return None
+    chunks = get_storage().iter_content(key, codec)
+    head = next(chunks, b"")
+    try:
+        # Image headers fit in the first chunk, don't read the rest of
+        # files that aren't images, or of images too large to decode
+        Image.open(io.BytesIO(head))
+    except UnidentifiedImageError:
+        return None
+    except (OSError, ValueError, EOFError, SyntaxError, Image.DecompressionBombError) as e:
+        logger.info(f"Can't read preview {key}: {e}")
+        return None
+    try:
+        image = Image.open(io.BytesIO(head + b"".join(chunks)))
+        # JPEG can decode straight at a fraction of the size
+        image.draft(None, (128, 128))
+        image.thumbnail((256, 256))
+        return image
+    except (OSError, ValueError, EOFError, SyntaxError, Image.DecompressionBombError) as e:
+        logger.info(f"Can't read preview {key}: {e}")
+        return None
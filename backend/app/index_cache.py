@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Generic, TypeVar
+
+from sqlmodel import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CompanyIndex(ABC):
+    """
+    In-memory index of one company's data as of a CompanyUsage.revision.
+    """
+
+    size: int
+
+    def __init__(self, revision: int) -> None:
+        self.revision = revision
+        self.changes = 0
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        pass
+
+
+IndexT = TypeVar("IndexT", bound=CompanyIndex)
+
+
+class IndexCache(ABC, Generic[IndexT]):
+    """
+    Per process cache of company indexes within a memory budget.
+
+    Indexes are built lazily in a background thread, until one is ready or
+    while it is behind the database revision callers fall back to SQL.
+    """
+
+    name: str
+
+    def __init__(self) -> None:
+        self.indexes: OrderedDict[uuid.UUID, IndexT] = OrderedDict()
+        self.building: dict[uuid.UUID, Future[None]] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name.replace(" ", "-"))
+
+    @abstractmethod
+    def load(self, session: Session, company_id: uuid.UUID) -> IndexT:
+        """
+        Build the index from a REPEATABLE READ session.
+        """
+
+    @property
+    @abstractmethod
+    def max_bytes(self) -> int:
+        pass
+
+    @property
+    @abstractmethod
+    def max_changes(self) -> int:
+        pass
+
+    def get(self, company_id: uuid.UUID, revision: int) -> IndexT | None:
+        """
+        The company's index if it is at the revision, None otherwise.
+
+        Every worker process keeps its own indexes, a write in another one
+        leaves them behind. Rebuilding is a full load, so an index behind
+        is rebuilt at most every INDEX_REBUILD_MIN_SECONDS and callers go
+        to SQL until then.
+        """
+        with self.lock:
+            index = self.indexes.get(company_id)
+            if index is not None and index.revision == revision:
+                self.indexes.move_to_end(company_id)
+                return index
+        if index is None or time.monotonic() - index.built_at >= settings.INDEX_REBUILD_MIN_SECONDS:
+            self.rebuild(company_id)
+        return None
+
+    def get_recent(self, company_id: uuid.UUID, revision: int, max_age: float) -> IndexT | None:
+        """
+        The company's index even behind the revision, for lookups that can
+        do with slightly old data. One behind and built over max_age seconds
+        ago is rebuilt in the background and keeps serving meanwhile.
+        """
+        with self.lock:
+            index = self.indexes.get(company_id)
+            if index is not None:
+                self.indexes.move_to_end(company_id)
+        if index is None or (index.revision != revision and time.monotonic() - index.built_at > max_age):
+            self.rebuild(company_id)
+        return index
+
+    def rebuild(self, company_id: uuid.UUID) -> Future[None]:
+        with self.lock:
+            if company_id not in self.building:
+                self.building[company_id] = self.executor.submit(self._build, company_id)
+            return self.building[company_id]
+
+    def _build(self, company_id: uuid.UUID) -> None:
+        from app.core.db import engine
+
+        try:
+            with Session(engine.execution_options(isolation_level="REPEATABLE READ")) as session:
+                index = self.load(session, company_id)
+            logger.info(f"Built {self.name} of company {company_id}: {index.size} items, {index.nbytes} bytes")
+            with self.lock:
+                self.indexes[company_id] = index
+                self.indexes.move_to_end(company_id)
+                self._evict()
+        except Exception:
+            logger.exception(f"Failed to build {self.name} of company {company_id}")
+        finally:
+            with self.lock:
+                self.building.pop(company_id, None)
+
+    def _evict(self) -> None:
+        total = sum(index.nbytes for index in self.indexes.values())
+        while self.indexes and total > self.max_bytes:
+            company_id, index = self.indexes.popitem(last=False)
+            total -= index.nbytes
+            logger.info(f"Evicted {self.name} of company {company_id}")
+
+    def apply(self, company_id: uuid.UUID, revision: int | None, change: Callable[[IndexT], bool]) -> None:
+        """
+        Apply a committed change that moved the company to `revision`.
+
+        Only the direct successor of the index revision can be applied,
+        anything else means another process changed the data and the
+        index stays behind until the rebuild the next lookup triggers.
+        """
+        with self.lock:
+            index = self.indexes.get(company_id)
+        if index is None or revision is None:
+            return
+        with index.lock:
+            if index.revision + 1 != revision or not change(index):
+                return
+            index.revision = revision
+            index.changes += 1
+            stale = index.changes > self.max_changes
+        if stale:
+            self.rebuild(company_id)
@@ -0,0 +1,93 @@
+import argparse
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sqlmodel import Session, select, update
+
+from app import crud
+from app.core.db import engine
+from app.models import DesignItem
+from app.storage import get_storage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackfillResult:
+    scanned: int = 0
+    sized: int = 0
+    last_id: uuid.UUID | None = None
+
+
+def _size(item: DesignItem) -> int | None:
+    try:
+        stored = get_storage().stat(item.file_path)
+    except Exception as e:
+        logger.error(f"Failed to stat {item.file_path}: {e!r}")
+        return None
+    return stored.size if stored else None
+
+
+def backfill(
+    session: Session, *, after: uuid.UUID | None = None, batch_size: int = 500, workers: int = 4
+) -> BackfillResult:
+    """
+    Record the file size of design items stored before file_size existed,
+    which the column's default left at 0, and add it to their company's
+    byte counter.
+
+    Only uncompressed files are looked at, a compressed one was stored
+    with its size. Walks items in id order, so an interrupted run can
+    continue from the last id it logged.
+    """
+    result = BackfillResult(last_id=after)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            statement = select(DesignItem).where(DesignItem.file_size == 0, DesignItem.file_codec.is_(None))
+            if result.last_id:
+                statement = statement.where(DesignItem.id > result.last_id)
+            items = session.exec(statement.order_by(DesignItem.id).limit(batch_size)).all()
+            if not items:
+                break
+
+            result.scanned += len(items)
+            result.last_id = items[-1].id
+            added: dict[uuid.UUID, int] = {}
+            for item, size in zip(items, executor.map(_size, items), strict=True):
+                if not size:
+                    continue
+                # Unless an upload set it meanwhile
+                updated = session.exec(
+                    update(DesignItem)
+                    .where(DesignItem.id == item.id, DesignItem.file_size == 0)
+                    .values(file_size=size)
+                )
+                if updated.rowcount:
+                    added[item.company_id] = added.get(item.company_id, 0) + size
+                    result.sized += 1
+            for company_id in sorted(added):
+                crud.update_company_usage(session=session, company_id=company_id, bytes=added[company_id])
+            session.commit()
+            logger.info(f"Sized {result.sized} of {result.scanned} design items, last id {result.last_id}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Record the file size of design items stored without one")
+    parser.add_argument("--after", type=uuid.UUID, help="continue after this design item id")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    logger.info("Backfilling design file sizes")
+    with Session(engine) as session:
+        result = backfill(session, after=args.after, batch_size=args.batch_size, workers=args.workers)
+    logger.info(f"Sized {result.sized} of {result.scanned} design items")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sqlmodel import Session, select, update
+
+from app import crud
+from app.core.db import engine
+from app.models import DesignItem
+from app.similarity import preview_hash
+from app.storage import get_storage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackfillResult:
+    scanned: int = 0
+    hashed: int = 0
+    last_id: uuid.UUID | None = None
+
+
+def _hash(item: DesignItem) -> int | None:
+    size, codec = item.file_size, item.file_codec
+    if item.preview_path != item.file_path:
+        stored = get_storage().stat(item.preview_path)
+        if not stored:
+            return None
+        size, codec = stored.size, None
+    try:
+        return preview_hash(item.preview_path, size, codec)
+    except Exception as e:
+        logger.error(f"Failed to hash {item.preview_path}: {e!r}")
+        return None
+
+
+def backfill(
+    session: Session, *, after: uuid.UUID | None = None, batch_size: int = 500, workers: int = 4
+) -> BackfillResult:
+    """
+    Hash the previews of design items that have no perceptual hash yet.
+
+    Walks items in id order, so an interrupted run can continue from the
+    last id it logged. Items that aren't images stay unhashed and only cost
+    a read of their first chunk when the job runs again.
+    """
+    result = BackfillResult(last_id=after)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            statement = select(DesignItem).where(DesignItem.perceptual_hash.is_(None))
+            if result.last_id:
+                statement = statement.where(DesignItem.id > result.last_id)
+            items = session.exec(statement.order_by(DesignItem.id).limit(batch_size)).all()
+            if not items:
+                break
+
+            result.scanned += len(items)
+            result.last_id = items[-1].id
+            companies = set()
+            for item, perceptual_hash in zip(items, executor.map(_hash, items), strict=True):
+                if perceptual_hash is None:
+                    continue
+                session.exec(
+                    update(DesignItem)
+                    .where(DesignItem.id == item.id)
+                    .values(perceptual_hash=perceptual_hash)
+                )
+                companies.add(item.company_id)
+                result.hashed += 1
+            # Hash indexes of these companies are rebuilt on the next lookup
+            for company_id in sorted(companies):
+                crud.update_company_usage(session=session, company_id=company_id)
+            session.commit()
+            logger.info(f"Hashed {result.hashed} of {result.scanned} design items, last id {result.last_id}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compute perceptual hashes of design item previews")
+    parser.add_argument("--after", type=uuid.UUID, help="continue after this design item id")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    logger.info("Backfilling perceptual hashes")
+    with Session(engine) as session:
+        result = backfill(session, after=args.after, batch_size=args.batch_size, workers=args.workers)
+    logger.info(f"Hashed {result.hashed} of {result.scanned} design items")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from sqlmodel import Session, select, update
+
+from app.core.db import engine
+from app.image_info import ImageInfo, read_stored_image_info
+from app.models import DesignItem
+from app.storage import get_storage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackfillResult:
+    scanned: int = 0
+    images: int = 0
+    last_id: uuid.UUID | None = None
+
+
+def _init_worker() -> None:
+    # Storage clients (S3 connection pools) don't survive a fork
+    get_storage.cache_clear()
+
+
+def _inspect(key: str, codec: str | None) -> ImageInfo | None:
+    try:
+        return read_stored_image_info(key, codec)
+    except Exception as e:
+        logger.error(f"Failed to read {key}: {e!r}")
+        return None
+
+
+def backfill(
+    session: Session,
+    *,
+    after: uuid.UUID | None = None,
+    batch_size: int = 5000,
+    workers: int | None = None,
+) -> BackfillResult:
+    """
+    Read image dimensions, format and mode of design items without them.
+
+    Only headers are read, in a process pool since parsing them is CPU
+    bound. The next batch is inspected while the previous one is written.
+    Walks items in id order, an interrupted run can continue from the last
+    id it logged. Items that aren't images stay empty and are read again,
+    header only, when the job runs again.
+    """
+    result = BackfillResult(last_id=after)
+    workers = workers or os.cpu_count() or 1
+
+    def batches() -> Iterator[Sequence[Any]]:
+        last_id = after
+        while True:
+            statement = select(DesignItem.id, DesignItem.preview_path, DesignItem.file_codec).where(
+                DesignItem.image_format.is_(None))
+            if last_id:
+                statement = statement.where(DesignItem.id > last_id)
+            rows = session.exec(statement.order_by(DesignItem.id).limit(batch_size)).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            yield rows
+
+    def write(rows: Sequence[Any], infos: Iterator[ImageInfo | None]) -> None:
+        values = [{"id": row.id, **info.columns()} for row, info in zip(rows, infos, strict=True) if info]
+        if values:
+            session.execute(update(DesignItem), values)  # bulk update by primary key
+        session.commit()
+        result.scanned += len(rows)
+        result.images += len(values)
+        result.last_id = rows[-1].id
+        logger.info(f"Read {result.images} images of {result.scanned} design items, last id {result.last_id}")
+
+    # Forked workers inherit the settings of this process
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as executor:
+        pending = None
+        for rows in batches():
+            infos = executor.map(_inspect, [row.preview_path for row in rows], [row.file_codec for row in rows],
+                                 chunksize=max(1, len(rows) // (workers * 4)))
+            if pending:
+                write(*pending)
+            pending = (rows, infos)
+        if pending:
+            write(*pending)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Read image dimensions, format and mode of design item previews")
+    parser.add_argument("--after", type=uuid.UUID, help="continue after this design item id")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    logger.info("Backfilling image info")
+    start = time.perf_counter()
+    with Session(engine) as session:
+        result = backfill(session, after=args.after, batch_size=args.batch_size, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Read {result.images} images of {result.scanned} design items "
+                f"in {elapsed:.1f}s ({result.scanned / max(elapsed, 1e-9):.0f} items/s)")
+
+
+if __name__ == "__main__":
+    main()
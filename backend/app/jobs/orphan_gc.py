@@ -0,0 +1,151 @@
+import argparse
+import logging
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from sqlalchemy import collate, union
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import DesignItem, DesignItemVersion
+from app.storage import Storage, StoredObject, get_storage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns holding storage keys, anything not referenced by one of them is garbage
+LIVE_KEY_COLUMNS = [DesignItem.file_path, DesignItem.preview_path, DesignItemVersion.file_path]
+
+
+class OrderingError(Exception):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, per_second: float) -> None:
+        self.interval = 1 / per_second if per_second > 0 else 0
+        self.next_at = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(self.next_at, now) + self.interval
+
+
+@dataclass
+class GCResult:
+    scanned: int = 0
+    orphaned: int = 0
+    orphaned_bytes: int = 0
+    deleted: int = 0
+    too_recent: int = 0
+
+
+def live_keys(session: Session, batch_size: int = 10_000) -> Iterator[str]:
+    """
+    Stream referenced keys in byte order from a server side cursor.
+    """
+    keys = union(*(select(column.label("key")) for column in LIVE_KEY_COLUMNS)).subquery()
+    statement = (
+        select(keys.c.key)
+        .order_by(collate(keys.c.key, "C"))
+        .execution_options(yield_per=batch_size)
+    )
+    yield from session.execute(statement).scalars()
+
+
+def _ordered(items: Iterator[str], what: str) -> Iterator[str]:
+    # The merge below silently breaks on unsorted input, which would mean
+    # deleting live files, so check the order instead of trusting it
+    previous = None
+    for item in items:
+        if previous is not None and item <= previous:
+            raise OrderingError(f"{what} is not sorted at {item!r}")
+        previous = item
+        yield item
+
+
+def find_orphans(objects: Iterator[StoredObject], keys: Iterator[str]) -> Iterator[StoredObject]:
+    """
+    Merge two sorted streams and yield stored objects without a key.
+    """
+    keys = _ordered(keys, "Database manifest")
+    key = next(keys, None)
+    previous = None
+    for obj in objects:
+        if previous is not None and obj.key <= previous:
+            raise OrderingError(f"Storage listing is not sorted at {obj.key!r}")
+        previous = obj.key
+        while key is not None and key < obj.key:
+            key = next(keys, None)
+        if key != obj.key:
+            yield obj
+
+
+def collect_garbage(
+    session: Session,
+    storage: Storage,
+    *,
+    grace_seconds: float,
+    dry_run: bool = True,
+    max_ops_per_second: float = 0,
+) -> GCResult:
+    result = GCResult()
+    deadline = time.time() - grace_seconds
+    limiter = RateLimiter(max_ops_per_second)
+
+    def listing() -> Iterator[StoredObject]:
+        for obj in storage.iter_objects():
+            result.scanned += 1
+            yield obj
+
+    for obj in find_orphans(listing(), live_keys(session)):
+        # Files younger than the grace period may belong to an upload whose
+        # row isn't committed yet
+        if obj.mtime > deadline:
+            result.too_recent += 1
+            continue
+        result.orphaned += 1
+        result.orphaned_bytes += obj.size
+        if dry_run:
+            logger.info(f"Would delete {obj.key} ({obj.size} bytes)")
+            continue
+        limiter.wait()
+        storage.delete(obj.key)
+        result.deleted += 1
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Delete stored files no design item references")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only report what would be deleted")
+    parser.add_argument("--grace-hours", type=float,
+                        default=settings.ORPHAN_GC_GRACE_HOURS)
+    parser.add_argument("--max-ops-per-second", type=float,
+                        default=settings.ORPHAN_GC_MAX_OPS_PER_SECOND)
+    args = parser.parse_args()
+
+    logger.info("Collecting orphaned design files")
+    with Session(engine) as session:
+        result = collect_garbage(
+            session,
+            get_storage(),
+            grace_seconds=args.grace_hours * 3600,
+            dry_run=args.dry_run,
+            max_ops_per_second=args.max_ops_per_second,
+        )
+    logger.info(
+        f"Scanned {result.scanned} files, {result.orphaned} orphaned "
+        f"({result.orphaned_bytes} bytes {'reclaimable' if args.dry_run else 'reclaimed'}), "
+        f"{result.deleted} deleted, {result.too_recent} within the grace period")
+
+
+if __name__ == "__main__":
+    main()
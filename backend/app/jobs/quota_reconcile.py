@@ -0,0 +1,101 @@
+import logging
+import uuid
+from typing import Any
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, func, select, update
+
+from app.core.db import engine
+from app.models import Company, CompanyUsage, DesignItem, DesignItemVersion
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _actual_usage(company_id: uuid.UUID | None = None) -> Any:
+    # Older versions of the items, the current one is the item's file
+    history_bytes = (
+        select(func.coalesce(func.sum(DesignItemVersion.stored_size), 0))
+        .join(DesignItem, DesignItem.id == DesignItemVersion.design_item_id)
+        .where(DesignItem.company_id == Company.id,
+               DesignItemVersion.file_path != DesignItem.file_path)
+        .correlate(Company)
+        .scalar_subquery()
+    )
+    statement = (
+        select(Company.id.label("company_id"),
+               (func.coalesce(func.sum(DesignItem.file_size), 0) + history_bytes).label("bytes"),
+               func.count(DesignItem.id).label("items"),
+               func.count(DesignItem.id)
+               .filter(DesignItem.preview_path != DesignItem.file_path)
+               .label("previews"))
+        .select_from(Company)
+        .outerjoin(DesignItem, DesignItem.company_id == Company.id)
+        .group_by(Company.id)
+    )
+    if company_id:
+        statement = statement.where(Company.id == company_id)
+    return statement
+
+
+def find_drift(session: Session) -> list[uuid.UUID]:
+    """
+    Companies whose counters don't match their design items.
+    """
+    actual = _actual_usage().subquery()
+    return list(session.exec(
+        select(actual.c.company_id)
+        .outerjoin(CompanyUsage, CompanyUsage.company_id == actual.c.company_id)
+        .where(
+            (CompanyUsage.company_id.is_(None))
+            | (CompanyUsage.bytes != actual.c.bytes)
+            | (CompanyUsage.items != actual.c["items"])
+            | (CompanyUsage.previews != actual.c.previews)
+        )
+    ).all())
+
+
+def repair(session: Session, company_id: uuid.UUID) -> None:
+    """
+    Recompute one company under the counter row lock.
+
+    Uploads and deletes update the counter row in the same transaction as
+    the design item, so holding the lock gives a consistent recount.
+    """
+    session.exec(
+        insert(CompanyUsage)
+        .values(company_id=company_id, bytes=0, items=0, previews=0)
+        .on_conflict_do_nothing()
+    )
+    session.exec(
+        select(CompanyUsage.company_id)
+        .where(CompanyUsage.company_id == company_id)
+        .with_for_update()
+    )
+    actual = session.exec(_actual_usage(company_id)).one()
+    session.exec(
+        update(CompanyUsage)
+        .where(CompanyUsage.company_id == company_id)
+        .values(bytes=actual.bytes, items=actual.items, previews=actual.previews)
+    )
+    session.commit()
+
+
+def reconcile(session: Session) -> int:
+    drifted = find_drift(session)
+    session.commit()
+    for company_id in drifted:
+        logger.warning(f"Repairing usage counters of company {company_id}")
+        repair(session, company_id)
+    return len(drifted)
+
+
+def main() -> None:
+    logger.info("Reconciling company usage counters")
+    with Session(engine) as session:
+        repaired = reconcile(session)
+    logger.info(f"Repaired {repaired} companies")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import logging
+import uuid
+from typing import Any
+
+import numpy as np
+from sqlalchemy import REAL, BigInteger, SmallInteger, Uuid, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, delete, func, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import CompanyUsage, DesignItem, RelatedDesignItem, RelatedDesignItemStale
+from app.related_items import TagSets
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Design items whose related items are replaced per transaction
+BATCH_ITEMS = 10_000
+
+
+def _uuids(name: str, values: list[uuid.UUID]) -> Any:
+    # One array parameter, lists go past the limit on bind parameters
+    return bindparam(name, values, type_=ARRAY(Uuid))
+
+
+def find_stale(session: Session) -> list[uuid.UUID]:
+    """
+    Companies with design items queued by crud.mark_related_stale.
+    """
+    return list(session.exec(
+        select(DesignItem.company_id)
+        .join(RelatedDesignItemStale, RelatedDesignItemStale.design_item_id == DesignItem.id)
+        .distinct()
+    ).all())
+
+
+def _save(session: Session, company_id: uuid.UUID, tag_sets: TagSets, item_ids: list[uuid.UUID],
+          found: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]) -> None:
+    """
+    Replace the related items of item_ids with those found, committing
+    every BATCH_ITEMS items so no transaction holds locks for long. Items
+    deleted since the tag sets were loaded are skipped.
+    """
+    left, ranks, right, scores = found
+    existing = select(DesignItem.id).where(DesignItem.company_id == company_id)
+    for start in range(0, len(item_ids), BATCH_ITEMS):
+        batch = item_ids[start:start + BATCH_ITEMS]
+        session.exec(delete(RelatedDesignItem).where(
+            RelatedDesignItem.design_item_id == any_(_uuids("item_ids", batch))))
+        rows = np.flatnonzero(np.isin(
+            left, [tag_sets.ordinal_of[item_id] for item_id in batch if item_id in tag_sets.ordinal_of]))
+        if len(rows):
+            values = func.unnest(
+                _uuids("item_ids", [tag_sets.ids[n] for n in left[rows].tolist()]),
+                bindparam("ranks", ranks[rows].tolist(), type_=ARRAY(SmallInteger)),
+                _uuids("related_ids", [tag_sets.ids[n] for n in right[rows].tolist()]),
+                bindparam("scores", scores[rows].tolist(), type_=ARRAY(REAL)),
+            ).table_valued("design_item_id", "rank", "related_id", "score").render_derived()
+            session.exec(insert(RelatedDesignItem).from_select(
+                ["design_item_id", "rank", "related_id", "score"],
+                select(values.c.design_item_id, values.c.rank, values.c.related_id, values.c.score)
+                .where(values.c.design_item_id.in_(existing), values.c.related_id.in_(existing))))
+        session.commit()
+
+
+def refresh(session: Session, company_id: uuid.UUID, full: bool = False) -> int:
+    """
+    Recompute the related items of a company's queued design items, or of
+    all of them when full, returns how many were recomputed.
+
+    Besides the queued items, those listing one of them and those now
+    related to one are recomputed, as their lists may change the most. Any
+    other list that would now take in a queued item catches up on the next
+    full refresh.
+    """
+    stale = session.exec(
+        select(RelatedDesignItemStale.design_item_id, RelatedDesignItemStale.revision)
+        .join(DesignItem, DesignItem.id == RelatedDesignItemStale.design_item_id)
+        .where(DesignItem.company_id == company_id)
+    ).all()
+    tag_sets = TagSets.load(session, company_id)
+    k = settings.RELATED_ITEMS_TOP_K
+
+    if full:
+        found = tag_sets.top(np.arange(tag_sets.size), k)
+        # Items left without tags lose their rows
+        listed = session.exec(
+            select(RelatedDesignItem.design_item_id)
+            .join(DesignItem, DesignItem.id == RelatedDesignItem.design_item_id)
+            .where(DesignItem.company_id == company_id)
+            .distinct()
+        ).all()
+        item_ids = list(dict.fromkeys([*tag_sets.ids, *listed]))
+    else:
+        changed = [item_id for item_id, _ in stale]
+        listed_by = session.exec(
+            select(RelatedDesignItem.design_item_id)
+            .where(RelatedDesignItem.related_id == any_(_uuids("item_ids", changed)))
+        ).all()
+        item_ids = list(dict.fromkeys([*changed, *listed_by]))
+        ordinals = np.array([tag_sets.ordinal_of[item_id] for item_id in item_ids if item_id in tag_sets.ordinal_of],
+                            dtype=np.int64)
+        found = tag_sets.top(ordinals, k)
+        neighbours = np.setdiff1d(found[2], ordinals)
+        more = tag_sets.top(neighbours, k)
+        found = tuple(np.concatenate([first, second]) for first, second in zip(found, more))  # type: ignore[assignment]
+        item_ids += [tag_sets.ids[n] for n in neighbours.tolist()]
+    _save(session, company_id, tag_sets, item_ids, found)
+
+    # Markers are dropped under the company counter row lock, writers
+    # upsert them while holding it, so neither waits on the other's markers
+    session.exec(select(CompanyUsage.company_id).where(CompanyUsage.company_id == company_id).with_for_update())
+    markers = func.unnest(
+        _uuids("item_ids", [item_id for item_id, _ in stale]),
+        bindparam("revisions", [revision for _, revision in stale], type_=ARRAY(BigInteger)),
+    ).table_valued("design_item_id", "revision").render_derived()
+    # Changed again meanwhile the marker has a newer revision and stays
+    session.exec(delete(RelatedDesignItemStale).where(
+        RelatedDesignItemStale.design_item_id == markers.c.design_item_id,
+        RelatedDesignItemStale.revision == markers.c.revision))
+    session.commit()
+    return len(item_ids)
+
+
+def run(session: Session, full: bool = False) -> int:
+    """
+    Refresh every company with queued design items, or every company with
+    design items when full, returns the number of companies refreshed.
+    """
+    if full:
+        company_ids = list(session.exec(select(DesignItem.company_id).distinct()).all())
+    else:
+        company_ids = find_stale(session)
+    session.commit()
+    refreshed = 0
+    for company_id in company_ids:
+        try:
+            recomputed = refresh(session, company_id, full)
+        except IntegrityError:
+            # An item deleted just as its rows went in, the markers stay queued
+            session.rollback()
+            logger.warning(f"Skipped related items of company {company_id}, retried on the next run")
+            continue
+        refreshed += 1
+        logger.info(f"Recomputed related items of {recomputed} design items of company {company_id}")
+    return refreshed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recompute related design items from tag similarity")
+    parser.add_argument("--full", action="store_true",
+                        help="recompute every design item, not only those queued")
+    args = parser.parse_args()
+
+    logger.info("Refreshing related design items")
+    with Session(engine) as session:
+        refreshed = run(session, args.full)
+    logger.info(f"Refreshed {refreshed} companies")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import hashlib
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from app.storage import Storage, StoredObject, create_storage
+from app.storage.compression import ChunkReader
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+@dataclass
+class MigrationResult:
+    copied: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes: int = 0
+
+
+def copy_object(source: Storage, target: Storage, obj: StoredObject, *, overwrite: bool = False) -> bool:
+    """
+    Copy one blob and verify it with a SHA-256 of both sides.
+
+    Returns False when the target already holds an identical copy.
+    """
+    existing = target.stat(obj.key)
+    if existing and existing.size == obj.size and not overwrite:
+        if target.checksum(obj.key) == source.checksum(obj.key):
+            return False
+
+    # Hashed while it is being read
+    digest = hashlib.sha256()
+    target.put_stream(obj.key, ChunkReader(source.iter_chunks(obj.key), digest.update))  # type: ignore[arg-type]
+    if target.checksum(obj.key) != digest.hexdigest():
+        target.delete(obj.key)
+        raise ChecksumMismatch(obj.key)
+    return True
+
+
+def migrate(
+    source: Storage, target: Storage, *, prefix: str = "", workers: int = 8, overwrite: bool = False
+) -> MigrationResult:
+    result = MigrationResult()
+
+    def collect(done: set[Future[bool]]) -> None:
+        for future in done:
+            obj = in_flight.pop(future)
+            try:
+                copied = future.result()
+            except Exception as e:
+                logger.error(f"Failed to copy {obj.key}: {e!r}")
+                result.failed += 1
+                continue
+            if copied:
+                result.copied += 1
+                result.bytes += obj.size
+            else:
+                result.skipped += 1
+
+    # Bounded number of pending copies, the listing itself is streamed
+    in_flight: dict[Future[bool], StoredObject] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for obj in source.iter_objects(prefix):
+            if len(in_flight) >= workers * 4:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(
+                copy_object, source, target, obj, overwrite=overwrite)
+            in_flight[future] = obj
+        collect(wait(in_flight).done)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Copy design files between storage backends")
+    parser.add_argument("source", choices=["local", "s3"])
+    parser.add_argument("target", choices=["local", "s3"])
+    parser.add_argument("--prefix", default="")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    logger.info(f"Migrating blobs from {args.source} to {args.target}")
+    result = migrate(
+        create_storage(args.source),
+        create_storage(args.target),
+        prefix=args.prefix,
+        workers=args.workers,
+        overwrite=args.overwrite,
+    )
+    logger.info(
+        f"Copied {result.copied} blobs ({result.bytes} bytes), "
+        f"skipped {result.skipped}, failed {result.failed}")
+    if result.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
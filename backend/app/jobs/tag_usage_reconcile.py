@@ -0,0 +1,74 @@
+import logging
+import uuid
+from typing import Any
+
+from sqlmodel import Session, func, select, update
+
+from app import crud
+from app.core.db import engine
+from app.models import Tag, TagItemLink
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _actual_usage() -> Any:
+    return (
+        select(TagItemLink.tag_id, func.count().label("usage"))
+        .group_by(TagItemLink.tag_id)
+        .subquery()
+    )
+
+
+def find_drift(session: Session) -> list[uuid.UUID]:
+    """
+    Companies with tags whose usage count doesn't match their links.
+    """
+    actual = _actual_usage()
+    return list(session.exec(
+        select(Tag.company_id)
+        .outerjoin(actual, actual.c.tag_id == Tag.id)
+        .where(Tag.usage_count != func.coalesce(actual.c.usage, 0))
+        .distinct()
+    ).all())
+
+
+def repair(session: Session, company_id: uuid.UUID) -> int:
+    """
+    Recount one company's tags under its counter row lock, returns the
+    number of tags fixed.
+
+    Every change to tag links bumps the company revision in the same
+    transaction, so holding the lock gives a consistent recount, and the
+    new revision sends the in-memory tag indexes back to the database.
+    """
+    crud.update_company_usage(session=session, company_id=company_id)
+    usage = crud.tag_usage()
+    fixed = session.exec(
+        update(Tag)
+        .where(Tag.company_id == company_id, Tag.usage_count != usage)
+        .values(usage_count=usage)
+        .returning(Tag.id)
+    ).all()
+    session.commit()
+    return len(fixed)
+
+
+def reconcile(session: Session) -> int:
+    drifted = find_drift(session)
+    session.commit()
+    for company_id in drifted:
+        fixed = repair(session, company_id)
+        logger.warning(f"Repaired usage counts of {fixed} tags of company {company_id}")
+    return len(drifted)
+
+
+def main() -> None:
+    logger.info("Reconciling tag usage counts")
+    with Session(engine) as session:
+        repaired = reconcile(session)
+    logger.info(f"Repaired {repaired} companies")
+
+
+if __name__ == "__main__":
+    main()
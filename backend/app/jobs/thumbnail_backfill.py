@@ -0,0 +1,77 @@
+import argparse
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sqlmodel import Session, select, update
+
+from app.core.db import engine
+from app.models import DesignItem
+from app.thumbnails import item_thumbnail
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackfillResult:
+    scanned: int = 0
+    made: int = 0
+    last_id: uuid.UUID | None = None
+
+
+def backfill(
+    session: Session, *, after: uuid.UUID | None = None, batch_size: int = 500, workers: int = 4
+) -> BackfillResult:
+    """
+    Make the thumbnails of design items that have none yet, so gallery
+    sprite requests don't decode their previews.
+
+    Walks items in id order, so an interrupted run can continue from the
+    last id it logged. Items that aren't images get NO_THUMBNAIL and are
+    not read again.
+    """
+    result = BackfillResult(last_id=after)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            statement = select(DesignItem).where(DesignItem.thumbnail_hash.is_(None))
+            if result.last_id:
+                statement = statement.where(DesignItem.id > result.last_id)
+            items = session.exec(statement.order_by(DesignItem.id).limit(batch_size)).all()
+            if not items:
+                break
+
+            result.scanned += len(items)
+            result.last_id = items[-1].id
+            for item, thumbnail_hash in zip(items, executor.map(item_thumbnail, items), strict=True):
+                if thumbnail_hash is None:
+                    continue
+                # Unless a sprite request made it meanwhile
+                updated = session.exec(
+                    update(DesignItem)
+                    .where(DesignItem.id == item.id, DesignItem.thumbnail_hash.is_(None))
+                    .values(thumbnail_hash=thumbnail_hash)
+                )
+                result.made += updated.rowcount
+            session.commit()
+            logger.info(f"Made {result.made} thumbnails of {result.scanned} design items, last id {result.last_id}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Make thumbnails of design item previews")
+    parser.add_argument("--after", type=uuid.UUID, help="continue after this design item id")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    logger.info("Backfilling thumbnails")
+    with Session(engine) as session:
+        result = backfill(session, after=args.after, batch_size=args.batch_size, workers=args.workers)
+    logger.info(f"Made {result.made} thumbnails of {result.scanned} design items")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import logging
+
+from app import uploads
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logger.info("Purging stale upload sessions")
+    removed = uploads.purge_expired_sessions(
+        settings.UPLOAD_SESSION_EXPIRE_HOURS * 3600)
+    logger.info(f"Removed {removed} stale upload sessions")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import uuid
 import enum
+from typing import Literal
 
-from datetime import date
-from pydantic import EmailStr
+from datetime import date, datetime, timezone
+from pydantic import EmailStr, model_validator
 from sqlmodel import Field, Relationship, SQLModel
-from sqlalchemy import Index, text
+from sqlalchemy import REAL, BigInteger, DateTime, Index, SmallInteger, UniqueConstraint, text
 
 
 @enum.unique
@@ -27,6 +28,11 @@ class TagItemLink(SQLModel, table=True):
         foreign_key="designitem.id", primary_key=True)
     tag_id: uuid.UUID = Field(foreign_key="tag.id", primary_key=True)
 
+    # The primary key only serves lookups by item, this one serves "items with tag X"
+    __table_args__ = (
+        Index('ix_tagitemlink_tag_id_design_item_id', 'tag_id', 'design_item_id'),
+    )
+
 
 class UserCompanyLink(SQLModel, table=True):
     company_id: uuid.UUID = Field(
@@ -34,11 +40,50 @@ class UserCompanyLink(SQLModel, table=True):
     user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True)
     role: CompanyRole = CompanyRole.reader
 
+    # The primary key only serves lookups by company, this one serves "companies of user X"
+    __table_args__ = (
+        Index('ix_usercompanylink_user_id_company_id', 'user_id', 'company_id'),
+    )
+
 
 class UserCompanyLinkCreate(SQLModel):
     user_id: uuid.UUID
     role: CompanyRole = CompanyRole.reader
 
+
+# Employee to add or give a role in bulk, by user id or by email
+class EmployeeBulkEntry(SQLModel):
+    user_id: uuid.UUID | None = None
+    email: EmailStr | None = Field(default=None, max_length=255)
+    role: CompanyRole = CompanyRole.reader
+
+    @model_validator(mode="after")
+    def _user_id_or_email(self) -> "EmployeeBulkEntry":
+        if (self.user_id is None) == (self.email is None):
+            raise ValueError("Give either user_id or email")
+        return self
+
+
+class EmployeesBulkUpdate(SQLModel):
+    data: list[EmployeeBulkEntry]
+
+
+# Outcome of one entry, skipped ones say why in detail
+class EmployeeBulkResult(SQLModel):
+    user_id: uuid.UUID | None
+    email: str | None
+    role: CompanyRole
+    status: Literal["added", "updated", "unchanged", "skipped"]
+    detail: str | None = None
+
+
+class EmployeesBulkPublic(SQLModel):
+    data: list[EmployeeBulkResult]
+    added: int
+    updated: int
+    unchanged: int
+    skipped: int
+
 # User Model -------------------------------------------------
 
 # Shared properties
@@ -90,6 +135,15 @@ class User(UserBase, table=True):
     companies: list["Company"] = Relationship(
         back_populates="employee", link_model=UserCompanyLink)
 
+    # Serve the employee directory search: email prefixes and keyset order
+    # byte-wise on the lowercased email, name substrings by trigram (GIN).
+    # Reflection drops the collation, the spelled out opclass keeps
+    # autogenerate from recreating the index
+    __table_args__ = (
+        Index('ix_user_email_lower_c', text('lower(email) COLLATE "C" text_ops')),
+        Index('ix_user_full_name_trgm', text('full_name gin_trgm_ops'), postgresql_using='gin'),
+    )
+
 
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
@@ -105,9 +159,20 @@ class EmployeePublic(UserPublic):
     role: CompanyRole
 
 
+# Query string of the employee listing by email, filtered by email prefix,
+# a part of the full name and role
+class EmployeesQuery(SQLModel):
+    email: str | None = Field(default=None, max_length=255)
+    name: str | None = Field(default=None, max_length=255)
+    role: Literal["reader", "creator", "owner"] | None = None
+    cursor: str | None = None
+    limit: int = Field(default=100, ge=1, le=1000)
+
+
+# Keyset page of employees, pass next_cursor with the same filters to get the following page
 class EmployeesPublic(SQLModel):
     data: list[EmployeePublic]
-    count: int
+    next_cursor: str | None = None
 
 
 class EmployeeAccess(SQLModel):
@@ -203,6 +268,9 @@ class Company(CompanyBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     status: CompanyStatus = CompanyStatus.public
     is_deleted: bool = False
+    # None falls back to the COMPANY_QUOTA_* settings
+    quota_bytes: int | None = Field(default=None, sa_type=BigInteger)
+    quota_items: int | None = Field(default=None)
 
     employee: list["User"] = Relationship(
         back_populates="companies", link_model=UserCompanyLink, sa_relationship_kwargs={"lazy": "selectin"})
@@ -222,6 +290,56 @@ class CompanysPublic(SQLModel):
     count: int
 
 
+# Storage usage counters, maintained incrementally on upload and delete
+class CompanyUsage(SQLModel, table=True):
+    company_id: uuid.UUID = Field(
+        foreign_key="company.id", primary_key=True, ondelete="CASCADE")
+    bytes: int = Field(default=0, sa_type=BigInteger)
+    items: int = 0
+    previews: int = 0
+    # Bumped by every change to the counters or to the company's tag links,
+    # in-memory tag indexes compare it to find out they are stale
+    revision: int = Field(default=0, sa_type=BigInteger)
+
+
+class CompanyUsagePublic(SQLModel):
+    bytes: int = 0
+    items: int = 0
+    previews: int = 0
+    quota_bytes: int | None = None
+    quota_items: int | None = None
+
+
+class CompanyDetailPublic(CompanyPublic):
+    usage: CompanyUsagePublic
+
+
+# A company on the caller's home screen, with their role and its sizes
+class UserCompanyPublic(CompanyPublic):
+    status: CompanyStatus
+    role: CompanyRole
+    employee_count: int
+    tag_count: int
+    item_count: int
+
+
+# Query string of the caller's company listing
+class UserCompaniesQuery(SQLModel):
+    cursor: str | None = None
+    limit: int = Field(default=100, ge=1, le=1000)
+
+
+# Keyset page of the caller's companies by title, pass next_cursor to get the following page
+class UserCompaniesPublic(SQLModel):
+    data: list[UserCompanyPublic]
+    next_cursor: str | None = None
+
+
+class CompanyQuotaUpdate(SQLModel):
+    quota_bytes: int | None = Field(default=None, ge=0)
+    quota_items: int | None = Field(default=None, ge=0)
+
+
 # DesignItem Model -------------------------------------------------
 
 
@@ -251,18 +369,55 @@ class DesignItem(DesignItemBase, table=True):
         foreign_key="user.id", nullable=False)
     file_path: str = Field(min_length=1, max_length=511)
     preview_path: str = Field(min_length=1, max_length=255)
+    file_size: int = Field(default=0, sa_type=BigInteger)
+    # Codec the file is stored with, None for as uploaded. file_size is the
+    # size before compression. Also applies to the preview while it is the file
+    file_codec: str | None = Field(default=None, max_length=16)
     created_date: date = Field(default_factory=date.today)
+    # 64-bit dHash of the preview as a signed bigint, None when the preview
+    # isn't an image or wasn't hashed yet
+    perceptual_hash: int | None = Field(default=None, sa_type=BigInteger)
+    # Read from the preview's header, None when it isn't an image or wasn't
+    # inspected yet
+    image_width: int | None = None
+    image_height: int | None = None
+    image_aspect: float | None = None
+    image_format: str | None = Field(default=None, max_length=16)
+    image_mode: str | None = Field(default=None, max_length=16)
+    # sha256 of the cached thumbnail, "" when the preview isn't an image,
+    # None when no thumbnail was made yet
+    thumbnail_hash: str | None = Field(default=None, max_length=64)
 
     creator: User = Relationship(back_populates="design_items")
     company: Company = Relationship(back_populates="design_items")
     tags: list["Tag"] = Relationship(
         back_populates="design_items", link_model=TagItemLink)
 
+    # Serves company listings in keyset order and the image filters
+    __table_args__ = (
+        Index('ix_designitem_company_id_created_date_id',
+              'company_id', 'created_date', 'id'),
+        Index('ix_designitem_company_id_image_width',
+              'company_id', 'image_width'),
+        Index('ix_designitem_company_id_image_height',
+              'company_id', 'image_height'),
+        Index('ix_designitem_company_id_image_aspect',
+              'company_id', 'image_aspect'),
+        Index('ix_designitem_company_id_image_format_image_mode',
+              'company_id', 'image_format', 'image_mode'),
+    )
+
 
 # Properties to return via API, id is always required
 class DesignItemPublic(DesignItemBase):
     id: uuid.UUID
     creator_id: uuid.UUID
+    file_size: int
+    created_date: date
+    image_width: int | None = None
+    image_height: int | None = None
+    image_format: str | None = None
+    image_mode: str | None = None
 
 
 class DesignItemsPublic(SQLModel):
@@ -270,6 +425,226 @@ class DesignItemsPublic(SQLModel):
     count: int
 
 
+# Design item within `distance` differing bits of a perceptual hash
+class SimilarDesignItem(DesignItemPublic):
+    distance: int
+
+
+class SimilarDesignItemsPublic(SQLModel):
+    data: list[SimilarDesignItem]
+
+
+# Design item sharing tags with another one, score is the Jaccard
+# similarity of their tag sets
+class RelatedDesignItemPublic(DesignItemPublic):
+    score: float
+
+
+class RelatedDesignItemsPublic(SQLModel):
+    data: list[RelatedDesignItemPublic]
+
+
+# Finished upload, with already stored items that look the same
+class DesignItemUploaded(DesignItemPublic):
+    near_duplicates: list[SimilarDesignItem] = Field(default_factory=list)
+
+
+# Keyset page of design items, pass next_cursor to get the following page
+class DesignItemsPage(SQLModel):
+    data: list[DesignItemPublic]
+    next_cursor: str | None = None
+
+
+# Position of a thumbnail in a sprite sheet, in pixels
+class SpriteCell(SQLModel):
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class DesignItemInSprite(DesignItemPublic):
+    sprite: SpriteCell | None = None
+
+
+# Page of design items with their thumbnails packed into one image at
+# sprite_url, items without a thumbnail have no sprite cell
+class DesignItemsSpritePage(SQLModel):
+    data: list[DesignItemInSprite]
+    next_cursor: str | None = None
+    sprite_url: str | None = None
+
+
+# Filters of design item listing, tags_all / tags_any / tags_none are AND / OR / NOT.
+# Ranges are inclusive, any image filter leaves out items that aren't images
+class DesignItemFilter(SQLModel):
+    tags_all: list[uuid.UUID] = Field(default_factory=list)
+    tags_any: list[uuid.UUID] = Field(default_factory=list)
+    tags_none: list[uuid.UUID] = Field(default_factory=list)
+    created_from: date | None = None
+    created_to: date | None = None
+    creator_id: list[uuid.UUID] = Field(default_factory=list)
+    width_min: int | None = Field(default=None, ge=0)
+    width_max: int | None = Field(default=None, ge=0)
+    height_min: int | None = Field(default=None, ge=0)
+    height_max: int | None = Field(default=None, ge=0)
+    # Width / height, above 1 is landscape
+    aspect_min: float | None = Field(default=None, gt=0)
+    aspect_max: float | None = Field(default=None, gt=0)
+    image_format: list[str] = Field(default_factory=list)
+    image_mode: list[str] = Field(default_factory=list)
+
+
+# Query string of the design item listing, FastAPI only expands a model
+# into query parameters when it is the only one
+class DesignItemsQuery(DesignItemFilter):
+    cursor: str | None = None
+    limit: int = Field(default=100, ge=1, le=500)
+
+
+# Query string of the tag facets, counts over items matching the filter
+class DesignItemFacetsQuery(DesignItemFilter):
+    limit: int = Field(default=50, ge=1, le=1000)
+    approximate: bool = False
+
+
+# Selection of design items to export, by ids and/or by any of the tags
+class DesignItemExport(SQLModel):
+    ids: list[uuid.UUID] = Field(default_factory=list)
+    tag_ids: list[uuid.UUID] = Field(default_factory=list)
+
+
+# Tags to attach to and detach from a selection of design items
+class DesignItemTagsUpdate(SQLModel):
+    ids: list[uuid.UUID] = Field(min_length=1)
+    add: list[uuid.UUID] = Field(default_factory=list)
+    remove: list[uuid.UUID] = Field(default_factory=list)
+
+
+# Design items of the company among the ids, and links actually changed
+class DesignItemTagsResult(SQLModel):
+    items: int = 0
+    added: int = 0
+    removed: int = 0
+
+
+# DesignItemVersion Model -------------------------------------------------
+
+
+# One uploaded version of a design item, number 1 is the original upload
+class DesignItemVersion(SQLModel, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    design_item_id: uuid.UUID = Field(
+        foreign_key="designitem.id", nullable=False, ondelete="CASCADE")
+    number: int
+    creator_id: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+    filename: str = Field(min_length=1, max_length=180)
+    # Whole file stored with file_codec when base_number is None, otherwise
+    # a zstd patch that rebuilds it from version base_number. The latest
+    # version is also kept whole at DesignItem.file_path, which is this
+    # key when it is not a patch
+    file_path: str = Field(min_length=1, max_length=511)
+    file_size: int = Field(default=0, sa_type=BigInteger)
+    # Bytes in storage, looked up for compressed files when they are replaced
+    stored_size: int = Field(default=0, sa_type=BigInteger)
+    file_codec: str | None = Field(default=None, max_length=16)
+    base_number: int | None = None
+
+    __table_args__ = (
+        UniqueConstraint('design_item_id', 'number'),
+    )
+
+
+class DesignItemVersionPublic(SQLModel):
+    number: int
+    creator_id: uuid.UUID
+    created_at: datetime
+    filename: str
+    file_size: int
+    stored_size: int
+    is_delta: bool
+
+
+class DesignItemVersionsPublic(SQLModel):
+    data: list[DesignItemVersionPublic]
+
+
+# RelatedDesignItem Model -------------------------------------------------
+
+
+# Top RELATED_ITEMS_TOP_K design items of one by the Jaccard similarity of
+# their tag sets, rank 0 the closest. Written by app.jobs.related_items
+class RelatedDesignItem(SQLModel, table=True):
+    design_item_id: uuid.UUID = Field(
+        foreign_key="designitem.id", primary_key=True, ondelete="CASCADE")
+    rank: int = Field(primary_key=True, sa_type=SmallInteger)
+    # Indexed for the cascade when the related item is deleted
+    related_id: uuid.UUID = Field(
+        foreign_key="designitem.id", nullable=False, ondelete="CASCADE", index=True)
+    score: float = Field(sa_type=REAL)
+
+
+# Design item whose tags changed at the company revision, its related
+# items are recomputed by the next run of the job
+class RelatedDesignItemStale(SQLModel, table=True):
+    design_item_id: uuid.UUID = Field(
+        foreign_key="designitem.id", primary_key=True, ondelete="CASCADE")
+    revision: int = Field(sa_type=BigInteger)
+
+
+# Upload Model -------------------------------------------------
+
+
+# Properties to receive on upload session creation
+class UploadSessionCreate(DesignItemBase):
+    # Stored as {company_id}/{item_id}/{filename}, which has to fit preview_path
+    filename: str = Field(min_length=1, max_length=180)
+    size: int = Field(gt=0)
+    chunk_size: int | None = Field(default=None, gt=0)
+
+
+# Properties to receive on upload session creation for a new version of an item
+class VersionUploadCreate(SQLModel):
+    design_item_id: uuid.UUID
+    # Stored as {company_id}/{version_id}/{filename}
+    filename: str = Field(min_length=1, max_length=180)
+    size: int = Field(gt=0)
+    chunk_size: int | None = Field(default=None, gt=0)
+
+
+# Properties to receive on direct (presigned) upload creation
+class DirectUploadCreate(DesignItemBase):
+    filename: str = Field(min_length=1, max_length=180)
+    size: int = Field(gt=0)
+
+
+# Presigned PUT url, the token is handed back to complete the upload
+class DirectUploadPublic(SQLModel):
+    url: str
+    method: str = "PUT"
+    key: str
+    token: str
+    expires_in: int
+
+
+class DirectUploadComplete(SQLModel):
+    token: str
+
+
+# Upload session state, received is a list of [start, end) byte ranges
+class UploadSessionPublic(SQLModel):
+    id: uuid.UUID
+    filename: str
+    size: int
+    chunk_size: int
+    chunk_count: int
+    received: list[tuple[int, int]]
+    complete: bool
+
+
 # Tag Model -------------------------------------------------
 
 
@@ -295,6 +670,8 @@ class Tag(TagBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     company_id: uuid.UUID = Field(
         foreign_key="company.id", nullable=False, ondelete="CASCADE")
+    # Design items with the tag, kept in step with its links by every write
+    usage_count: int = 0
 
     company: Company = Relationship(back_populates="tags")
     design_items: list["DesignItem"] = Relationship(
@@ -302,6 +679,12 @@ class Tag(TagBase, table=True):
 
     __table_args__ = (
         Index('idx_tag_title_lower', text('LOWER(title)'), unique=True),
+        # Company listings in keyset order by title
+        Index('ix_tag_company_id_title_id', 'company_id', 'title', 'id'),
+        # Prefix matches, LIKE 'abc%' on lower(title) whatever the collation
+        Index('ix_tag_company_id_title_lower_pattern', 'company_id', text('lower(title) text_pattern_ops')),
+        # Company listings in keyset order, most used first
+        Index('ix_tag_company_id_usage_count_id', 'company_id', text('usage_count DESC'), 'id'),
     )
 
 # Properties to return via API, id is always required
@@ -309,7 +692,95 @@ class Tag(TagBase, table=True):
 
 class TagPublic(TagBase):
     id: uuid.UUID
+    usage_count: int = 0
+
+
+class TagFacet(SQLModel):
+    id: uuid.UUID
+    title: str
+    count: int
+
+
+class TagFacetsPublic(SQLModel):
+    data: list[TagFacet]
+    approximate: bool = False
+
+
+# Query string of the company tag listing, by title or most used first
+class TagsQuery(SQLModel):
+    sort: Literal["title", "usage"] = "title"
+    cursor: str | None = None
+    limit: int = Field(default=100, ge=1, le=1000)
+
+
+# Tags to create at once, titles that exist are updated or left alone
+class TagsBulkCreate(SQLModel):
+    data: list[TagCreate]
+    on_conflict: Literal["update", "skip"] = "skip"
+
+
+# Outcome of one entry, skipped tags have an id when they are the company's
+class TagBulkResult(SQLModel):
+    id: uuid.UUID | None
+    title: str
+    status: Literal["created", "updated", "skipped"]
+
+
+class TagsBulkPublic(SQLModel):
+    data: list[TagBulkResult]
+    created: int
+    updated: int
+    skipped: int
+
+
+# Tags to merge into another one, their links move to it and they are deleted
+class TagMerge(SQLModel):
+    source_ids: list[uuid.UUID] = Field(min_length=1, max_length=100)
+
+
+# Progress of a merge after each batch of links, duplicates are links
+# dropped as their design item already had the target tag
+class TagMergeProgress(SQLModel):
+    total: int
+    moved: int = 0
+    duplicates: int = 0
+    done: bool = False
+
+
+class TagCompletion(SQLModel):
+    id: uuid.UUID
+    title: str
+    usage: int
+
+
+# Most used tags starting with a prefix
+class TagCompletionsPublic(SQLModel):
+    data: list[TagCompletion]
+
+
+class TagSuggestion(SQLModel):
+    id: uuid.UUID
+    title: str
+    count: int
+
+
+# Tags most often on the same design items as the given ones
+class TagSuggestionsPublic(SQLModel):
+    data: list[TagSuggestion]
 
 
+# Keyset page of tags, pass next_cursor with the same sort to get the following page
 class TagsPublic(SQLModel):
     data: list[TagPublic]
+    next_cursor: str | None = None
+
+
+# What a company page opens with: the company, the caller's role, counts
+# and the first page of tags and of employees
+class CompanyOverviewPublic(SQLModel):
+    company: CompanyDetailPublic
+    role: CompanyRole | None = None
+    employee_count: int
+    tag_count: int
+    tags: TagsPublic
+    employees: EmployeesPublic
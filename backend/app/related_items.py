@@ -0,0 +1,161 @@
+import uuid
+
+import numpy as np
+from sqlalchemy import Text, cast, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import noload
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.models import DesignItem, RelatedDesignItem, RelatedDesignItemPublic, Tag, TagItemLink
+
+# Item pairs counted at once, bounds the temporary arrays
+CHUNK_PAIRS = 1_000_000
+# Pairs whose common tags are looked up in the bitsets at once
+CHUNK_BITSETS = 65_536
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    The positions start to start + length of every range, one after another.
+    """
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class TagSets:
+    """
+    Tag sets of a company's tagged design items, to find the most similar
+    ones by Jaccard similarity: shared tags over tags of either.
+
+    Candidates come from a sparse product with the inverted lists of the
+    tags, items[tag_start[t]:tag_start[t + 1]] for tag t, leaving out
+    tags on more than RELATED_ITEMS_MAX_TAG_ITEMS items, whose lists would
+    pair up most of the company. Those are kept as a bitset per item
+    instead, and their share is added to the candidates found otherwise.
+    The scores found are exact, but items sharing only common tags are
+    never paired, so the top lists are approximate.
+    """
+
+    def __init__(self, ids: list[uuid.UUID], lengths: np.ndarray, tags: np.ndarray) -> None:
+        self.ids = ids
+        self.ordinal_of = {item_id: ordinal for ordinal, item_id in enumerate(ids)}
+        self.size = len(ids)
+        self.lengths = lengths
+        items = np.repeat(np.arange(self.size, dtype=np.int32), lengths)
+        tag_sizes = np.bincount(tags)
+        common = tag_sizes > settings.RELATED_ITEMS_MAX_TAG_ITEMS
+        in_common = common[tags]
+
+        columns = (np.cumsum(common) - 1)[tags[in_common]]
+        self.bitsets = np.zeros((self.size, (int(common.sum()) + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(self.bitsets, (items[in_common], columns >> 3), (1 << (columns & 7)).astype(np.uint8))
+
+        # Links of the other tags, by item then by tag
+        self.link_tags = tags[~in_common]
+        self.link_counts = np.bincount(items[~in_common], minlength=self.size)
+        self.link_starts = np.cumsum(self.link_counts) - self.link_counts
+        self.items = items[~in_common][np.argsort(self.link_tags, kind="stable")]
+        self.tag_sizes = np.bincount(self.link_tags, minlength=len(tag_sizes))
+        self.tag_starts = np.cumsum(self.tag_sizes) - self.tag_sizes
+        # Pairs generated per item, as a running total over its links
+        self.link_pairs = np.concatenate([[0], np.cumsum(self.tag_sizes[self.link_tags])])
+
+    @classmethod
+    def load(cls, session: Session, company_id: uuid.UUID) -> "TagSets":
+        # Tag ordinals numbered by Postgres, with the item ids, their
+        # number of tags and the ordinals of each item after another in
+        # three strings, all in item id order
+        ordinals = (
+            select(Tag.id, (func.row_number().over(order_by=Tag.id) - 1).label("ordinal"))
+            .where(Tag.company_id == company_id)
+            .subquery()
+        )
+        items = (
+            select(TagItemLink.design_item_id.label("id"),
+                   func.count().label("length"),
+                   func.string_agg(cast(ordinals.c.ordinal, Text), ",").label("ordinals"))
+            .select_from(TagItemLink)
+            .join(ordinals, ordinals.c.id == TagItemLink.tag_id)
+            .group_by(TagItemLink.design_item_id)
+            .subquery()
+        )
+        ids_text, lengths_text, ordinals_text = session.exec(
+            select(*(func.string_agg(column, aggregate_order_by(literal(","), items.c.id))
+                     for column in (cast(items.c.id, Text), cast(items.c.length, Text), items.c.ordinals)))
+        ).one()
+        ids = [uuid.UUID(item_id) for item_id in ids_text.split(",")] if ids_text else []
+        return cls(ids,
+                   np.fromstring(lengths_text or "", dtype=np.int64, sep=","),
+                   np.fromstring(ordinals_text or "", dtype=np.int32, sep=","))
+
+    def _shared(self, chunk: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Items sharing a tag other than the common ones with those of the
+        chunk, as (item, other, shared tags) sorted by item then other.
+        """
+        counts = self.link_counts[chunk]
+        tags = self.link_tags[_ranges(self.link_starts[chunk], counts)]
+        sizes = self.tag_sizes[tags]
+        left = np.repeat(np.repeat(chunk, counts).astype(np.int64), sizes)
+        right = self.items[_ranges(self.tag_starts[tags], sizes)]
+        keep = left != right
+        keys, shared = np.unique(left[keep] * self.size + right[keep], return_counts=True)
+        left, right = keys // self.size, keys % self.size
+        for start in range(0, len(keys) if self.bitsets.shape[1] else 0, CHUNK_BITSETS):
+            window = slice(start, start + CHUNK_BITSETS)
+            common = np.bitwise_count(self.bitsets[left[window]] & self.bitsets[right[window]])
+            shared[window] += common.sum(axis=1, dtype=shared.dtype)
+        return left, right, shared
+
+    def top(self, ordinals: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Top k most similar items of each given item, as (item, rank,
+        related item, score) arrays sorted by item and rank. Ties are
+        ranked in item id order.
+        """
+        ordinals = np.unique(ordinals)
+        pairs = self.link_pairs[self.link_starts[ordinals] + self.link_counts[ordinals]] \
+            - self.link_pairs[self.link_starts[ordinals]]
+        cumulative_pairs = np.cumsum(pairs)
+        found = []
+        first = 0
+        while first < len(ordinals):
+            done = cumulative_pairs[first - 1] if first else 0
+            last = max(int(np.searchsorted(cumulative_pairs, done + CHUNK_PAIRS, side="right")), first + 1)
+            left, right, shared = self._shared(ordinals[first:last])
+            scores = shared / (self.lengths[left] + self.lengths[right] - shared)
+            # Pairs come sorted by item then other, two stable sorts rank
+            # them by score within each item in far less time than lexsort.
+            # Ordinals follow the ids, so do ties
+            order = np.argsort(-scores, kind="stable")
+            order = order[np.argsort(left[order], kind="stable")]
+            left, right, scores = left[order], right[order], scores[order]
+            starts = np.flatnonzero(np.concatenate([[True], left[1:] != left[:-1]])) if len(left) else order
+            ranks = np.arange(len(left)) - np.repeat(starts, np.diff(np.append(starts, len(left))))
+            keep = ranks < k
+            found.append((left[keep], ranks[keep], right[keep], scores[keep]))
+            first = last
+        if not found:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, np.zeros(0)
+        left, ranks, right, scores = (np.concatenate(arrays) for arrays in zip(*found))
+        return left, ranks, right, scores
+
+
+def find_related(
+    *, session: Session, design_item_id: uuid.UUID, limit: int
+) -> list[RelatedDesignItemPublic]:
+    """
+    Related design items as of the last run of app.jobs.related_items,
+    closest first, one range of the primary key.
+    """
+    rows = session.exec(
+        select(DesignItem, RelatedDesignItem.score)
+        .join(RelatedDesignItem, RelatedDesignItem.related_id == DesignItem.id)
+        .where(RelatedDesignItem.design_item_id == design_item_id)
+        .order_by(RelatedDesignItem.rank)
+        .limit(limit)
+        .options(noload(DesignItem.creator), noload(DesignItem.company), noload(DesignItem.tags))
+    ).all()
+    return [RelatedDesignItemPublic.model_validate(item, update={"score": score}) for item, score in rows]
@@ -0,0 +1,229 @@
+import logging
+import uuid
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import cast, literal
+from sqlalchemy.dialects.postgresql import BIT, aggregate_order_by
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.image_info import open_preview
+from app.index_cache import CompanyIndex, IndexCache
+from app.models import CompanyUsage, DesignItem, SimilarDesignItem
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+HASH_MASK = (1 << HASH_SIZE * HASH_SIZE) - 1
+# Design item ids as raw uuid bytes, void keeps trailing NUL bytes
+ID_DTYPE = np.dtype("V16")
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Difference hash of an image as a signed 64-bit int.
+
+    Bit i is set when pixel i of a 9x8 grayscale thumbnail is brighter
+    than its right neighbour, so re-encoding, rescaling and small color
+    shifts flip only a few bits. Transparency is flattened onto white.
+    """
+    # JPEG can decode straight at a fraction of the size
+    image.draft(None, (HASH_SIZE * 16, HASH_SIZE * 16))
+    image.thumbnail((256, 256))
+    if "A" in image.getbands() or "transparency" in image.info:
+        image = image.convert("RGBA")
+        image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image)
+    gray = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = np.packbits(pixels[:, :-1] > pixels[:, 1:])
+    return int.from_bytes(bits.tobytes(), "big", signed=True)
+
+
+def preview_hash(key: str, size: int, codec: str | None = None) -> int | None:
+    """
+    dHash of a stored preview, None when it isn't an image Pillow reads
+    or is larger than SIMILARITY_HASH_MAX_BYTES.
+    """
+    image = open_preview(key, size, codec)
+    return dhash(image) if image else None
+
+
+class HashIndex(CompanyIndex):
+    """
+    Perceptual hashes of one company's design items.
+
+    A flat int64 array searched with vectorized XOR and popcount, a scan
+    of 1M hashes takes a few milliseconds and, unlike a BK-tree, doesn't
+    degrade for larger distances. Items created after the build are kept
+    in a small tail, deleted ones are masked, both until the next rebuild.
+    """
+
+    def __init__(self, revision: int, ids: np.ndarray, hashes: np.ndarray) -> None:
+        super().__init__(revision)
+        self.ids = ids
+        self.hashes = hashes
+        self.size = len(ids)
+        self.tail: dict[uuid.UUID, int] = {}
+        self.dead: set[int] = set()
+
+    @classmethod
+    def build(cls, session: Session, company_id: uuid.UUID, batch_size: int = 100_000) -> "HashIndex":
+        revision = session.exec(
+            select(CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first() or 0
+        # Postgres packs each batch into two bytea values, far cheaper than
+        # a Python object per row
+        ids, hashes, last_id = [], [], None
+        while True:
+            batch = (
+                select(DesignItem.id, DesignItem.perceptual_hash)
+                .where(DesignItem.company_id == company_id, DesignItem.perceptual_hash.is_not(None))
+                .order_by(DesignItem.id)
+                .limit(batch_size)
+            )
+            if last_id:
+                batch = batch.where(DesignItem.id > last_id)
+            rows = batch.subquery()
+            packed_ids, packed_hashes = session.exec(select(
+                func.string_agg(func.uuid_send(rows.c.id), aggregate_order_by(literal(b""), rows.c.id)),
+                func.string_agg(func.int8send(rows.c.perceptual_hash), aggregate_order_by(literal(b""), rows.c.id)),
+            )).one()
+            if not packed_ids:
+                break
+            ids.append(packed_ids)
+            hashes.append(packed_hashes)
+            last_id = uuid.UUID(bytes=packed_ids[-16:])
+        return cls(
+            revision,
+            np.frombuffer(b"".join(ids), dtype=ID_DTYPE),
+            np.frombuffer(b"".join(hashes), dtype=">i8").astype(np.int64),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.hashes.nbytes + 100 * (len(self.tail) + len(self.dead))
+
+    def search(
+        self, perceptual_hash: int, max_distance: int, limit: int, exclude: uuid.UUID | None = None
+    ) -> list[tuple[uuid.UUID, int]]:
+        """
+        (id, distance) of items within `max_distance` bits, closest first.
+        """
+        with self.lock:
+            distances = np.bitwise_count((self.hashes ^ np.int64(perceptual_hash)).view(np.uint64))
+            positions = np.flatnonzero(distances <= max_distance)
+            found = [(uuid.UUID(bytes=bytes(self.ids[position])), int(distances[position]))
+                     for position in positions if position not in self.dead]
+            for item_id, tail_hash in self.tail.items():
+                distance = ((tail_hash ^ perceptual_hash) & HASH_MASK).bit_count()
+                if distance <= max_distance:
+                    found.append((item_id, distance))
+        found = [(item_id, distance) for item_id, distance in found if item_id != exclude]
+        found.sort(key=lambda match: (match[1], match[0]))
+        return found[:limit]
+
+    def add_item(self, item_id: uuid.UUID, perceptual_hash: int | None) -> bool:
+        if perceptual_hash is not None:
+            self.tail[item_id] = perceptual_hash
+            self.size += 1
+        return True
+
+    def remove_item(self, item_id: uuid.UUID) -> bool:
+        if self.tail.pop(item_id, None) is None:
+            self.dead.update(np.flatnonzero(self.ids == np.void(item_id.bytes)).tolist())
+        return True
+
+
+class HashIndexCache(IndexCache[HashIndex]):
+    name = "hash index"
+
+    def load(self, session: Session, company_id: uuid.UUID) -> HashIndex:
+        return HashIndex.build(session, company_id)
+
+    @property
+    def max_bytes(self) -> int:
+        return settings.SIMILARITY_INDEX_MAX_BYTES
+
+    @property
+    def max_changes(self) -> int:
+        return settings.SIMILARITY_INDEX_MAX_CHANGES
+
+
+hash_indexes = HashIndexCache()
+
+
+def _search_sql(
+    session: Session, company_id: uuid.UUID, perceptual_hash: int, max_distance: int, limit: int,
+    exclude: uuid.UUID | None,
+) -> list[tuple[uuid.UUID, int]]:
+    distance = func.bit_count(cast(DesignItem.perceptual_hash.op("#")(perceptual_hash), BIT(64)))
+    statement = (
+        select(DesignItem.id, distance)
+        .where(DesignItem.company_id == company_id, distance <= max_distance)
+        .order_by(distance, DesignItem.id)
+        .limit(limit)
+    )
+    if exclude:
+        statement = statement.where(DesignItem.id != exclude)
+    return [(item_id, int(item_distance)) for item_id, item_distance in session.exec(statement)]
+
+
+def find_similar(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    perceptual_hash: int,
+    max_distance: int,
+    limit: int = 20,
+    exclude: uuid.UUID | None = None,
+) -> list[SimilarDesignItem]:
+    """
+    Company design items whose preview hash is within `max_distance` bits.
+
+    Large companies are searched in their in-memory hash index once it is
+    built, even up to INDEX_REBUILD_MIN_SECONDS behind other processes'
+    uploads, everything else is a scan in SQL.
+    """
+    matches = None
+    if settings.SIMILARITY_INDEX_MAX_BYTES:
+        usage = session.exec(
+            select(CompanyUsage.items, CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first()
+        if usage is not None and usage.items >= settings.SIMILARITY_INDEX_MIN_ITEMS:
+            # A few seconds behind is fine for a warning, keeps other
+            # workers' uploads from sending every check to SQL
+            index = hash_indexes.get_recent(company_id, usage.revision, settings.INDEX_REBUILD_MIN_SECONDS)
+            if index is not None:
+                matches = index.search(perceptual_hash, max_distance, limit, exclude)
+    if matches is None:
+        matches = _search_sql(session, company_id, perceptual_hash, max_distance, limit, exclude)
+    if not matches:
+        return []
+    items = {item.id: item for item in session.exec(
+        select(DesignItem).where(DesignItem.id.in_([item_id for item_id, _ in matches])))}
+    return [SimilarDesignItem.model_validate(items[item_id], update={"distance": distance})
+            for item_id, distance in matches if item_id in items]
+
+
+def item_added(company_id: uuid.UUID, revision: int | None, item_id: uuid.UUID, perceptual_hash: int | None) -> None:
+    if settings.SIMILARITY_INDEX_MAX_BYTES:
+        hash_indexes.apply(company_id, revision, lambda index: index.add_item(item_id, perceptual_hash))
+
+
+def item_removed(company_id: uuid.UUID, revision: int | None, item_id: uuid.UUID) -> None:
+    if settings.SIMILARITY_INDEX_MAX_BYTES:
+        hash_indexes.apply(company_id, revision, lambda index: index.remove_item(item_id))
+
+
+def item_changed(company_id: uuid.UUID, revision: int | None, item_id: uuid.UUID, perceptual_hash: int | None) -> None:
+    if settings.SIMILARITY_INDEX_MAX_BYTES:
+        hash_indexes.apply(
+            company_id, revision, lambda index: index.remove_item(item_id) and index.add_item(item_id, perceptual_hash))
+
+
+def revision_changed(company_id: uuid.UUID, revision: int | None) -> None:
+    """
+    Move the index past a committed change that doesn't touch hashes,
+    e.g. tag links, so it isn't rebuilt for nothing.
+    """
+    if settings.SIMILARITY_INDEX_MAX_BYTES:
+        hash_indexes.apply(company_id, revision, lambda index: True)
@@ -0,0 +1,30 @@
+from functools import lru_cache
+
+from app.core.config import settings
+from app.storage.base import Storage, StoredObject
+
+__all__ = ["Storage", "StoredObject", "create_storage", "get_storage"]
+
+
+def create_storage(backend: str) -> Storage:
+    if backend == "local":
+        from app.storage.local import LocalStorage
+
+        return LocalStorage(settings.MEDIA_ROOT)
+    if backend == "s3":
+        from app.storage.s3 import S3Storage
+
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            public_endpoint_url=settings.S3_PUBLIC_ENDPOINT_URL,
+            access_key=settings.S3_ACCESS_KEY,
+            secret_key=settings.S3_SECRET_KEY,
+            region=settings.S3_REGION,
+        )
+    raise ValueError(f"Unknown storage backend {backend!r}")
+
+
+@lru_cache
+def get_storage() -> Storage:
+    return create_storage(settings.STORAGE_BACKEND)
@@ -0,0 +1,95 @@
+import hashlib
+import re
+import unicodedata
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+from urllib.parse import quote
+
+from app.storage.compression import decode
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def content_disposition(filename: str) -> str:
+    """
+    Content-Disposition of a download saved as filename, whatever it holds.
+
+    Headers are sent as latin-1, so the name goes in RFC 5987 filename*
+    with an ASCII filename as the fallback for older clients.
+    """
+    fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode()
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', "_", fallback).strip()
+    # Names in other scripts keep only their extension
+    stem, dot, extension = fallback.rpartition(".")
+    if not (stem if dot else extension).strip(" _."):
+        fallback = f"download{dot}{extension if dot else ''}"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+@dataclass
+class StoredObject:
+    key: str
+    size: int
+    mtime: float
+
+
+class Storage(ABC):
+    """
+    Blob storage addressed by keys such as DesignItem.file_path.
+
+    Drivers that can hand out presigned URLs let clients move bytes directly
+    to and from the store, the others return None and the API streams.
+    """
+
+    name: str
+
+    @abstractmethod
+    def put_file(self, key: str, path: Path) -> None:
+        """
+        Store a local file under key, the source file is consumed.
+        """
+
+    @abstractmethod
+    def put_stream(self, key: str, stream: BinaryIO) -> None:
+        pass
+
+    @abstractmethod
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        pass
+
+    def iter_content(self, key: str, codec: str | None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Original content of an object stored with codec, see DesignItem.file_codec.
+        """
+        return decode(self.iter_chunks(key, chunk_size), codec, chunk_size)
+
+    @abstractmethod
+    def stat(self, key: str) -> StoredObject | None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def iter_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        """
+        Iterate over stored objects in key order.
+        """
+
+    def presigned_put_url(self, key: str, expires_in: int) -> str | None:  # noqa: ARG002
+        return None
+
+    def presigned_get_url(  # noqa: ARG002
+        self, key: str, expires_in: int, filename: str | None = None, content_encoding: str | None = None
+    ) -> str | None:
+        return None
+
+    def checksum(self, key: str) -> str:
+        digest = hashlib.sha256()
+        for chunk in self.iter_chunks(key):
+            digest.update(chunk)
+        return digest.hexdigest()
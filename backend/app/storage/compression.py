@@ -0,0 +1,85 @@
+import os
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import zstandard
+
+from app.core.config import settings
+
+ZSTD = "zstd"
+CODECS = {ZSTD}
+# Start of a file compressed on trial to decide whether the rest is worth it
+SAMPLE_BYTES = 256 * 1024
+# Files whose sample doesn't shrink below this share of its size stay raw
+MAX_RATIO = 0.8
+
+
+class ChunkReader:
+    """
+    File-like view of a chunk stream, for zstandard's stream reader and
+    Storage.put_stream. on_chunk sees every chunk as it is read, to hash
+    the stream for example.
+    """
+
+    def __init__(self, chunks: Iterator[bytes], on_chunk: Callable[[bytes], object] | None = None) -> None:
+        self.chunks = chunks
+        self.on_chunk = on_chunk
+        self.buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            if self.on_chunk:
+                self.on_chunk(chunk)
+            self.buffer += chunk
+        if size < 0:
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def choose_codec(sample: bytes) -> str | None:
+    """
+    zstd when the start of a file compresses well, None for content that is
+    compressed already, whatever its extension: JPEG, PNG, ZIP based
+    formats and PDFs with compressed streams.
+    """
+    if not settings.STORAGE_COMPRESSION or not sample:
+        return None
+    compressed = zstandard.ZstdCompressor(level=1).compress(sample)
+    return ZSTD if len(compressed) <= len(sample) * MAX_RATIO else None
+
+
+def compress_file(path: Path) -> str | None:
+    """
+    Compress a file in place when it is worth it, returns the codec used.
+    """
+    with open(path, "rb") as f:
+        codec = choose_codec(f.read(SAMPLE_BYTES))
+        if codec is None:
+            return None
+        f.seek(0)
+        compressed = path.with_name(f"{path.name}.{codec}")
+        with open(compressed, "wb") as out:
+            zstandard.ZstdCompressor(level=settings.STORAGE_COMPRESSION_LEVEL).copy_stream(
+                f, out, size=os.fstat(f.fileno()).st_size)
+    os.replace(compressed, path)
+    return codec
+
+
+def decode(chunks: Iterator[bytes], codec: str | None, chunk_size: int) -> Iterator[bytes]:
+    """
+    Original content of a stored object, in chunks of chunk_size at most
+    however well it compressed.
+    """
+    if codec is None:
+        yield from chunks
+        return
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}")
+    with zstandard.ZstdDecompressor().stream_reader(ChunkReader(chunks)) as reader:
+        while data := reader.read(chunk_size):
+            yield data
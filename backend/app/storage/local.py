@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+from app.storage.base import CHUNK_SIZE, Storage, StoredObject
+
+
+class LocalStorage(Storage):
+    name = "local"
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Key {key!r} is outside of the storage root")
+        return path
+
+    def put_file(self, key: str, path: Path) -> None:
+        destination = self.path(key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(path, destination)
+        except OSError:
+            # Different filesystem, shutil uses sendfile / copy_file_range
+            shutil.move(path, destination)
+
+    def put_stream(self, key: str, stream: BinaryIO) -> None:
+        destination = self.path(key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Write next to the destination so readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=destination.parent, prefix=".", delete=False) as f:
+            try:
+                shutil.copyfileobj(stream, f, CHUNK_SIZE)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, destination)
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def stat(self, key: str) -> StoredObject | None:
+        try:
+            st = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(key=key, size=st.st_size, mtime=st.st_mtime)
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def iter_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        yield from self._walk(self.root, "", prefix)
+
+    def _walk(self, directory: Path, base: str, prefix: str) -> Iterator[StoredObject]:
+        try:
+            # Directories sort as "name/" so the walk yields keys in key order
+            entries = sorted(
+                os.scandir(directory),
+                key=lambda e: f"{e.name}/" if e.is_dir(follow_symlinks=False) else e.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            # Dot entries hold in-progress data such as upload sessions
+            if entry.name.startswith("."):
+                continue
+            key = f"{base}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                if key.startswith(prefix[:len(key)]):
+                    yield from self._walk(Path(entry.path), f"{key}/", prefix)
+            elif key.startswith(prefix):
+                st = entry.stat()
+                yield StoredObject(key=key, size=st.st_size, mtime=st.st_mtime)
@@ -0,0 +1,91 @@
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from app.storage.base import CHUNK_SIZE, Storage, StoredObject, content_disposition
+
+
+class S3Storage(Storage):
+    """
+    S3 compatible object storage (AWS S3, MinIO, ...).
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        *,
+        bucket: str,
+        endpoint_url: str | None = None,
+        public_endpoint_url: str | None = None,
+        access_key: str | None = None,
+        secret_key: str | None = None,
+        region: str | None = None,
+    ) -> None:
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = bucket
+        options: dict[str, Any] = {
+            "aws_access_key_id": access_key,
+            "aws_secret_access_key": secret_key,
+            "region_name": region,
+            "config": Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        }
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, **options)
+        # Presigned URLs are signed for the host the clients will talk to
+        self.presign_client = self.client
+        if public_endpoint_url and public_endpoint_url != endpoint_url:
+            self.presign_client = boto3.client(
+                "s3", endpoint_url=public_endpoint_url, **options)
+
+    def put_file(self, key: str, path: Path) -> None:
+        # upload_file switches to multipart uploads for large files
+        self.client.upload_file(str(path), self.bucket, key)
+        path.unlink()
+
+    def put_stream(self, key: str, stream: BinaryIO) -> None:
+        self.client.upload_fileobj(stream, self.bucket, key)
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def stat(self, key: str) -> StoredObject | None:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return StoredObject(key=key, size=head["ContentLength"], mtime=head["LastModified"].timestamp())
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def iter_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        # ListObjectsV2 returns keys in UTF-8 binary order
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield StoredObject(key=obj["Key"], size=obj["Size"], mtime=obj["LastModified"].timestamp())
+
+    def presigned_put_url(self, key: str, expires_in: int) -> str | None:
+        return self.presign_client.generate_presigned_url(
+            "put_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_in)
+
+    def presigned_get_url(
+        self, key: str, expires_in: int, filename: str | None = None, content_encoding: str | None = None
+    ) -> str | None:
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        if content_encoding:
+            params["ResponseContentEncoding"] = content_encoding
+        return self.presign_client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires_in)
@@ -0,0 +1,194 @@
+import bisect
+import sys
+import uuid
+
+import numpy as np
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.index_cache import CompanyIndex, IndexCache
+from app.models import CompanyUsage, Tag, TagCompletion
+
+# Sorts after any other character, by code point as by UTF-8 bytes
+MAX_CHAR = "\U0010ffff"
+# Tags saved at once beyond which the index is rebuilt instead, each one
+# moves the tail of the arrays
+MAX_SAVED_TAGS = 100
+
+
+class TagPrefixIndex(CompanyIndex):
+    """
+    One company's tags sorted by lowercase title, with their usage counts.
+
+    The tags starting with a prefix are a contiguous run found with two
+    binary searches, the most used of them are picked with a partial sort
+    of their counts. Tags are inserted and removed in place, which moves
+    the tail of the arrays, cheap next to a rebuild for a few changes.
+    """
+
+    def __init__(self, revision: int, keys: list[str], ids: list[uuid.UUID], titles: list[str], usage: np.ndarray) -> None:
+        super().__init__(revision)
+        self.keys = keys
+        self.ids = ids
+        self.titles = titles
+        self.usage = usage
+        self.size = len(keys)
+        self.key_of = dict(zip(ids, keys))
+
+    @classmethod
+    def build(cls, session: Session, company_id: uuid.UUID) -> "TagPrefixIndex":
+        revision = session.exec(
+            select(CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first() or 0
+        rows = sorted(
+            (title.lower(), tag_id, title, count)
+            for tag_id, title, count in session.exec(
+                select(Tag.id, Tag.title, Tag.usage_count).where(Tag.company_id == company_id))
+        )
+        return cls(
+            revision,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            np.array([row[3] for row in rows], dtype=np.int64),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        # Per tag: two short strings, a UUID, list and dict slots
+        per_tag = 2 * sys.getsizeof("") + sys.getsizeof(uuid.UUID(int=0)) + 3 * 8 + 100
+        return self.usage.nbytes + sum(map(len, self.titles)) * 2 + per_tag * self.size
+
+    def complete(self, prefix: str, limit: int) -> list[TagCompletion]:
+        """
+        Tags whose lowercase title starts with prefix, most used first,
+        then by title.
+        """
+        prefix = prefix.lower()
+        with self.lock:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + MAX_CHAR, start)
+            usage = self.usage[start:end]
+            # One sortable int per tag, usage descending then position
+            order = np.arange(len(usage), dtype=np.int64) - usage * max(len(usage), 1)
+            if len(order) > limit:
+                positions = np.argpartition(order, limit - 1)[:limit]
+                positions = positions[np.argsort(order[positions])]
+            else:
+                positions = np.argsort(order)
+            return [TagCompletion(id=self.ids[start + position], title=self.titles[start + position],
+                                  usage=int(usage[position])) for position in positions.tolist()]
+
+    def _remove(self, tag_id: uuid.UUID) -> int:
+        key = self.key_of.pop(tag_id, None)
+        if key is None:
+            return 0
+        position = bisect.bisect_left(self.keys, key)
+        del self.keys[position], self.ids[position], self.titles[position]
+        count = int(self.usage[position])
+        self.usage = np.delete(self.usage, position)
+        self.size -= 1
+        return count
+
+    def save_tags(self, tags: dict[uuid.UUID, str]) -> bool:
+        if len(tags) > MAX_SAVED_TAGS:
+            return False
+        for tag_id, title in tags.items():
+            count = self._remove(tag_id)
+            key = title.lower()
+            position = bisect.bisect_left(self.keys, key)
+            self.keys.insert(position, key)
+            self.ids.insert(position, tag_id)
+            self.titles.insert(position, title)
+            self.usage = np.insert(self.usage, position, count)
+            self.key_of[tag_id] = key
+            self.size += 1
+        return True
+
+    def remove_tags(self, tag_ids: list[uuid.UUID]) -> bool:
+        for tag_id in tag_ids:
+            self._remove(tag_id)
+        return True
+
+    def add_usage(self, counts: dict[uuid.UUID, int]) -> bool:
+        for tag_id, count in counts.items():
+            key = self.key_of.get(tag_id)
+            if key is not None:
+                self.usage[bisect.bisect_left(self.keys, key)] += count
+        return True
+
+
+class TagPrefixIndexCache(IndexCache[TagPrefixIndex]):
+    name = "tag prefix index"
+
+    def load(self, session: Session, company_id: uuid.UUID) -> TagPrefixIndex:
+        return TagPrefixIndex.build(session, company_id)
+
+    @property
+    def max_bytes(self) -> int:
+        return settings.TAG_COMPLETION_INDEX_MAX_BYTES
+
+    @property
+    def max_changes(self) -> int:
+        return settings.TAG_COMPLETION_INDEX_MAX_CHANGES
+
+
+prefix_indexes = TagPrefixIndexCache()
+
+
+def _complete_sql(session: Session, company_id: uuid.UUID, prefix: str, limit: int) -> list[TagCompletion]:
+    # A byte-wise range on lower(title) rather than LIKE, so prepared
+    # statements with a generic plan still scan the text_pattern_ops index
+    key = func.lower(Tag.title)
+    prefix = prefix.lower()
+    rows = session.exec(
+        select(Tag.id, Tag.title, Tag.usage_count)
+        .where(Tag.company_id == company_id,
+               key.op("~>=~")(prefix),
+               key.op("~<~")(prefix + MAX_CHAR))
+        .order_by(Tag.usage_count.desc(), key.collate("C"))
+        .limit(limit)
+    )
+    return [TagCompletion(id=row.id, title=row.title, usage=row.usage_count) for row in rows]
+
+
+def complete(*, session: Session, company_id: uuid.UUID, prefix: str, limit: int = 10) -> list[TagCompletion]:
+    """
+    Company tags starting with prefix, ignoring case, most used first.
+
+    Served from the company's in-memory prefix index once it is built, even
+    up to INDEX_REBUILD_MIN_SECONDS behind other processes' writes, from
+    SQL meanwhile.
+    """
+    if settings.TAG_COMPLETION_INDEX_MAX_BYTES:
+        revision = session.exec(
+            select(CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first()
+        if revision is not None:
+            # Suggestions can be a few seconds behind other workers' writes
+            index = prefix_indexes.get_recent(company_id, revision, settings.INDEX_REBUILD_MIN_SECONDS)
+            if index is not None:
+                return index.complete(prefix, limit)
+    return _complete_sql(session, company_id, prefix, limit)
+
+
+def tags_saved(company_id: uuid.UUID, revision: int | None, tags: dict[uuid.UUID, str]) -> None:
+    """
+    Apply committed tag creates and renames, titles by tag id.
+    """
+    if settings.TAG_COMPLETION_INDEX_MAX_BYTES:
+        prefix_indexes.apply(company_id, revision, lambda index: index.save_tags(tags))
+
+
+def usage_changed(
+    company_id: uuid.UUID,
+    revision: int | None,
+    counts: dict[uuid.UUID, int] | None = None,
+    removed_tags: list[uuid.UUID] | None = None,
+) -> None:
+    """
+    Apply committed changes to the number of items per tag and deleted
+    tags. Call it without either for changes that don't touch tags, so the
+    index isn't rebuilt.
+    """
+    if settings.TAG_COMPLETION_INDEX_MAX_BYTES:
+        prefix_indexes.apply(company_id, revision, lambda index: (
+            index.add_usage(counts or {}) and index.remove_tags(removed_tags or [])))
@@ -0,0 +1,221 @@
+import uuid
+
+import numpy as np
+from sqlalchemy import Text, cast
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.index_cache import CompanyIndex, IndexCache
+from app.models import CompanyUsage, Tag, TagItemLink, TagSuggestion
+
+# Tag pairs counted at once while building, bounds the temporary arrays
+CHUNK_PAIRS = 1_000_000
+
+
+def _pairs(ordinals: np.ndarray, lengths: np.ndarray, size: int) -> np.ndarray:
+    """
+    Every pair of tags on the same design item, lower ordinal first, as
+    row * size + column. ordinals holds the tags of one item after another,
+    lengths how many each item has.
+    """
+    per_link = np.repeat(lengths, lengths)
+    firsts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    # Each link is paired with every link of its item, itself included
+    left = np.repeat(np.arange(len(ordinals)), per_link)
+    right = np.repeat(firsts, per_link) + np.arange(len(left)) - np.repeat(np.cumsum(per_link) - per_link, per_link)
+    rows, columns = ordinals[left].astype(np.int64), ordinals[right]
+    keep = rows < columns
+    return rows[keep] * size + columns[keep]
+
+
+def _merge(keys: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sum the counts of equal keys, sorted by key.
+    """
+    order = np.argsort(keys, kind="stable")
+    keys, counts = keys[order], counts[order]
+    firsts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]])) if len(keys) else order
+    return keys[firsts], np.add.reduceat(counts, firsts) if len(keys) else counts
+
+
+class TagCooccurrenceIndex(CompanyIndex):
+    """
+    Sparse symmetric matrix of how many design items each pair of a
+    company's tags share, in CSR form.
+
+    Row t lists the tags seen with tag t, indices[indptr[t]:indptr[t + 1]],
+    and on how many items, data[...] at the same positions. The sums for
+    a few chosen tags are a handful of vectorized adds over their rows.
+    """
+
+    def __init__(self, revision: int, ids: list[uuid.UUID], indptr: np.ndarray, indices: np.ndarray,
+                 data: np.ndarray) -> None:
+        super().__init__(revision)
+        self.ids = ids
+        self.ordinal_of = {tag_id: ordinal for ordinal, tag_id in enumerate(ids)}
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.size = len(ids)
+
+    @classmethod
+    def build(cls, session: Session, company_id: uuid.UUID) -> "TagCooccurrenceIndex":
+        """
+        Load the index, run it in a REPEATABLE READ transaction so the
+        revision, tags and links come from one snapshot.
+        """
+        revision = session.exec(
+            select(CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first() or 0
+        ids = list(session.exec(select(Tag.id).where(Tag.company_id == company_id).order_by(Tag.id)).all())
+        size = len(ids)
+
+        # Tag ordinals numbered by Postgres in the same order, as text with
+        # the ones of each design item with at least two tags in a row, and
+        # how many each has. Two strings parse far faster than a row per item
+        ordinals = (
+            select(Tag.id, (func.row_number().over(order_by=Tag.id) - 1).label("ordinal"))
+            .where(Tag.company_id == company_id)
+            .subquery()
+        )
+        items = (
+            select(func.count().label("length"),
+                   func.string_agg(cast(ordinals.c.ordinal, Text), ",").label("ordinals"))
+            .select_from(TagItemLink)
+            .join(ordinals, ordinals.c.id == TagItemLink.tag_id)
+            .group_by(TagItemLink.design_item_id)
+            .having(func.count() > 1)
+            .subquery()
+        )
+        lengths_text, ordinals_text = session.exec(
+            select(func.string_agg(cast(items.c.length, Text), ","), func.string_agg(items.c.ordinals, ","))
+        ).one()
+        lengths = np.fromstring(lengths_text or "", dtype=np.int64, sep=",")
+        flat = np.fromstring(ordinals_text or "", dtype=np.int32, sep=",")
+
+        # Pairs of a chunk of items at a time, the counts merged whenever
+        # the pending ones outgrow those merged so far
+        keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        pending: list[tuple[np.ndarray, np.ndarray]] = []
+        pending_size = 0
+        ends = np.cumsum(lengths)
+        cumulative_pairs = np.cumsum(lengths ** 2)
+        first = 0
+        while first < len(lengths):
+            done = cumulative_pairs[first - 1] if first else 0
+            last = max(int(np.searchsorted(cumulative_pairs, done + CHUNK_PAIRS, side="right")), first + 1)
+            start = ends[first] - lengths[first]
+            chunk_keys, chunk_counts = np.unique(
+                _pairs(flat[start:ends[last - 1]], lengths[first:last], size), return_counts=True)
+            pending.append((chunk_keys, chunk_counts.astype(np.int32)))
+            pending_size += len(chunk_keys)
+            first = last
+            if pending_size > len(keys) or first == len(lengths):
+                keys, counts = _merge(np.concatenate([keys, *(pending_keys for pending_keys, _ in pending)]),
+                                      np.concatenate([counts, *(pending_counts for _, pending_counts in pending)]))
+                pending, pending_size = [], 0
+
+        # Both halves of the symmetric matrix, sorted by row then column
+        rows_of = np.concatenate([keys // max(size, 1), keys % max(size, 1)]).astype(np.int32)
+        columns = np.concatenate([rows_of[len(keys):], rows_of[:len(keys)]])
+        data = np.concatenate([counts, counts]).astype(np.int32)
+        del keys, counts
+        # The sort key built in place, the arrays are the bulk of the peak memory
+        order = rows_of.astype(np.int64)
+        order *= size
+        order += columns
+        order = np.argsort(order)
+        indices, data = columns[order], data[order]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows_of, minlength=size))]).astype(np.int64)
+        return cls(revision, ids, indptr, indices, data)
+
+    @property
+    def nbytes(self) -> int:
+        # Per tag: a UUID, its list and dict slots
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes + 200 * self.size
+
+    def suggest(self, tag_ids: list[uuid.UUID], limit: int) -> list[tuple[uuid.UUID, int]]:
+        """
+        Tags sharing the most design items with the given ones, summed over
+        them, with that count. Unknown tags add nothing.
+        """
+        chosen = [self.ordinal_of[tag_id] for tag_id in set(tag_ids) if tag_id in self.ordinal_of]
+        counts = np.zeros(self.size, dtype=np.int64)
+        for ordinal in chosen:
+            start, end = self.indptr[ordinal], self.indptr[ordinal + 1]
+            # Columns are unique within a row, a plain fancy add is exact
+            counts[self.indices[start:end]] += self.data[start:end]
+        counts[chosen] = 0
+        found = np.flatnonzero(counts)
+        # One sortable int per tag, most shared items first, ties in tag id
+        # order like SQL
+        order = found - counts[found] * self.size
+        if len(found) > limit:
+            positions = np.argpartition(order, limit - 1)[:limit]
+            found, order = found[positions], order[positions]
+        found = found[np.argsort(order)]
+        return [(self.ids[ordinal], int(counts[ordinal])) for ordinal in found.tolist()]
+
+
+class TagCooccurrenceIndexCache(IndexCache[TagCooccurrenceIndex]):
+    name = "tag co-occurrence index"
+
+    def load(self, session: Session, company_id: uuid.UUID) -> TagCooccurrenceIndex:
+        return TagCooccurrenceIndex.build(session, company_id)
+
+    @property
+    def max_bytes(self) -> int:
+        return settings.TAG_SUGGEST_INDEX_MAX_BYTES
+
+    @property
+    def max_changes(self) -> int:
+        # Never changed in place, only rebuilt
+        return 0
+
+
+cooccurrence_indexes = TagCooccurrenceIndexCache()
+
+
+def _suggest_sql(
+    session: Session, company_id: uuid.UUID, tag_ids: list[uuid.UUID], limit: int
+) -> list[tuple[uuid.UUID, int]]:
+    chosen = aliased(TagItemLink)
+    count = func.count().label("count")
+    rows = session.exec(
+        select(TagItemLink.tag_id, count)
+        .join(chosen, chosen.design_item_id == TagItemLink.design_item_id)
+        .join(Tag, Tag.id == chosen.tag_id)
+        .where(Tag.company_id == company_id, chosen.tag_id.in_(tag_ids), TagItemLink.tag_id.not_in(tag_ids))
+        .group_by(TagItemLink.tag_id)
+        .order_by(count.desc(), TagItemLink.tag_id)
+        .limit(limit)
+    )
+    return [(row.tag_id, row.count) for row in rows]
+
+
+def suggest(
+    *, session: Session, company_id: uuid.UUID, tag_ids: list[uuid.UUID], limit: int = 10
+) -> list[TagSuggestion]:
+    """
+    Company tags most often on the same design items as tag_ids.
+
+    Served from the company's co-occurrence index as of its last build,
+    which may lag changes by TAG_SUGGEST_REFRESH_SECONDS, from a SQL
+    self-join until it is first built.
+    """
+    counts = None
+    if settings.TAG_SUGGEST_INDEX_MAX_BYTES:
+        revision = session.exec(
+            select(CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first()
+        if revision is not None:
+            index = cooccurrence_indexes.get_recent(company_id, revision, settings.TAG_SUGGEST_REFRESH_SECONDS)
+            if index is not None:
+                counts = index.suggest(tag_ids, limit)
+    if counts is None:
+        counts = _suggest_sql(session, company_id, tag_ids, limit)
+    # Titles as of now, tags deleted since the build drop out
+    titles = dict(session.exec(
+        select(Tag.id, Tag.title).where(Tag.company_id == company_id, Tag.id.in_([tag_id for tag_id, _ in counts]))
+    ).all())
+    return [TagSuggestion(id=tag_id, title=titles[tag_id], count=count) for tag_id, count in counts
+            if tag_id in titles]
@@ -0,0 +1,329 @@
+import uuid
+from collections.abc import Iterable
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.index_cache import CompanyIndex, IndexCache
+from app.models import CompanyUsage, DesignItem, DesignItemFilter, Tag, TagItemLink
+
+# Design items get dense ordinals in listing order, (created_date, id). The
+# sort key is the date as 4 big-endian bytes followed by the 16 uuid bytes,
+# which compares exactly like the row value in Postgres.
+KEY_DTYPE = "S20"
+
+
+def item_key(created_date: date, item_id: uuid.UUID) -> bytes:
+    return created_date.toordinal().to_bytes(4, "big") + item_id.bytes
+
+
+def _date_key(day: date) -> bytes:
+    return day.toordinal().to_bytes(4, "big")
+
+
+def _full_key(key: bytes) -> bytes:
+    # numpy drops trailing NUL bytes of fixed width strings
+    return bytes(key).ljust(20, b"\0")
+
+
+class TagBitmapIndex(CompanyIndex):
+    """
+    Tag to design item sets of one company.
+
+    Each tag holds either a sorted uint32 array of item ordinals or, once
+    it is on more than 1/32 of the items and that gets smaller, a bitset.
+    Items created after the build are appended past the sorted ordinals,
+    deleted ones are masked out, both until the next rebuild.
+    """
+
+    def __init__(self, revision: int, keys: np.ndarray, tags: dict[uuid.UUID, np.ndarray]) -> None:
+        super().__init__(revision)
+        self.keys = keys
+        self.tags = tags
+        self.size = len(keys)
+        self.tail: list[bytes] = []
+        self.tail_ordinals: dict[bytes, int] = {}
+        self.dead: set[int] = set()
+
+    @classmethod
+    def build(cls, session: Session, company_id: uuid.UUID, batch_size: int = 50_000) -> "TagBitmapIndex":
+        """
+        Load the index, run it in a REPEATABLE READ transaction so the
+        revision, items and links come from one snapshot.
+        """
+        revision = session.exec(
+            select(CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first() or 0
+        rows = session.exec(
+            select(DesignItem.created_date, DesignItem.id)
+            .where(DesignItem.company_id == company_id)
+            .order_by(DesignItem.created_date, DesignItem.id)
+            .execution_options(yield_per=batch_size)
+        )
+        index = cls(revision, np.array([item_key(*row) for row in rows], dtype=KEY_DTYPE), {})
+
+        # Ordinals are numbered by Postgres in the same order as the keys
+        ordinals = (
+            select(DesignItem.id,
+                   (func.row_number().over(order_by=(DesignItem.created_date, DesignItem.id)) - 1).label("ordinal"))
+            .where(DesignItem.company_id == company_id)
+            .subquery()
+        )
+        links = session.exec(
+            select(TagItemLink.tag_id, func.array_agg(aggregate_order_by(ordinals.c.ordinal, ordinals.c.ordinal)))
+            .join(ordinals, ordinals.c.id == TagItemLink.design_item_id)
+            .join(Tag, Tag.id == TagItemLink.tag_id)
+            .where(Tag.company_id == company_id)
+            .group_by(TagItemLink.tag_id)
+            .execution_options(yield_per=1000)
+        )
+        for tag_id, tag_ordinals in links:
+            index.tags[tag_id] = index._compact(np.array(tag_ordinals, dtype=np.uint32))
+        return index
+
+    def _compact(self, ordinals: np.ndarray) -> np.ndarray:
+        if len(ordinals) * 32 > self.size:
+            return self._to_bitset(ordinals)
+        return ordinals
+
+    @property
+    def nbytes(self) -> int:
+        return (self.keys.nbytes + sum(bits.nbytes for bits in self.tags.values())
+                + 100 * (len(self.tail) + len(self.dead)))
+
+    # Bitsets are uint8, little endian bit order, and may be shorter than
+    # the current size, missing bits are unset
+    def _to_bitset(self, ordinals: np.ndarray) -> np.ndarray:
+        flags = np.zeros(self.size, dtype=bool)
+        flags[ordinals] = True
+        return np.packbits(flags, bitorder="little")
+
+    def _bitset(self, tag_id: uuid.UUID) -> np.ndarray:
+        bits = self.tags.get(tag_id)
+        if bits is None:
+            return np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        if bits.dtype == np.uint32:
+            return self._to_bitset(bits)
+        return np.pad(bits, (0, (self.size + 7) // 8 - len(bits)))
+
+    def _contains(self, tag_id: uuid.UUID, ordinals: np.ndarray) -> np.ndarray:
+        bits = self.tags.get(tag_id)
+        if bits is None:
+            return np.zeros(len(ordinals), dtype=bool)
+        if bits.dtype == np.uint32:
+            return np.isin(ordinals, bits, assume_unique=True)
+        byte = ordinals >> 3
+        inside = byte < len(bits)
+        found = np.zeros(len(ordinals), dtype=bool)
+        shift = (ordinals[inside] & 7).astype(np.uint8)
+        found[inside] = ((bits[byte[inside]] >> shift) & 1).astype(bool)
+        return found
+
+    def _count(self, tag_id: uuid.UUID) -> int:
+        # Upper bound for bitsets, which puts them after every array
+        bits = self.tags.get(tag_id)
+        if bits is None:
+            return 0
+        return len(bits) if bits.dtype == np.uint32 else len(bits) * 8
+
+    def _ordinal(self, key: bytes) -> int | None:
+        if key in self.tail_ordinals:
+            return self.tail_ordinals[key]
+        position = int(np.searchsorted(self.keys, key))
+        if position < len(self.keys) and _full_key(self.keys[position]) == key:
+            return position
+        return None
+
+    def match(self, item_filter: DesignItemFilter) -> np.ndarray:
+        """
+        Sorted ordinals of the live items matching the tag conditions.
+        """
+        tags_all = sorted(set(item_filter.tags_all), key=self._count)
+        rarest = self.tags.get(tags_all[0], np.empty(0, dtype=np.uint32)) if tags_all else None
+        if rarest is not None and rarest.dtype == np.uint32:
+            # Start from the rarest tag and probe the rest
+            ordinals = rarest.astype(np.int64)
+            for tag_id in tags_all[1:]:
+                ordinals = ordinals[self._contains(tag_id, ordinals)]
+            if item_filter.tags_any:
+                found = np.zeros(len(ordinals), dtype=bool)
+                for tag_id in item_filter.tags_any:
+                    found |= self._contains(tag_id, ordinals)
+                ordinals = ordinals[found]
+            for tag_id in item_filter.tags_none:
+                ordinals = ordinals[~self._contains(tag_id, ordinals)]
+        else:
+            bits = np.packbits(np.ones(self.size, dtype=bool), bitorder="little")
+            for tag_id in tags_all:
+                bits &= self._bitset(tag_id)
+            if item_filter.tags_any:
+                found = np.zeros_like(bits)
+                for tag_id in item_filter.tags_any:
+                    found |= self._bitset(tag_id)
+                bits &= found
+            for tag_id in item_filter.tags_none:
+                bits &= ~self._bitset(tag_id)
+            ordinals = np.flatnonzero(np.unpackbits(bits, count=self.size, bitorder="little"))
+        if self.dead:
+            ordinals = ordinals[~np.isin(ordinals, np.fromiter(self.dead, dtype=np.int64))]
+        return ordinals
+
+    def page(
+        self, item_filter: DesignItemFilter, after: tuple[date, uuid.UUID] | None, limit: int
+    ) -> list[uuid.UUID]:
+        """
+        Ids of one listing page, newest first like crud.list_design_items.
+        """
+        with self.lock:
+            ordinals = self.match(item_filter)
+            low = _date_key(item_filter.created_from) if item_filter.created_from else b""
+            high = None
+            if item_filter.created_to:
+                high = _date_key(item_filter.created_to + timedelta(days=1))
+            if after:
+                cursor = item_key(*after)
+                high = min(high, cursor) if high else cursor
+
+            built = len(self.keys)
+            start = np.searchsorted(self.keys, low) if low else 0
+            end = np.searchsorted(self.keys, high) if high else built
+            ordered = ordinals[(ordinals >= start) & (ordinals < end)][-limit:]
+            candidates = [_full_key(key) for key in self.keys[ordered]]
+            for ordinal in ordinals[ordinals >= built]:
+                key = self.tail[ordinal - built]
+                if key >= low and (high is None or key < high):
+                    candidates.append(key)
+        candidates.sort(reverse=True)
+        return [uuid.UUID(bytes=key[4:]) for key in candidates[:limit]]
+
+    def add_item(self, key: bytes) -> bool:
+        self.tail_ordinals[key] = self.size
+        self.tail.append(key)
+        self.size += 1
+        return True
+
+    def remove_item(self, key: bytes) -> bool:
+        ordinal = self._ordinal(key)
+        if ordinal is None:
+            return False
+        self.dead.add(ordinal)
+        return True
+
+    def add_link(self, tag_id: uuid.UUID, key: bytes) -> bool:
+        return self._set_link(tag_id, key, True)
+
+    def remove_link(self, tag_id: uuid.UUID, key: bytes) -> bool:
+        return self._set_link(tag_id, key, False)
+
+    def _set_link(self, tag_id: uuid.UUID, key: bytes, linked: bool) -> bool:
+        ordinal = self._ordinal(key)
+        if ordinal is None:
+            return False
+        bits = self.tags.get(tag_id, np.empty(0, dtype=np.uint32))
+        if bits.dtype == np.uint32:
+            position = np.searchsorted(bits, ordinal)
+            present = position < len(bits) and bits[position] == ordinal
+            if linked and not present:
+                self.tags[tag_id] = self._compact(np.insert(bits, position, ordinal))
+            elif not linked and present:
+                self.tags[tag_id] = np.delete(bits, position)
+            return True
+        if ordinal >> 3 >= len(bits):
+            bits = np.pad(bits, (0, (self.size + 7) // 8 - len(bits)))
+            self.tags[tag_id] = bits
+        if linked:
+            bits[ordinal >> 3] |= 1 << (ordinal & 7)
+        else:
+            bits[ordinal >> 3] &= ~np.uint8(1 << (ordinal & 7))
+        return True
+
+
+class TagIndexCache(IndexCache[TagBitmapIndex]):
+    name = "tag index"
+
+    def load(self, session: Session, company_id: uuid.UUID) -> TagBitmapIndex:
+        return TagBitmapIndex.build(session, company_id)
+
+    @property
+    def max_bytes(self) -> int:
+        return settings.TAG_INDEX_MAX_BYTES
+
+    @property
+    def max_changes(self) -> int:
+        return settings.TAG_INDEX_MAX_CHANGES
+
+
+tag_indexes = TagIndexCache()
+
+# Filters the index answers, the rest is left to SQL
+COVERED_FILTERS = {"tags_all", "tags_any", "tags_none", "created_from", "created_to"}
+
+
+def _covers(item_filter: DesignItemFilter) -> bool:
+    return all(getattr(item_filter, name) in (None, [])
+               for name in DesignItemFilter.model_fields if name not in COVERED_FILTERS)
+
+
+def find_design_items(
+    *,
+    session: Session,
+    company_id: uuid.UUID,
+    item_filter: DesignItemFilter,
+    after: tuple[date, uuid.UUID] | None = None,
+    limit: int = 100,
+) -> list[DesignItem] | None:
+    """
+    crud.list_design_items through the company's tag index.
+
+    None when the index is off, not worth it for the company, doesn't
+    cover the filter or isn't up to date, the caller then queries SQL.
+    """
+    if not settings.TAG_INDEX_MAX_BYTES or not _covers(item_filter):
+        return None
+    usage = session.exec(
+        select(CompanyUsage.items, CompanyUsage.revision).where(CompanyUsage.company_id == company_id)).first()
+    if usage is None or usage.items < settings.TAG_INDEX_MIN_ITEMS:
+        return None
+    index = tag_indexes.get(company_id, usage.revision)
+    if index is None:
+        return None
+    ids = index.page(item_filter, after, limit)
+    if not ids:
+        return []
+    items = session.exec(select(DesignItem).where(DesignItem.id.in_(ids))).all()
+    return sorted(items, key=lambda item: (item.created_date, item.id.bytes), reverse=True)
+
+
+def item_added(company_id: uuid.UUID, revision: int | None, item_id: uuid.UUID, created_date: date) -> None:
+    if settings.TAG_INDEX_MAX_BYTES:
+        key = item_key(created_date, item_id)
+        tag_indexes.apply(company_id, revision, lambda index: index.add_item(key))
+
+
+def item_removed(company_id: uuid.UUID, revision: int | None, item_id: uuid.UUID, created_date: date) -> None:
+    if settings.TAG_INDEX_MAX_BYTES:
+        key = item_key(created_date, item_id)
+        tag_indexes.apply(company_id, revision, lambda index: index.remove_item(key))
+
+
+def links_changed(
+    company_id: uuid.UUID,
+    revision: int | None,
+    added: Iterable[tuple[uuid.UUID, uuid.UUID, date]] = (),
+    removed: Iterable[tuple[uuid.UUID, uuid.UUID, date]] = (),
+) -> None:
+    """
+    Apply committed (tag_id, design_item_id, created_date) link changes.
+    """
+    if not settings.TAG_INDEX_MAX_BYTES:
+        return
+
+    def change(index: TagBitmapIndex) -> bool:
+        return (all(index.add_link(tag_id, item_key(created_date, item_id))
+                    for tag_id, item_id, created_date in added)
+                and all(index.remove_link(tag_id, item_key(created_date, item_id))
+                        for tag_id, item_id, created_date in removed))
+
+    tag_indexes.apply(company_id, revision, change)
@@ -0,0 +1,278 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from app.core.config import settings
+from app.storage import get_storage
+from app.storage.compression import compress_file
+
+logger = logging.getLogger(__name__)
+
+SESSION_FILE = "session.json"
+BITMAP_FILE = "chunks.bitmap"
+DATA_FILE = "data.part"
+# Created by the request that finalizes the session, under the bitmap lock
+FINALIZING_FILE = "finalizing"
+
+# Upper bound for the bitmap, 100k chunks is 12.5 KB on disk
+MAX_CHUNKS = 100_000
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadFinalizing(UploadError):
+    pass
+
+
+@dataclass
+class UploadSession:
+    """
+    Resumable upload state.
+
+    Everything lives in one directory per session: the metadata, a bitmap
+    with one bit per received chunk and the data file itself, preallocated
+    to the final size so chunks are written in place at their offset.
+    """
+    id: str
+    company_id: str
+    creator_id: str
+    filename: str
+    title: str
+    description: str | None
+    size: int
+    chunk_size: int
+    created_at: float
+    # Set when the file becomes a new version of this item
+    design_item_id: str | None = None
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.size // self.chunk_size)
+
+    @property
+    def path(self) -> Path:
+        return session_path(self.id)
+
+    def chunk_length(self, index: int) -> int:
+        if index == self.chunk_count - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+
+def session_path(upload_id: uuid.UUID | str) -> Path:
+    return Path(settings.upload_dir) / str(upload_id)
+
+
+def create_session(
+    *,
+    company_id: uuid.UUID,
+    creator_id: uuid.UUID,
+    filename: str,
+    title: str,
+    description: str | None,
+    size: int,
+    chunk_size: int | None = None,
+    design_item_id: uuid.UUID | None = None,
+) -> UploadSession:
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    filename = Path(filename).name
+    if filename in ("", ".", ".."):
+        raise UploadError("Invalid file name")
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(
+            f"File is larger than {settings.UPLOAD_MAX_SIZE} bytes")
+    if chunk_size > settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(
+            f"Chunk size is larger than {settings.UPLOAD_MAX_CHUNK_SIZE} bytes")
+
+    upload = UploadSession(
+        id=str(uuid.uuid4()),
+        company_id=str(company_id),
+        creator_id=str(creator_id),
+        filename=filename,
+        title=title,
+        description=description,
+        size=size,
+        chunk_size=chunk_size,
+        created_at=time.time(),
+        design_item_id=str(design_item_id) if design_item_id else None,
+    )
+    if upload.chunk_count > MAX_CHUNKS:
+        raise UploadError("Chunk size is too small for this file")
+
+    upload.path.mkdir(parents=True)
+    (upload.path / BITMAP_FILE).write_bytes(
+        bytes(-(-upload.chunk_count // 8)))
+    # Sparse preallocation, blocks are only allocated as chunks arrive
+    with open(upload.path / DATA_FILE, "wb") as f:
+        f.truncate(size)
+    (upload.path / SESSION_FILE).write_text(json.dumps(asdict(upload)))
+    return upload
+
+
+def get_session(upload_id: uuid.UUID | str) -> UploadSession | None:
+    try:
+        data = json.loads((session_path(upload_id) / SESSION_FILE).read_text())
+    except (FileNotFoundError, NotADirectoryError, ValueError):
+        return None
+    return UploadSession(**data)
+
+
+def read_bitmap(upload: UploadSession) -> bytes:
+    return (upload.path / BITMAP_FILE).read_bytes()
+
+
+def write_chunk(upload: UploadSession, offset: int, data: bytes | bytearray) -> None:
+    """
+    Write one chunk at its offset and mark it as received.
+
+    Chunks may arrive in any order and from parallel requests, the bitmap is
+    updated under an exclusive lock after the data has been written. The
+    data is written under a shared lock of the bitmap, so finalize can't
+    claim the session while a chunk is being written into its file.
+    """
+    if offset < 0 or offset % upload.chunk_size:
+        raise UploadError(
+            f"Offset must be a multiple of the chunk size ({upload.chunk_size})")
+    index = offset // upload.chunk_size
+    if index >= upload.chunk_count:
+        raise UploadError("Offset is beyond the end of the file")
+    if len(data) != upload.chunk_length(index):
+        raise UploadError(
+            f"Chunk at offset {offset} must be {upload.chunk_length(index)} bytes")
+
+    try:
+        lock = os.open(upload.path / BITMAP_FILE, os.O_RDWR)
+    except FileNotFoundError:
+        raise UploadFinalizing("Upload is finalized")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        if (upload.path / FINALIZING_FILE).exists():
+            raise UploadFinalizing("Upload is being finalized")
+        fd = os.open(upload.path / DATA_FILE, os.O_WRONLY)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        byte = os.pread(lock, 1, index // 8)[0]
+        os.pwrite(lock, bytes([byte | (1 << (index % 8))]), index // 8)
+    finally:
+        os.close(lock)
+
+
+def received_ranges(upload: UploadSession, bitmap: bytes | None = None) -> list[tuple[int, int]]:
+    """
+    Merge received chunks into [start, end) byte ranges.
+    """
+    bitmap = read_bitmap(upload) if bitmap is None else bitmap
+    ranges: list[tuple[int, int]] = []
+    start = None
+    for index in range(upload.chunk_count + 1):
+        received = index < upload.chunk_count and bitmap[index // 8] >> (index % 8) & 1
+        if received and start is None:
+            start = index
+        elif not received and start is not None:
+            ranges.append((start * upload.chunk_size,
+                           min(index * upload.chunk_size, upload.size)))
+            start = None
+    return ranges
+
+
+def is_complete(upload: UploadSession, bitmap: bytes | None = None) -> bool:
+    bitmap = read_bitmap(upload) if bitmap is None else bitmap
+    full, rest = divmod(upload.chunk_count, 8)
+    if any(b != 0xFF for b in bitmap[:full]):
+        return False
+    return not rest or bitmap[full] == (1 << rest) - 1
+
+
+def claim(upload: UploadSession) -> None:
+    """
+    Mark a complete session as being finalized, once. Chunk writes and
+    other claims of it fail with UploadFinalizing from then on, until
+    release.
+    """
+    try:
+        lock = os.open(upload.path / BITMAP_FILE, os.O_RDWR)
+    except FileNotFoundError:
+        raise UploadFinalizing("Upload is finalized")
+    try:
+        # Waits for chunk writes in progress
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if (upload.path / FINALIZING_FILE).exists():
+            raise UploadFinalizing("Upload is being finalized")
+        if not is_complete(upload, os.pread(lock, -(-upload.chunk_count // 8), 0)):
+            raise UploadError("Upload is not complete")
+        (upload.path / FINALIZING_FILE).touch(exist_ok=False)
+    finally:
+        os.close(lock)
+
+
+def release(upload: UploadSession) -> None:
+    (upload.path / FINALIZING_FILE).unlink(missing_ok=True)
+
+
+def finalize(upload: UploadSession, key: str) -> str | None:
+    """
+    Hand the assembled file over to storage and drop the session, returns
+    the codec it is stored with. The session has to be claimed.
+
+    Chunks were written in place, so with local storage this is a rename,
+    after compressing files that compress well. When storing fails, the
+    session is released for another try, or dropped if its file was
+    already compressed.
+    """
+    codec = None
+    try:
+        codec = compress_file(upload.path / DATA_FILE)
+        get_storage().put_file(key, upload.path / DATA_FILE)
+    except Exception:
+        if codec is None:
+            release(upload)
+        else:
+            delete_session(upload.id)
+        raise
+    delete_session(upload.id)
+    return codec
+
+
+def delete_session(upload_id: uuid.UUID | str) -> None:
+    shutil.rmtree(session_path(upload_id), ignore_errors=True)
+
+
+def purge_expired_sessions(max_age_seconds: float) -> int:
+    """
+    Remove sessions with no chunk received for max_age_seconds.
+    """
+    root = Path(settings.upload_dir)
+    if not root.is_dir():
+        return 0
+    deadline = time.time() - max_age_seconds
+    removed = 0
+    for entry in os.scandir(root):
+        if not entry.is_dir():
+            continue
+        try:
+            last_activity = os.stat(Path(entry.path) / BITMAP_FILE).st_mtime
+        except FileNotFoundError:
+            last_activity = entry.stat().st_mtime
+        if last_activity < deadline:
+            logger.info(f"Removing stale upload session {entry.name}")
+            delete_session(entry.name)
+            removed += 1
+    return removed
@@ -121,3 +121,23 @@ def verify_password_reset_token(token: str) -> str | None:
         return str(decoded_token["sub"])
     except InvalidTokenError:
         return None
+
+
+def generate_upload_token(data: dict[str, Any], expires_in: int) -> str:
+    now = datetime.now(timezone.utc)
+    exp = (now + timedelta(seconds=expires_in)).timestamp()
+    encoded_jwt = jwt.encode(
+        {**data, "exp": exp, "nbf": now, "aud": "upload"},
+        settings.SECRET_KEY,
+        algorithm=security.ALGORITHM,
+    )
+    return encoded_jwt
+
+
+def verify_upload_token(token: str) -> dict[str, Any] | None:
+    try:
+        return jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM], audience="upload"
+        )
+    except InvalidTokenError:
+        return None
@@ -0,0 +1,200 @@
+import io
+import logging
+import uuid
+from collections.abc import Iterator
+
+import zstandard
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.models import DesignItem, DesignItemVersion
+from app.storage import get_storage
+from app.storage.base import CHUNK_SIZE
+from app.storage.compression import ChunkReader
+
+logger = logging.getLogger(__name__)
+
+# Appended to the key of a version's whole file for its patch
+PATCH_SUFFIX = ".patch"
+
+
+def _window_log(size: int) -> int:
+    # The patch has to see the whole base, which zstd treats as content
+    # preceding the new file
+    return max(10, min(31, size.bit_length()))
+
+
+def _dictionary(base: bytes) -> zstandard.ZstdCompressionDict:
+    return zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+def make_delta(base: bytes, content: bytes, level: int | None = None) -> bytes:
+    """
+    zstd frame of content with base as raw dictionary, like `zstd --patch-from`.
+
+    Long distance matching finds what moved around in files larger than
+    the regular match window. Levels below ~9 hardly search the base of
+    text sources and patches come out little smaller than plain zstd.
+    """
+    params = zstandard.ZstdCompressionParameters.from_level(
+        settings.VERSION_DELTA_LEVEL if level is None else level,
+        window_log=_window_log(len(base) + len(content)),
+        enable_ldm=True,
+        write_checksum=True,
+    )
+    return zstandard.ZstdCompressor(dict_data=_dictionary(base), compression_params=params).compress(content)
+
+
+def _decompressor(base: bytes, size: int) -> zstandard.ZstdDecompressor:
+    return zstandard.ZstdDecompressor(
+        dict_data=_dictionary(base), max_window_size=1 << _window_log(len(base) + size))
+
+
+def apply_delta(base: bytes, delta: bytes, size: int) -> bytes:
+    return _decompressor(base, size).decompress(delta, max_output_size=size)
+
+
+def iter_patched(
+    base: bytes, chunks: Iterator[bytes], size: int, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    with _decompressor(base, size).stream_reader(ChunkReader(chunks)) as reader:
+        while data := reader.read(chunk_size):
+            yield data
+
+
+def _read(key: str, codec: str | None) -> bytes:
+    return b"".join(get_storage().iter_content(key, codec))
+
+
+def latest_version(session: Session, design_item_id: uuid.UUID) -> DesignItemVersion:
+    return session.exec(
+        select(DesignItemVersion)
+        .where(DesignItemVersion.design_item_id == design_item_id)
+        .order_by(DesignItemVersion.number.desc())
+        .limit(1)
+    ).one()
+
+
+def version_chain(session: Session, design_item_id: uuid.UUID, number: int) -> list[DesignItemVersion]:
+    """
+    Versions needed to rebuild version `number`: the last whole one up to
+    it, then the patches up to `number`. Empty when there's no such version.
+    """
+    snapshot = (
+        select(func.max(DesignItemVersion.number))
+        .where(DesignItemVersion.design_item_id == design_item_id,
+               DesignItemVersion.number <= number,
+               DesignItemVersion.base_number.is_(None))
+        .scalar_subquery()
+    )
+    return list(session.exec(
+        select(DesignItemVersion)
+        .where(DesignItemVersion.design_item_id == design_item_id,
+               DesignItemVersion.number >= snapshot,
+               DesignItemVersion.number <= number)
+        .order_by(DesignItemVersion.number)
+    ).all())
+
+
+def iter_version_content(chain: list[DesignItemVersion], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Content of the last version of a chain from version_chain.
+
+    Patches hold the whole content of the version before them in memory,
+    fewer than VERSION_SNAPSHOT_INTERVAL of them are applied. The latest
+    version is better read from DesignItem.file_path, which is always whole.
+    """
+    storage = get_storage()
+    *bases, target = chain
+    if not bases:
+        yield from storage.iter_content(target.file_path, target.file_codec, chunk_size)
+        return
+    content = _read(bases[0].file_path, bases[0].file_codec)
+    for version in bases[1:]:
+        content = apply_delta(content, _read(version.file_path, None), version.file_size)
+    yield from iter_patched(content, storage.iter_chunks(target.file_path, chunk_size), target.file_size, chunk_size)
+
+
+def _store_patch(item: DesignItem, key: str, size: int, codec: str | None, stored_size: int) -> tuple[str, int] | None:
+    if max(item.file_size, size) > settings.VERSION_DELTA_MAX_BYTES:
+        return None
+    try:
+        delta = make_delta(_read(item.file_path, item.file_codec), _read(key, codec))
+    except zstandard.ZstdError as e:
+        logger.info(f"Can't diff {key} against {item.file_path}: {e}")
+        return None
+    if len(delta) >= stored_size:
+        return None
+    patch_key = f"{key}{PATCH_SUFFIX}"
+    get_storage().put_stream(patch_key, io.BytesIO(delta))
+    return patch_key, len(delta)
+
+
+def _next_is_patch(session: Session, design_item_id: uuid.UUID) -> bool:
+    number = latest_version(session, design_item_id).number + 1
+    last_snapshot = session.exec(
+        select(func.max(DesignItemVersion.number))
+        .where(DesignItemVersion.design_item_id == design_item_id, DesignItemVersion.base_number.is_(None))
+    ).one()
+    return number - last_snapshot < settings.VERSION_SNAPSHOT_INTERVAL
+
+
+def store_version(
+    *,
+    session: Session,
+    item: DesignItem,
+    creator_id: uuid.UUID,
+    filename: str,
+    file_path: str,
+    file_size: int,
+    file_codec: str | None = None,
+) -> tuple[DesignItemVersion, DesignItemVersion]:
+    """
+    Next version of an item from its whole file stored at file_path,
+    returned with the version it replaces. Nothing is committed.
+
+    The item row is locked until the caller commits, so versions of one
+    item are numbered one at a time. The new version is stored as a patch
+    against the item's current file when that is smaller than the file
+    itself, every VERSION_SNAPSHOT_INTERVAL-th version stays whole.
+
+    The patch is made before the lock is taken, reading both files whole.
+    When another version was stored meanwhile and the patch no longer
+    applies, this version is stored whole instead.
+    """
+    storage = get_storage()
+    stored = storage.stat(file_path)
+    stored_size = stored.size if stored else file_size
+    base_path = item.file_path
+    patch = None
+    if _next_is_patch(session, item.id):
+        patch = _store_patch(item, file_path, file_size, file_codec, stored_size)
+
+    session.refresh(item, with_for_update=True)
+    if patch and (item.file_path != base_path or not _next_is_patch(session, item.id)):
+        logger.info(f"Storing {file_path} whole, {base_path} was replaced while diffing")
+        storage.delete(patch[0])
+        patch = None
+    previous = latest_version(session, item.id)
+    if previous.file_path == item.file_path and item.file_codec:
+        # The current file starts counting towards usage as history
+        stored = storage.stat(item.file_path)
+        previous.stored_size = stored.size if stored else item.file_size
+        session.add(previous)
+
+    version = DesignItemVersion(
+        design_item_id=item.id,
+        number=previous.number + 1,
+        creator_id=creator_id,
+        filename=filename,
+        file_path=file_path,
+        file_size=file_size,
+        stored_size=stored_size,
+        file_codec=file_codec,
+    )
+    if patch:
+        version.file_path, version.stored_size = patch
+        version.file_codec = None
+        version.base_number = previous.number
+    session.add(version)
+    return version, previous
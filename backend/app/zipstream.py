@@ -0,0 +1,167 @@
+import logging
+import struct
+import time
+import zlib
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+
+logger = logging.getLogger(__name__)
+
+# Formats that are compressed already, deflating them only burns CPU
+COMPRESSED_EXTENSIONS = {
+    ".7z", ".ai", ".avif", ".bz2", ".docx", ".gif", ".gz", ".heic", ".jpeg",
+    ".jpg", ".m4a", ".m4v", ".mkv", ".mov", ".mp3", ".mp4", ".pdf", ".png",
+    ".pptx", ".rar", ".sketch", ".webm", ".webp", ".woff", ".woff2", ".xlsx",
+    ".xz", ".zip", ".zst",
+}
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+# Values stored in 32/16 bit fields whose real value is in a ZIP64 record
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_COUNT_MARKER = 0xFFFF
+# Worst case deflate expansion is a few bytes per 16 KB block
+DEFLATE_MARGIN = 1 << 20
+
+STORED = 0
+DEFLATED = 8
+FLAGS = 0x08 | 0x800  # sizes in data descriptor, UTF-8 names
+
+
+def is_compressed(filename: str) -> bool:
+    return PurePosixPath(filename).suffix.lower() in COMPRESSED_EXTENSIONS
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    # Declared size, only picks the record layout, 0 when unknown
+    size: int
+    mtime: float
+    open: Callable[[], Iterator[bytes]]
+
+
+@dataclass
+class _Written:
+    name: bytes
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    compressed_size: int
+    size: int
+    offset: int
+    zip64: bool
+
+
+def _dos_datetime(mtime: float) -> tuple[int, int]:
+    t = time.localtime(mtime)
+    year = max(t.tm_year, 1980)
+    return (t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+            (year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday)
+
+
+def stream_zip(entries: Iterable[ZipEntry], compress_level: int = 6) -> Iterator[bytes]:
+    """
+    Build a ZIP archive on the fly.
+
+    Every file is read chunk by chunk and each chunk is yielded before the
+    next one is read, so memory stays at one chunk whatever the archive
+    size. CRC and sizes go into data descriptors after the data, ZIP64
+    records are used for large files, offsets and entry counts.
+    """
+    written: list[_Written] = []
+    offset = 0
+
+    for entry in entries:
+        try:
+            chunks = entry.open()
+            first = next(chunks, b"")
+        except Exception as e:
+            logger.warning(f"Skipping {entry.name} in zip export: {e!r}")
+            continue
+
+        method = STORED if is_compressed(entry.name) else DEFLATED
+        # A size of 0 may just be unknown, e.g. files stored before sizes
+        # were recorded, so those get ZIP64 descriptors too
+        zip64 = entry.size == 0 or entry.size + DEFLATE_MARGIN >= ZIP64_LIMIT
+        name = entry.name.encode()
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        placeholder = ZIP64_MARKER if zip64 else 0
+        header = struct.pack(
+            "<4s5H3L2H", b"PK\x03\x04", 45 if zip64 else 20, FLAGS, method,
+            dos_time, dos_date, 0, placeholder, placeholder, len(name), len(extra))
+        yield header + name + extra
+
+        crc = 0
+        size = 0
+        compressed_size = 0
+        compressor = zlib.compressobj(
+            compress_level, zlib.DEFLATED, -15) if method == DEFLATED else None
+        chunk = first
+        while chunk:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                compressed_size += len(chunk)
+                yield chunk
+            chunk = next(chunks, b"")
+        if compressor:
+            tail = compressor.flush()
+            compressed_size += len(tail)
+            yield tail
+
+        if zip64:
+            yield struct.pack("<4sL2Q", b"PK\x07\x08", crc, compressed_size, size)
+        else:
+            yield struct.pack("<4s3L", b"PK\x07\x08", crc, compressed_size, size)
+
+        written.append(_Written(name, method, dos_time, dos_date, crc,
+                                compressed_size, size, offset, zip64))
+        offset += len(header) + len(name) + len(extra) + compressed_size + (24 if zip64 else 16)
+
+    yield from _central_directory(written, offset)
+
+
+def _central_directory(written: list[_Written], cd_offset: int) -> Iterator[bytes]:
+    cd_size = 0
+    for w in written:
+        zip64_fields = []
+        size, compressed_size, offset = w.size, w.compressed_size, w.offset
+        if w.zip64 or size >= ZIP64_LIMIT:
+            zip64_fields.append(size)
+            size = ZIP64_MARKER
+        if w.zip64 or compressed_size >= ZIP64_LIMIT:
+            zip64_fields.append(compressed_size)
+            compressed_size = ZIP64_MARKER
+        if offset >= ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP64_MARKER
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack(f"<HH{len(zip64_fields)}Q", 1,
+                                8 * len(zip64_fields), *zip64_fields)
+        version = 45 if extra else 20
+        record = struct.pack(
+            "<4s4B4H3L5H2L", b"PK\x01\x02", version, 3, version, 0, FLAGS, w.method,
+            w.dos_time, w.dos_date, w.crc, compressed_size, size, len(w.name),
+            len(extra), 0, 0, 0, 0o100644 << 16, offset)
+        record += w.name + extra
+        cd_size += len(record)
+        yield record
+
+    count = len(written)
+    if count >= ZIP_FILECOUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+        zip64_eocd_offset = cd_offset + cd_size
+        yield struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0,
+                          count, count, cd_size, cd_offset)
+        yield struct.pack("<4sLQL", b"PK\x06\x07", 0, zip64_eocd_offset, 1)
+        count = ZIP64_COUNT_MARKER if count >= ZIP_FILECOUNT_LIMIT else count
+        cd_size = ZIP64_MARKER if cd_size >= ZIP64_LIMIT else cd_size
+        cd_offset = ZIP64_MARKER if cd_offset >= ZIP64_LIMIT else cd_offset
+    yield struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, count, count, cd_size, cd_offset, 0)
@@ -0,0 +1,132 @@
+"""
+Benchmark the company overview.
+
+Creates a throwaway company of --employees employees and --tags tags,
+reports the latency percentiles of opening its page through the API with
+one GET /company/{id}/overview, with the same request answered 304 Not
+Modified, and with the separate company, tag and employee requests it
+replaces. Then --clients threads open the overview at the same time, for
+latencies and throughput under load. Removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_company_overview.py
+"""
+import argparse
+import logging
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, text
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.main import app
+from app.models import UserCreate
+
+
+def timed(run: Callable[[], object], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentiles(timings: list[float]) -> tuple[float, float]:
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49], cuts[98]
+
+
+def concurrently(run: Callable[[], object], repeat: int, clients: int) -> tuple[float, float, float]:
+    # Latency percentiles over all clients, and requests per second
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        timings = sum(pool.map(lambda _: timed(run, repeat // clients), range(clients)), [])
+    return *percentiles(timings), len(timings) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--employees", type=int, default=2_000)
+    parser.add_argument("--tags", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--clients", type=int, nargs="+", default=[4, 16])
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    company_id, prefix, password = uuid.uuid4(), f"bench-{uuid.uuid4().hex[:8]}-", uuid.uuid4().hex
+    params = {"company_id": company_id, "prefix": prefix}
+    with Session(engine) as session, TestClient(app) as client:
+        try:
+            owner = crud.create_user(session=session, user_create=UserCreate(
+                email=f"{prefix}owner@example.com", password=password))
+            params["owner_id"] = owner.id
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                SELECT gen_random_uuid(), :prefix || n || '@example.com', true, false, '-', false
+                FROM generate_series(1, :employees) AS n
+            """), {**params, "employees": args.employees - 1})
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'private', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, 0, 0)
+            """), params)
+            session.execute(text("""
+                INSERT INTO usercompanylink (company_id, user_id, role)
+                SELECT :company_id, id, CASE WHEN id = :owner_id THEN 'owner' ELSE 'reader' END::companyrole
+                FROM "user" WHERE email LIKE :prefix || '%'
+            """), params)
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title)
+                SELECT gen_random_uuid(), :company_id, 'topic ' || n || ' ' || left(CAST(:company_id AS text), 8)
+                FROM generate_series(1, :tags) AS n
+            """), {**params, "tags": args.tags})
+            session.commit()
+            for table in ("company", "companyusage", "usercompanylink", "tag", '"user"'):
+                session.execute(text(f"ANALYZE {table}"))
+
+            r = client.post(f"{settings.API_V1_STR}/login/access-token",
+                            data={"username": owner.email, "password": password})
+            headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+            base = f"{settings.API_V1_STR}/company/{company_id}"
+            page = {"limit": args.limit}
+            etag = client.get(f"{base}/overview", headers=headers, params=page).headers["ETag"]
+
+            def separate() -> None:
+                for path in ("", "/tags", "/employees"):
+                    assert client.get(f"{base}{path}", headers=headers, params=page if path else None).is_success
+
+            cases: list[tuple[str, Callable[[], object]]] = [
+                ("overview", lambda: client.get(f"{base}/overview", headers=headers, params=page)),
+                ("overview, not modified", lambda: client.get(
+                    f"{base}/overview", headers={**headers, "If-None-Match": etag}, params=page)),
+                ("three requests", separate),
+            ]
+            print(f"{args.employees} employees, {args.tags} tags, pages of {args.limit}")
+            print(f"{'company page':<28}{'p50 ms':>9}{'p99 ms':>9}")
+            for label, run in cases:
+                p50, p99 = percentiles(timed(run, args.repeat))
+                print(f"{label:<28}{p50:>9.2f}{p99:>9.2f}")
+
+            print(f"{'overview, clients':<28}{'p50 ms':>9}{'p99 ms':>9}{'per s':>9}")
+            for clients in args.clients:
+                p50, p99, rate = concurrently(cases[0][1], args.repeat, clients)
+                print(f"{clients:<28}{p50:>9.2f}{p99:>9.2f}{rate:>9.0f}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tag WHERE company_id = :company_id"), params)
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE email LIKE :prefix || \'%\''), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
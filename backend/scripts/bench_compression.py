@@ -0,0 +1,139 @@
+"""
+Benchmark zstd compression of design files at rest.
+
+Stores a synthetic corpus of design sources (SVG, JSON, uncompressed PDF,
+JPEG and PNG) the way chunked uploads do, with STORAGE_COMPRESSION on and
+off, and reports disk usage, write time and read throughput decompressed
+and passed through.
+
+    cd backend && PYTHONPATH=. python scripts/bench_compression.py
+"""
+import argparse
+import io
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from app.core.config import settings
+from app.storage.compression import compress_file
+from app.storage.local import LocalStorage
+
+
+def svg(rng: random.Random) -> bytes:
+    shapes = "".join(
+        f'<path d="M{rng.randrange(1000)} {rng.randrange(1000)} L{rng.randrange(1000)} {rng.randrange(1000)} '
+        f'Q{rng.randrange(1000)} {rng.randrange(1000)} {rng.randrange(1000)} {rng.randrange(1000)}Z" '
+        f'fill="#{rng.randrange(1 << 24):06x}" stroke-width="{rng.randrange(1, 5)}"/>\n'
+        for _ in range(rng.randrange(2000, 8000)))
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1000 1000">\n{shapes}</svg>\n'.encode()
+
+
+def design_json(rng: random.Random) -> bytes:
+    def node(depth: int) -> dict[str, object]:
+        return {
+            "id": f"{rng.randrange(1 << 32):x}",
+            "type": rng.choice(["FRAME", "GROUP", "TEXT", "RECTANGLE", "VECTOR"]),
+            "name": rng.choice(["Header", "Button", "Icon", "Card", "Label"]) + f" {rng.randrange(100)}",
+            "absoluteBoundingBox": {key: round(rng.uniform(0, 1440), 2) for key in ("x", "y", "width", "height")},
+            "fills": [{"type": "SOLID", "color": {key: round(rng.random(), 4) for key in "rgba"}}],
+            "children": [node(depth + 1) for _ in range(rng.randrange(4))] if depth < 5 else [],
+        }
+    return json.dumps({"document": node(0), "schemaVersion": 14}, indent=2).encode()
+
+
+def pdf(rng: random.Random) -> bytes:
+    # Content streams without /FlateDecode, as some export tools write them
+    ops = "".join(
+        f"{rng.uniform(0, 600):.2f} {rng.uniform(0, 800):.2f} {rng.uniform(1, 200):.2f} {rng.uniform(1, 200):.2f} re "
+        f"{rng.random():.3f} {rng.random():.3f} {rng.random():.3f} rg f\n"
+        for _ in range(rng.randrange(5000, 20000)))
+    return (f"%PDF-1.7\n1 0 obj\n<< /Length {len(ops)} >>\nstream\n{ops}endstream\nendobj\n%%EOF\n").encode()
+
+
+def photo(rng: random.Random, format: str) -> bytes:
+    image = Image.effect_noise((1200, 900), rng.randrange(20, 80)).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format)
+    return output.getvalue()
+
+
+def corpus(count: int) -> list[tuple[str, bytes]]:
+    rng = random.Random(1)
+    makers = [
+        ("svg", svg), ("json", design_json), ("pdf", pdf),
+        ("jpg", lambda rng: photo(rng, "JPEG")), ("png", lambda rng: photo(rng, "PNG")),
+    ]
+    return [(f"design-{n}.{ext}", make(rng)) for n in range(count) for ext, make in makers]
+
+
+def run(files: list[tuple[str, bytes]], root: Path, compression: bool, repeat: int) -> dict[str, float]:
+    settings.STORAGE_COMPRESSION = compression
+    storage = LocalStorage(root)
+    spool = root / ".spool"
+    spool.mkdir(parents=True)
+    codecs = {}
+    start = time.perf_counter()
+    for name, content in files:
+        path = spool / name
+        path.write_bytes(content)
+        codecs[name] = compress_file(path)
+        storage.put_file(name, path)
+    write_s = time.perf_counter() - start
+
+    disk = sum(storage.stat(name).size for name, _ in files)  # type: ignore[union-attr]
+    original = sum(len(content) for _, content in files)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, _ in files:
+            for _chunk in storage.iter_content(name, codecs[name]):
+                pass
+    decoded_s = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, _ in files:
+            for _chunk in storage.iter_chunks(name):
+                pass
+    raw_s = (time.perf_counter() - start) / repeat
+    ratios = {}
+    for ext in sorted({name.rsplit(".", 1)[1] for name, _ in files}):
+        kind = [(name, content) for name, content in files if name.endswith(f".{ext}")]
+        ratios[f"ratio {ext}"] = sum(len(content) for _, content in kind) / sum(
+            storage.stat(name).size for name, _ in kind)  # type: ignore[union-attr]
+    return {
+        "compressed files": sum(1 for codec in codecs.values() if codec),
+        "disk MiB": disk / 2**20,
+        "ratio": original / disk,
+        **ratios,
+        "write MB/s": original / write_s / 1e6,
+        "read MB/s (content)": original / decoded_s / 1e6,
+        "read MB/s (stored bytes)": disk / raw_s / 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=20, help="files of each kind")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    files = corpus(args.files)
+    print(f"{len(files)} files, {sum(len(content) for _, content in files) / 2**20:.1f} MiB")
+    results = {}
+    for compression in (False, True):
+        root = Path(tempfile.mkdtemp())
+        try:
+            results[compression] = run(files, root, compression, args.repeat)
+        finally:
+            shutil.rmtree(root)
+    print(f"{'':<28}{'off':>10}{'on':>10}")
+    for key in results[False]:
+        print(f"{key:<28}{results[False][key]:>10.2f}{results[True][key]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
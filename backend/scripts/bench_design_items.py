@@ -0,0 +1,239 @@
+"""
+Benchmark the design item listing on a large synthetic company.
+
+Seeds a throwaway company with --items design items and --tags tags, links
+every item to --tags-per-item tags drawn from a Zipf-like distribution (a
+few tags are on a large share of the items, most are rare), then times
+crud.list_design_items, crud.count_design_item_tags and the in-memory tag
+index for typical filters, then the perceptual hash search in SQL and in
+its in-memory index, and removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_design_items.py
+"""
+import argparse
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+from datetime import date, timedelta
+
+from sqlmodel import Session, text
+
+from app import crud, similarity, tag_index
+from app.core.config import settings
+from app.core.db import engine
+from app.models import DesignItemFilter, TagFacet
+
+
+def vacuum(*tables: str) -> None:
+    # Clears dead rows of earlier runs and sets the visibility map for index
+    # only scans, VACUUM can't run inside the session's transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in tables:
+            connection.execute(text(f"VACUUM ANALYZE {table}"))
+
+
+def seed(session: Session, company_id: uuid.UUID, user_id: uuid.UUID, items: int, tags: int, per_item: int) -> None:
+    params = {"company_id": company_id, "user_id": user_id, "items": items, "tags": tags, "per_item": per_item}
+    session.execute(text("""
+        INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+        VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+    """), params)
+    session.execute(text("""
+        INSERT INTO company (id, title, status, is_deleted)
+        VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+    """), params)
+    session.execute(text("""
+        INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, 0, 0)
+    """), params)
+    session.execute(text("""
+        INSERT INTO usercompanylink (company_id, user_id, role) VALUES (:company_id, :user_id, 'owner')
+    """), params)
+    session.execute(text("""
+        INSERT INTO tag (id, title, company_id)
+        SELECT uuid_generate_v4(), 'b' || left(CAST(:company_id AS text), 8) || '-' || n, :company_id
+        FROM generate_series(1, :tags) AS n
+    """), params)
+    session.execute(text("""
+        INSERT INTO designitem (id, title, company_id, creator_id, file_path, preview_path, file_size, created_date,
+                                perceptual_hash)
+        SELECT uuid_generate_v4(), 'item ' || n, :company_id, :user_id, 'bench/' || n, 'bench/' || n, 0,
+               DATE '2024-01-01' + (random() * 1000)::int,
+               CAST(CAST('x' || left(md5(random()::text), 16) AS bit(64)) AS bigint)
+        FROM generate_series(1, :items) AS n
+    """), params)
+    session.commit()
+    # Without fresh statistics the join below turns into a nested loop
+    vacuum("designitem", "tag")
+    # exp(random() * ln(tags)) is log-uniform, i.e. rank r is picked with
+    # probability ~1/r
+    session.execute(text("""
+        WITH picks AS MATERIALIZED (
+            SELECT designitem.id, CAST(least(floor(exp(random() * ln(:tags))), :tags) AS int) AS rank
+            FROM designitem CROSS JOIN generate_series(1, :per_item)
+            WHERE designitem.company_id = :company_id
+        ), ranked AS (
+            SELECT id, CAST(row_number() OVER (ORDER BY id) AS int) AS rank FROM tag WHERE company_id = :company_id
+        )
+        INSERT INTO tagitemlink (design_item_id, tag_id)
+        SELECT DISTINCT picks.id, ranked.id FROM picks JOIN ranked USING (rank)
+    """), params)
+    session.commit()
+    vacuum("tagitemlink")
+
+
+def cleanup(session: Session, company_id: uuid.UUID, user_id: uuid.UUID) -> None:
+    params = {"company_id": company_id, "user_id": user_id}
+    session.rollback()
+    session.execute(text("""
+        DELETE FROM tagitemlink USING tag WHERE tag.id = tagitemlink.tag_id AND tag.company_id = :company_id
+    """), params)
+    session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+    session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+    session.commit()
+
+
+def timed(fn: Callable[[], object], repeat: int) -> tuple[float, float]:
+    fn()  # warm the cache
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--tags", type=int, default=10_000)
+    parser.add_argument("--tags-per-item", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--keep", action="store_true", help="don't delete the seeded data")
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    with Session(engine) as session:
+        try:
+            start = time.perf_counter()
+            seed(session, company_id, user_id, args.items, args.tags, args.tags_per_item)
+            print(f"Seeded {args.items} items in {time.perf_counter() - start:.1f}s")
+
+            by_usage = session.execute(text("""
+                SELECT tag_id, count(*) FROM tagitemlink
+                JOIN tag ON tag.id = tagitemlink.tag_id AND tag.company_id = :company_id
+                GROUP BY tag_id ORDER BY count(*) DESC
+            """), {"company_id": company_id}).all()
+            hot, hot2 = by_usage[0], by_usage[1]
+            mid = by_usage[len(by_usage) // 10]
+            rare = by_usage[-1]
+            print(f"Tag usage: hot {hot[1]}, 2nd {hot2[1]}, p90 {mid[1]}, rare {rare[1]}")
+
+            def run(item_filter: DesignItemFilter, after: tuple[date, uuid.UUID] | None = None) -> Callable[[], object]:
+                return lambda: crud.list_design_items(
+                    session=session, company_id=company_id, item_filter=item_filter, after=after, limit=args.limit)
+
+            deep = session.execute(text("""
+                SELECT created_date, id FROM designitem WHERE company_id = :company_id
+                ORDER BY created_date DESC, id DESC OFFSET :offset LIMIT 1
+            """), {"company_id": company_id, "offset": args.items // 2}).one()
+            common = [tag_id for tag_id, _ in by_usage[:10]]
+            tag_filters = {
+                "hot tag": DesignItemFilter(tags_all=[hot[0]]),
+                "p90 tag": DesignItemFilter(tags_all=[mid[0]]),
+                "rare tag": DesignItemFilter(tags_all=[rare[0]]),
+                "hot AND p90": DesignItemFilter(tags_all=[hot[0], mid[0]]),
+                "hot AND 2nd": DesignItemFilter(tags_all=[hot[0], hot2[0]]),
+                "5 hottest ANDed": DesignItemFilter(tags_all=common[:5]),
+                "3 AND, 4 OR, 3 NOT": DesignItemFilter(
+                    tags_all=common[:3], tags_any=common[3:7], tags_none=common[7:]),
+                "p90 OR rare": DesignItemFilter(tags_any=[mid[0], rare[0]]),
+                "NOT hot": DesignItemFilter(tags_none=[hot[0]]),
+            }
+            cases = {"no filter": run(DesignItemFilter())}
+            cases |= {name: run(item_filter) for name, item_filter in tag_filters.items()}
+            cases |= {
+                "30 day range": run(DesignItemFilter(
+                    created_from=date(2025, 1, 1), created_to=date(2025, 1, 1) + timedelta(days=30))),
+                "cursor at 50%": run(DesignItemFilter(), after=(deep.created_date, deep.id)),
+                "hot tag, cursor at 50%": run(DesignItemFilter(tags_all=[hot[0]]), after=(deep.created_date, deep.id)),
+            }
+
+            def facets(item_filter: DesignItemFilter, sample_percent: float | None = None) -> Callable[[], list[TagFacet]]:
+                def count() -> list[TagFacet]:
+                    if sample_percent is not None:
+                        # Same size probe the endpoint runs before sampling
+                        crud.count_design_items(session=session, company_id=company_id,
+                                                item_filter=item_filter, limit=settings.FACETS_SAMPLE_ITEMS + 1)
+                    return crud.count_design_item_tags(
+                        session=session, company_id=company_id, item_filter=item_filter, sample_percent=sample_percent)
+                return count
+
+            cases |= {
+                "facets, rare tag": facets(DesignItemFilter(tags_all=[rare[0]])),
+                "facets, p90 tag": facets(DesignItemFilter(tags_all=[mid[0]])),
+                "facets, hot tag": facets(DesignItemFilter(tags_all=[hot[0]])),
+                "facets, no filter": facets(DesignItemFilter()),
+            }
+            # The endpoint only samples above FACETS_SAMPLE_ITEMS items
+            sample_percent = 100 * settings.FACETS_SAMPLE_ITEMS / args.items
+            if sample_percent < 100:
+                cases |= {
+                    "facets ~, hot tag": facets(DesignItemFilter(tags_all=[hot[0]]), sample_percent),
+                    "facets ~, no filter": facets(DesignItemFilter(), sample_percent),
+                }
+            print(f"{'query':<24}{'p50 ms':>10}{'p95 ms':>10}")
+            for name, fn in cases.items():
+                p50, p95 = timed(fn, args.repeat)
+                print(f"{name:<24}{p50:>10.1f}{p95:>10.1f}")
+
+            settings.TAG_INDEX_MAX_BYTES = 1 << 40
+            settings.TAG_INDEX_MIN_ITEMS = 0
+            start = time.perf_counter()
+            tag_index.tag_indexes.rebuild(company_id).result()
+            index = tag_index.tag_indexes.indexes[company_id]
+            print(f"Built tag index in {time.perf_counter() - start:.1f}s, {index.nbytes / 2**20:.1f} MiB")
+            print(f"{'tag index':<24}{'p50 ms':>10}{'p95 ms':>10}")
+            for name, item_filter in tag_filters.items():
+                def find(item_filter: DesignItemFilter = item_filter) -> object:
+                    items = tag_index.find_design_items(
+                        session=session, company_id=company_id, item_filter=item_filter, limit=args.limit)
+                    assert items is not None
+                    return items
+                p50, p95 = timed(find, args.repeat)
+                print(f"{name:<24}{p50:>10.1f}{p95:>10.1f}")
+
+            probe = session.execute(text("""
+                SELECT perceptual_hash FROM designitem WHERE company_id = :company_id LIMIT 1
+            """), {"company_id": company_id}).scalar_one()
+
+            def similar() -> object:
+                return similarity.find_similar(session=session, company_id=company_id, perceptual_hash=probe,
+                                               max_distance=settings.SIMILARITY_MAX_DISTANCE)
+
+            settings.SIMILARITY_INDEX_MAX_BYTES = 0
+            p50, p95 = timed(similar, args.repeat)
+            print(f"{'similar items, SQL':<24}{p50:>10.1f}{p95:>10.1f}")
+            settings.SIMILARITY_INDEX_MAX_BYTES = 1 << 40
+            settings.SIMILARITY_INDEX_MIN_ITEMS = 0
+            start = time.perf_counter()
+            similarity.hash_indexes.rebuild(company_id).result()
+            hashes = similarity.hash_indexes.indexes[company_id]
+            print(f"Built hash index in {time.perf_counter() - start:.1f}s, {hashes.nbytes / 2**20:.1f} MiB")
+            p50, p95 = timed(similar, args.repeat)
+            print(f"{'similar items, index':<24}{p50:>10.1f}{p95:>10.1f}")
+
+            if sample_percent < 100:
+                exact = {f.id: f.count for f in facets(DesignItemFilter())()}
+                approximate = facets(DesignItemFilter(), sample_percent)()
+                errors = [abs(f.count - exact[f.id]) / exact[f.id] for f in approximate[:10]]
+                print(f"Approximate top 10 counts off by {max(errors):.1%} at most")
+        finally:
+            if not args.keep:
+                cleanup(session, company_id, user_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark adding employees in bulk.
+
+Creates --users users and two throwaway companies, adds all the users to
+one of them a request at a time the way POST /{company_id}/employee/ does
+and to the other with one bulk upsert by email, reports both times and
+removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_employee_bulk.py
+"""
+import argparse
+import time
+import uuid
+
+from sqlmodel import Session, select, text
+
+from app import crud
+from app.core.db import engine
+from app.models import CompanyRole, EmployeeBulkEntry, User, UserCompanyLink
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=3_000)
+    args = parser.parse_args()
+
+    one_id, bulk_id, prefix = uuid.uuid4(), uuid.uuid4(), f"bench-{uuid.uuid4().hex[:8]}-"
+    params = {"one_id": one_id, "bulk_id": bulk_id, "prefix": prefix}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                SELECT gen_random_uuid(), :prefix || n || '@example.com', true, false, '-', false
+                FROM generate_series(1, :users) AS n
+            """), {**params, "users": args.users})
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:one_id, 'bench-' || :one_id, 'public', false), (:bulk_id, 'bench-' || :bulk_id, 'public', false)
+            """), params)
+            session.commit()
+            users = session.exec(select(User.id, User.email).where(User.email.startswith(prefix))).all()
+
+            start = time.perf_counter()
+            for user_id, _ in users:
+                employee = UserCompanyLink(company_id=one_id, user_id=user_id, role=CompanyRole.reader)
+                session.add(employee)
+                session.commit()
+                session.refresh(employee)
+            one_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = crud.upsert_employees(
+                session=session, company_id=bulk_id, max_role=CompanyRole.owner,
+                employees_in=[EmployeeBulkEntry(email=email) for _, email in users])
+            bulk_s = time.perf_counter() - start
+            assert all(result.status == "added" for result in results)
+            print(f"{len(users)} employees, one request each {one_s:.2f} s, bulk by email {bulk_s:.2f} s")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM company WHERE id IN (:one_id, :bulk_id)"), params)
+            session.execute(text('DELETE FROM "user" WHERE email LIKE :prefix || \'%\''), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark the employee directory search.
+
+Creates --users users, --members of them employees of a throwaway company,
+reports the latency percentiles of searching its employees by email
+prefix, by part of the full name and by role, of walking the last page by
+keyset against the skip/limit and count the listing used before, and
+removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_employee_search.py
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+
+from sqlmodel import Session, func, select, text
+
+from app import crud
+from app.core.db import engine
+from app.models import CompanyRole, User, UserCompanyLink
+
+NAMES = ["Anna", "Boris", "Chen", "Dana", "Emil", "Fatima", "Goran", "Hana", "Ivan", "Julia"]
+
+
+def percentiles(run: Callable[[], object], repeat: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49], cuts[98]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--members", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    company_id, prefix = uuid.uuid4(), f"bench-{uuid.uuid4().hex[:8]}-"
+    params = {"company_id": company_id, "prefix": prefix, "names": NAMES}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, full_name, is_active, is_superuser, hashed_password, is_delited)
+                SELECT gen_random_uuid(), :prefix || md5(n::text) || '@example.com',
+                       (CAST(:names AS text[]))[1 + n % 10] || ' ' || upper(left(md5(n::text), 6)), true, false, '-', false
+                FROM generate_series(1, :users) AS n
+            """), {**params, "users": args.users})
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO usercompanylink (company_id, user_id, role)
+                SELECT :company_id, id, (ARRAY['reader', 'creator', 'owner']::companyrole[])[1 + n % 3]
+                FROM (SELECT id, row_number() OVER () AS n FROM "user"
+                      WHERE email LIKE :prefix || '%' ORDER BY random() LIMIT :members) AS members
+            """), {**params, "members": args.members})
+            session.commit()
+            session.execute(text('ANALYZE "user"'))
+            session.execute(text("ANALYZE usercompanylink"))
+
+            rng = random.Random(1)
+            last_key = session.exec(
+                select(func.lower(User.email).collate("C"), User.id)
+                .join(UserCompanyLink, UserCompanyLink.user_id == User.id)
+                .where(UserCompanyLink.company_id == company_id)
+                .order_by(func.lower(User.email).collate("C").desc(), User.id.desc()).offset(100)
+            ).first()
+
+            def old_last_page() -> None:
+                session.exec(select(func.count()).select_from(UserCompanyLink)
+                             .where(UserCompanyLink.company_id == company_id)).one()
+                session.exec(select(User.id, User.email, User.full_name, UserCompanyLink.role)
+                             .join(UserCompanyLink).where(UserCompanyLink.company_id == company_id)
+                             .offset(args.members - 100).limit(100)).all()
+
+            cases: list[tuple[str, Callable[[], object]]] = [
+                ("email prefix", lambda: crud.list_employees(
+                    session=session, company_id=company_id, email=f"{prefix}{rng.randrange(16 ** 3):03x}", limit=101)),
+                ("name part", lambda: crud.list_employees(
+                    session=session, company_id=company_id, name=f"{rng.randrange(16 ** 3):03X}", limit=101)),
+                ("role, first page", lambda: crud.list_employees(
+                    session=session, company_id=company_id, role=CompanyRole.owner, limit=101)),
+                ("last page, keyset", lambda: crud.list_employees(
+                    session=session, company_id=company_id, after=tuple(last_key), limit=101)),
+                ("last page, skip and count", old_last_page),
+            ]
+            print(f"{args.members} employees among {args.users} users")
+            print(f"{'search':<28}{'p50 ms':>9}{'p99 ms':>9}")
+            for label, run in cases:
+                p50, p99 = percentiles(run, args.repeat)
+                print(f"{label:<28}{p50:>9.2f}{p99:>9.2f}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE email LIKE :prefix || \'%\''), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
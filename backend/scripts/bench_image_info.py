@@ -0,0 +1,92 @@
+"""
+Benchmark the image info backfill on local disk.
+
+Writes --files design files to a temporary MEDIA_ROOT, a mix of PNG, JPEG,
+WebP and non-image files, records them as design items of a throwaway
+company, runs app.jobs.image_info_backfill over them and removes
+everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_image_info.py
+"""
+import argparse
+import io
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from PIL import Image
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.jobs.image_info_backfill import backfill
+from app.storage import get_storage
+
+
+def samples(count: int) -> list[bytes]:
+    rng = random.Random(1)
+    files = []
+    for n in range(count):
+        size = (rng.randrange(200, 2000), rng.randrange(200, 2000))
+        image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+        output = io.BytesIO()
+        image.save(output, ["PNG", "JPEG", "WEBP"][n % 3])
+        files.append(output.getvalue())
+    # Sources that aren't images, read once and skipped
+    files.append(b"%PDF-1.7\n" + bytes(rng.randrange(256) for _ in range(20000)))
+    files.append(b"<svg xmlns='http://www.w3.org/2000/svg'/>" * 100)
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with tempfile.TemporaryDirectory() as media_root, Session(engine) as session:
+        settings.MEDIA_ROOT = media_root
+        get_storage.cache_clear()
+        try:
+            contents = samples(30)
+            rows = []
+            for n in range(args.files):
+                key = f"{company_id}/{n}/design"
+                path = Path(media_root, key)
+                path.parent.mkdir(parents=True)
+                path.write_bytes(contents[n % len(contents)])
+                rows.append({**params, "key": key})
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO designitem (id, title, company_id, creator_id, file_path, preview_path, file_size,
+                                        created_date)
+                VALUES (uuid_generate_v4(), 'bench', :company_id, :user_id, :key, :key, 0, CURRENT_DATE)
+            """), rows)
+            session.commit()
+
+            start = time.perf_counter()
+            result = backfill(session, batch_size=args.batch_size, workers=args.workers)
+            elapsed = time.perf_counter() - start
+            print(f"Read {result.images} images of {result.scanned} design items in {elapsed:.2f}s, "
+                  f"{result.scanned / elapsed:.0f} files/s")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark related design items.
+
+Creates --items items of a throwaway company with --links links to --tags
+tags drawn with a skewed usage, then reports how long the job takes to
+load the tag sets and to compute and store the related items of all
+items, a refresh after retagging --retag items, the latency percentiles
+of the stored lookup and of a per-request Jaccard in SQL, and removes
+everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_related_items.py
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+
+import numpy as np
+from sqlmodel import Session, select, text
+
+from app import crud, related_items
+from app.core.config import settings
+from app.core.db import engine
+from app.jobs.related_items import refresh
+from app.models import DesignItem, RelatedDesignItem, Tag
+from app.related_items import TagSets
+
+JACCARD_SQL = text("""
+    SELECT shared.design_item_id,
+           shared.n::float / (:size + (SELECT count(*) FROM tagitemlink AS sizes
+                                       WHERE sizes.design_item_id = shared.design_item_id) - shared.n) AS score
+    FROM (SELECT other.design_item_id, count(*) AS n
+          FROM tagitemlink AS other
+          WHERE other.tag_id IN (SELECT tag_id FROM tagitemlink WHERE design_item_id = :item_id)
+            AND other.design_item_id != :item_id
+          GROUP BY other.design_item_id) AS shared
+    ORDER BY score DESC, shared.design_item_id
+    LIMIT :limit
+""")
+
+
+def percentiles(run: Callable[[uuid.UUID], object], item_ids: list[uuid.UUID]) -> tuple[float, float]:
+    timings = []
+    for item_id in item_ids:
+        start = time.perf_counter()
+        run(item_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49], cuts[98]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tags", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--links", type=int, default=1_000_000)
+    parser.add_argument("--retag", type=int, default=100)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, :items, 0)
+            """), {**params, "items": args.items})
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title)
+                SELECT gen_random_uuid(), :company_id, 'topic ' || n || ' ' || left(CAST(:company_id AS text), 8)
+                FROM generate_series(1, :tags) AS n
+            """), {**params, "tags": args.tags})
+            session.execute(text("""
+                INSERT INTO designitem (id, company_id, creator_id, title, file_path, preview_path, created_date,
+                                        file_size)
+                SELECT gen_random_uuid(), :company_id, :user_id, 'item ' || n, 'bench/' || n, 'bench/' || n,
+                       current_date, 0
+                FROM generate_series(1, :items) AS n
+            """), {**params, "items": args.items})
+            # Few tags are on many items, most on a handful
+            session.execute(text("""
+                INSERT INTO tagitemlink (design_item_id, tag_id)
+                SELECT DISTINCT items.ids[1 + floor(random() * :items)::int],
+                                tags.ids[1 + floor(:tags * power(random(), 3))::int]
+                FROM (SELECT array_agg(id ORDER BY id) AS ids FROM tag WHERE company_id = :company_id) AS tags,
+                     (SELECT array_agg(id) AS ids FROM designitem WHERE company_id = :company_id) AS items,
+                     generate_series(1, :links)
+            """), {**params, "tags": args.tags, "items": args.items, "links": args.links})
+            session.commit()
+            session.execute(text("ANALYZE tag"))
+            session.execute(text("ANALYZE designitem"))
+            session.execute(text("ANALYZE tagitemlink"))
+            links = session.execute(text("SELECT count(*) FROM tagitemlink JOIN tag ON tag.id = tag_id "
+                                         "WHERE tag.company_id = :company_id"), params).scalar()
+
+            start = time.perf_counter()
+            tag_sets = TagSets.load(session, company_id)
+            load_s = time.perf_counter() - start
+            session.commit()
+            start = time.perf_counter()
+            tag_sets.top(np.arange(tag_sets.size), settings.RELATED_ITEMS_TOP_K)
+            compute_s = time.perf_counter() - start
+            start = time.perf_counter()
+            refresh(session, company_id, full=True)
+            full_s = time.perf_counter() - start
+            rows = session.exec(select(RelatedDesignItem.design_item_id).join(
+                DesignItem, DesignItem.id == RelatedDesignItem.design_item_id)
+                .where(DesignItem.company_id == company_id)).all()
+            print(f"{args.tags} tags, {links} links over {tag_sets.size} tagged items, "
+                  f"{tag_sets.bitsets.shape[1] * 8} bits for tags on over {settings.RELATED_ITEMS_MAX_TAG_ITEMS}")
+            print(f"load {load_s:.1f} s, compute {compute_s:.1f} s, full refresh with writes {full_s:.1f} s, "
+                  f"{len(rows)} rows")
+
+            rng = random.Random(1)
+            hot_id = session.exec(select(Tag.id).where(Tag.company_id == company_id)
+                                  .order_by(Tag.usage_count.desc())).first()
+            retagged = rng.sample(tag_sets.ids, args.retag)
+            crud.update_design_item_tags(session=session, company_id=company_id, item_ids=retagged,
+                                         add=[hot_id], remove=[])
+            start = time.perf_counter()
+            recomputed = refresh(session, company_id)
+            print(f"refresh after retagging {args.retag} items: {time.perf_counter() - start:.1f} s, "
+                  f"{recomputed} items recomputed")
+
+            lookups = rng.sample(tag_sets.ids, args.lookups)
+            stored = percentiles(lambda item_id: related_items.find_related(
+                session=session, design_item_id=item_id, limit=settings.RELATED_ITEMS_TOP_K), lookups)
+            sizes = dict(zip(tag_sets.ids, tag_sets.lengths.tolist()))
+            sql = percentiles(lambda item_id: session.execute(JACCARD_SQL, {
+                "item_id": item_id, "size": sizes[item_id], "limit": settings.RELATED_ITEMS_TOP_K}).all(),
+                lookups[:args.lookups // 10])
+            print(f"{'lookup':<28}{'p50 ms':>9}{'p99 ms':>9}")
+            print(f"{'stored':<28}{stored[0]:>9.2f}{stored[1]:>9.2f}")
+            print(f"{'Jaccard per request, SQL':<28}{sql[0]:>9.2f}{sql[1]:>9.2f}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tagitemlink WHERE tag_id IN "
+                                 "(SELECT id FROM tag WHERE company_id = :company_id)"), params)
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
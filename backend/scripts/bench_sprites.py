@@ -0,0 +1,139 @@
+"""
+Benchmark a gallery page served as one sprite sheet against one request
+per design item.
+
+Writes --items JPEG designs to a temporary MEDIA_ROOT as design items of a
+throwaway company, then times a page of them fetched item by item through
+the file endpoint and through the sprite endpoint, cold and cached, and
+removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_sprites.py
+"""
+import argparse
+import io
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from collections.abc import Callable
+from datetime import timedelta
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+from sqlmodel import Session, text
+
+from app import crud, thumbnails
+from app.core.config import settings
+from app.core.db import engine
+from app.core.security import create_access_token
+from app.main import app
+from app.storage import get_storage
+
+
+def design(seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (1600, 1200), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(20):
+        x, y = rng.randrange(1600), rng.randrange(1200)
+        draw.ellipse([x, y, x + rng.randrange(100, 600), y + rng.randrange(100, 600)],
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=90)
+    return output.getvalue()
+
+
+def timed(run: Callable[[], int], repeat: int) -> tuple[float, int]:
+    timings, requests = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        requests = run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with tempfile.TemporaryDirectory() as media_root, Session(engine) as session, TestClient(app) as client:
+        settings.MEDIA_ROOT = media_root
+        get_storage.cache_clear()
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, 0, 0)
+            """), params)
+            session.execute(text("""
+                INSERT INTO usercompanylink (company_id, user_id, role) VALUES (:company_id, :user_id, 'owner')
+            """), params)
+            session.commit()
+            item_ids = []
+            for n in range(args.items):
+                item_id = uuid.uuid4()
+                key = f"{company_id}/{item_id}/design-{n}.jpg"
+                content = design(n)
+                path = Path(media_root, key)
+                path.parent.mkdir(parents=True)
+                path.write_bytes(content)
+                crud.create_design_item(
+                    session=session, company_id=company_id, creator_id=user_id, item_id=item_id,
+                    title=f"design {n}", description=None, file_path=key, file_size=len(content))
+                item_ids.append(item_id)
+
+            token = create_access_token(user_id, timedelta(hours=1))
+            headers = {"Authorization": f"Bearer {token}"}
+            url = f"{settings.API_V1_STR}/{company_id}/item"
+
+            def per_item() -> int:
+                client.get(f"{url}/", headers=headers, params={"limit": args.items}).raise_for_status()
+                for item_id in item_ids:
+                    client.get(f"{url}/{item_id}/file", headers=headers).raise_for_status()
+                return 1 + len(item_ids)
+
+            def sprite() -> int:
+                r = client.get(f"{url}/sprite", headers=headers, params={"limit": args.items})
+                r.raise_for_status()
+                client.get(r.json()["sprite_url"], headers=headers).raise_for_status()
+                return 2
+
+            start = time.perf_counter()
+            sprite()
+            lazy = (time.perf_counter() - start) * 1000
+            for path in Path(settings.thumbnail_dir, "sprites").rglob("*.*"):
+                path.unlink()
+            start = time.perf_counter()
+            sprite()
+            cold = (time.perf_counter() - start) * 1000
+            sprite_bytes = sum(path.stat().st_size for path in Path(settings.thumbnail_dir, "sprites").rglob("*.webp"))
+            per_item_ms, per_item_requests = timed(per_item, args.repeat)
+            sprite_ms, sprite_requests = timed(sprite, args.repeat)
+
+            print(f"{args.items} items of {sum(len(design(n)) for n in range(3)) // 3 // 1024} KiB, "
+                  f"sprite {sprite_bytes // 1024} KiB, thumbnails {thumbnails.THUMBNAIL_SIZE} px")
+            print(f"{'per item':<40} {per_item_requests:>4} requests {per_item_ms:>8.1f} ms")
+            print(f"{'sprite, thumbnails made on first view':<40} {2:>4} requests {lazy:>8.1f} ms")
+            print(f"{'sprite, composed':<40} {2:>4} requests {cold:>8.1f} ms")
+            print(f"{'sprite, cached':<40} {sprite_requests:>4} requests {sprite_ms:>8.1f} ms")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark importing a taxonomy of tags in bulk and one at a time.
+
+Creates --tags tags of a throwaway company with the bulk create route, then
+--single with one create per tag as the import did before, and imports the
+same list in bulk once more over the existing tags, skipping and updating.
+The route functions are called directly, so only the server side counts.
+
+    cd backend && PYTHONPATH=. python scripts/bench_tag_bulk.py
+"""
+import argparse
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any
+
+from sqlmodel import Session, text
+
+from app.api.routes.tag import create_tag, create_tags
+from app.core.db import engine
+from app.models import CompanyRole, TagCreate, TagsBulkCreate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tags", type=int, default=10_000)
+    parser.add_argument("--single", type=int, default=1000, help="tags created one at a time")
+    args = parser.parse_args()
+
+    user_id = uuid.uuid4()
+    company_ids = [uuid.uuid4(), uuid.uuid4()]
+    employee: Any = SimpleNamespace(role=CompanyRole.owner)
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), {"user_id": user_id})
+            for company_id in company_ids:
+                session.execute(text("""
+                    INSERT INTO company (id, title, status, is_deleted)
+                    VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+                """), {"company_id": company_id})
+                session.execute(text("""
+                    INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, 0, 0)
+                """), {"company_id": company_id})
+            session.commit()
+
+            def taxonomy(company_id: uuid.UUID) -> list[TagCreate]:
+                # Titles are unique across companies
+                return [TagCreate(title=f"{str(company_id)[:8]} topic {n}", description=f"Topic number {n}")
+                        for n in range(args.tags)]
+
+            def one_request(company_id: uuid.UUID, tag_in: TagCreate) -> Any:
+                # A session per request, as the API does
+                with Session(engine) as session:
+                    return create_tag(session=session, company_id=company_id, current_employee=employee, tag_in=tag_in)
+
+            bulk, single = company_ids
+            print(f"{args.tags} tags")
+            for name, run in (
+                ("bulk, new", lambda: create_tags(
+                    session=session, company_id=bulk, current_employee=employee,
+                    tags_in=TagsBulkCreate(data=taxonomy(bulk)))),
+                ("one at a time, as before", lambda: [one_request(single, tag_in)
+                                                      for tag_in in taxonomy(single)[:args.single]]),
+                ("bulk, all skipped", lambda: create_tags(
+                    session=session, company_id=bulk, current_employee=employee,
+                    tags_in=TagsBulkCreate(data=taxonomy(bulk)))),
+                ("bulk, all updated", lambda: create_tags(
+                    session=session, company_id=bulk, current_employee=employee,
+                    tags_in=TagsBulkCreate(on_conflict="update", data=[
+                        TagCreate(title=tag.title.upper(), description=tag.description) for tag in taxonomy(bulk)]))),
+            ):
+                start = time.perf_counter()
+                result = run()
+                elapsed = (time.perf_counter() - start) * 1000
+                counts = (f"{result.created} created, {result.updated} updated, {result.skipped} skipped"
+                          if hasattr(result, "created") else f"{len(result)} created")
+                print(f"{name:<26} {elapsed:>9.0f} ms   {counts}")
+        finally:
+            session.rollback()
+            for company_id in company_ids:
+                session.execute(text("DELETE FROM company WHERE id = :company_id"), {"company_id": company_id})
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), {"user_id": user_id})
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
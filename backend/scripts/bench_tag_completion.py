@@ -0,0 +1,118 @@
+"""
+Benchmark tag autocomplete of a company with many tags.
+
+Creates --tags tags of a throwaway company, linked to its items with a
+skewed usage, then reports latency percentiles of completing prefixes of
+1 to 4 characters from the in-memory prefix index and from SQL, and
+removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_tag_completion.py
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+
+from sqlmodel import Session, text
+
+from app import tag_completion
+from app.core.db import engine
+from app.tag_completion import TagPrefixIndex
+
+
+def percentiles(run: Callable[[str], object], prefixes: list[str]) -> tuple[float, float]:
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        run(prefix)
+        timings.append((time.perf_counter() - start) * 1000)
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49], cuts[98]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tags", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=5_000)
+    parser.add_argument("--links", type=int, default=500_000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, :items, 0)
+            """), {**params, "items": args.items})
+            # Titles are unique across companies, a company-specific suffix keeps them apart
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title)
+                SELECT gen_random_uuid(), :company_id,
+                       left(md5(n::text), 8 + n % 12) || '-' || left(CAST(:company_id AS text), 8)
+                FROM generate_series(1, :tags) AS n
+            """), {**params, "tags": args.tags})
+            session.execute(text("""
+                INSERT INTO designitem (id, company_id, creator_id, title, file_path, preview_path, created_date,
+                                        file_size)
+                SELECT gen_random_uuid(), :company_id, :user_id, 'item ' || n, 'bench/' || n, 'bench/' || n,
+                       current_date, 0
+                FROM generate_series(1, :items) AS n
+            """), {**params, "items": args.items})
+            # Few tags are on many items, most on a handful
+            session.execute(text("""
+                INSERT INTO tagitemlink (design_item_id, tag_id)
+                SELECT DISTINCT items.ids[1 + floor(random() * :items)::int],
+                                tags.ids[1 + floor(:tags * power(random(), 3))::int]
+                FROM (SELECT array_agg(id ORDER BY id) AS ids FROM tag WHERE company_id = :company_id) AS tags,
+                     (SELECT array_agg(id) AS ids FROM designitem WHERE company_id = :company_id) AS items,
+                     generate_series(1, :links)
+            """), {**params, "tags": args.tags, "items": args.items, "links": args.links})
+            session.execute(text("""
+                UPDATE tag SET usage_count = counts.usage
+                FROM (SELECT tag_id, count(*) AS usage FROM tagitemlink GROUP BY tag_id) AS counts
+                WHERE tag.id = counts.tag_id AND tag.company_id = :company_id
+            """), params)
+            session.commit()
+            session.execute(text("ANALYZE tag"))
+            session.execute(text("ANALYZE tagitemlink"))
+
+            start = time.perf_counter()
+            index = TagPrefixIndex.build(session, company_id)
+            build_ms = (time.perf_counter() - start) * 1000
+            print(f"{args.tags} tags, {args.links} links drawn, index built in {build_ms:.0f} ms, "
+                  f"{index.nbytes / 2**20:.1f} MiB")
+
+            rng = random.Random(1)
+            titles = index.titles
+            print(f"{'prefix':<8}{'matches':>10}{'index p50':>12}{'p99 ms':>9}{'SQL p50':>12}{'p99 ms':>9}")
+            for length in range(1, 5):
+                prefixes = [rng.choice(titles)[:length] for _ in range(args.lookups)]
+                matches = statistics.mean(
+                    len(index.complete(prefix, args.tags)) for prefix in prefixes[:20])
+                memory = percentiles(lambda prefix: index.complete(prefix, args.limit), prefixes)
+                sql = percentiles(lambda prefix: tag_completion._complete_sql(
+                    session, company_id, prefix, args.limit), prefixes[:args.lookups // 5])
+                print(f"{length:<8}{matches:>10.0f}{memory[0]:>12.2f}{memory[1]:>9.2f}{sql[0]:>12.2f}{sql[1]:>9.2f}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tagitemlink WHERE tag_id IN "
+                                 "(SELECT id FROM tag WHERE company_id = :company_id)"), params)
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark tag suggestions from the co-occurrence index.
+
+Creates --tags tags of a throwaway company on --links links drawn over its
+items with a skewed usage, then reports how long building the index takes
+and its size and peak Python memory, the latency percentiles of
+suggestions for 1 to 3 chosen tags from the index and from the SQL
+self-join, and removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_tag_cooccurrence.py
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable
+
+from sqlmodel import Session, text
+
+from app import tag_cooccurrence
+from app.core.db import engine
+from app.tag_cooccurrence import TagCooccurrenceIndex
+
+
+def percentiles(run: Callable[[list[uuid.UUID]], object], choices: list[list[uuid.UUID]]) -> tuple[float, float]:
+    timings = []
+    for chosen in choices:
+        start = time.perf_counter()
+        run(chosen)
+        timings.append((time.perf_counter() - start) * 1000)
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49], cuts[98]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tags", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--links", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, :items, 0)
+            """), {**params, "items": args.items})
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title)
+                SELECT gen_random_uuid(), :company_id, 'topic ' || n || ' ' || left(CAST(:company_id AS text), 8)
+                FROM generate_series(1, :tags) AS n
+            """), {**params, "tags": args.tags})
+            session.execute(text("""
+                INSERT INTO designitem (id, company_id, creator_id, title, file_path, preview_path, created_date,
+                                        file_size)
+                SELECT gen_random_uuid(), :company_id, :user_id, 'item ' || n, 'bench/' || n, 'bench/' || n,
+                       current_date, 0
+                FROM generate_series(1, :items) AS n
+            """), {**params, "items": args.items})
+            # Few tags are on many items, most on a handful
+            session.execute(text("""
+                INSERT INTO tagitemlink (design_item_id, tag_id)
+                SELECT DISTINCT items.ids[1 + floor(random() * :items)::int],
+                                tags.ids[1 + floor(:tags * power(random(), 3))::int]
+                FROM (SELECT array_agg(id ORDER BY id) AS ids FROM tag WHERE company_id = :company_id) AS tags,
+                     (SELECT array_agg(id) AS ids FROM designitem WHERE company_id = :company_id) AS items,
+                     generate_series(1, :links)
+            """), {**params, "tags": args.tags, "items": args.items, "links": args.links})
+            session.commit()
+            session.execute(text("ANALYZE tag"))
+            session.execute(text("ANALYZE designitem"))
+            session.execute(text("ANALYZE tagitemlink"))
+            links = session.execute(text("SELECT count(*) FROM tagitemlink JOIN tag ON tag.id = tag_id "
+                                         "WHERE tag.company_id = :company_id"), params).scalar()
+
+            start = time.perf_counter()
+            index = TagCooccurrenceIndex.build(session, company_id)
+            build_ms = (time.perf_counter() - start) * 1000
+            session.commit()
+            # Again for the memory, tracing slows it down
+            tracemalloc.start()
+            TagCooccurrenceIndex.build(session, company_id)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            session.commit()
+            print(f"{args.tags} tags, {links} links over {args.items} items")
+            print(f"index built in {build_ms:.0f} ms, {len(index.data)} non-zero pairs, "
+                  f"{index.nbytes / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB while building")
+
+            rng = random.Random(1)
+            # Chosen tags weighted by usage, as the ones already on an item are
+            weights = [int(index.indptr[n + 1] - index.indptr[n]) + 1 for n in range(index.size)]
+            print(f"{'chosen':<8}{'index p50':>12}{'p99 ms':>9}{'SQL p50':>12}{'p99 ms':>9}")
+            for count in range(1, 4):
+                choices = [rng.choices(index.ids, weights, k=count) for _ in range(args.lookups)]
+                memory = percentiles(lambda chosen: index.suggest(chosen, args.limit), choices)
+                sql = percentiles(lambda chosen: tag_cooccurrence._suggest_sql(
+                    session, company_id, chosen, args.limit), choices[:args.lookups // 10])
+                print(f"{count:<8}{memory[0]:>12.2f}{memory[1]:>9.2f}{sql[0]:>12.2f}{sql[1]:>9.2f}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tagitemlink WHERE tag_id IN "
+                                 "(SELECT id FROM tag WHERE company_id = :company_id)"), params)
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
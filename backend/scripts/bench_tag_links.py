@@ -0,0 +1,104 @@
+"""
+Benchmark retagging many design items at once.
+
+Creates --items design items of a throwaway company, then attaches --tags
+tags to all of them and detaches them again with the bulk route function,
+and does the same with one transaction per design item as before, and
+removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_tag_links.py
+"""
+import argparse
+import time
+import uuid
+
+from sqlmodel import Session, delete, select, text
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import DesignItem, Tag, TagItemLink
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=2_000)
+    parser.add_argument("--tags", type=int, default=5)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, :items, 0)
+            """), {**params, "items": args.items})
+            session.execute(text("""
+                INSERT INTO designitem (id, company_id, creator_id, title, file_path, preview_path, created_date,
+                                        file_size)
+                SELECT gen_random_uuid(), :company_id, :user_id, 'item ' || n, 'bench/' || n, 'bench/' || n,
+                       current_date, 0
+                FROM generate_series(1, :items) AS n
+            """), {**params, "items": args.items})
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title)
+                SELECT gen_random_uuid(), :company_id, 'campaign ' || n || ' ' || left(CAST(:company_id AS text), 8)
+                FROM generate_series(1, :tags) AS n
+            """), {**params, "tags": args.tags})
+            session.commit()
+            # Fresh rows the planner hasn't seen would send the joins to sequential scans
+            session.execute(text("ANALYZE designitem"))
+            item_ids = list(session.exec(select(DesignItem.id).where(DesignItem.company_id == company_id)).all())
+            tag_ids = list(session.exec(select(Tag.id).where(Tag.company_id == company_id)).all())
+
+            def one_at_a_time(attach: bool) -> None:
+                # A transaction per design item, as separate requests would
+                for item_id in item_ids:
+                    with Session(engine) as session:
+                        if attach:
+                            session.add_all(TagItemLink(design_item_id=item_id, tag_id=tag_id) for tag_id in tag_ids)
+                        else:
+                            session.exec(delete(TagItemLink).where(  # type: ignore[call-overload]
+                                TagItemLink.design_item_id == item_id, TagItemLink.tag_id.in_(tag_ids)))
+                        crud.update_company_usage(session=session, company_id=company_id)
+                        session.commit()
+
+            def bulk(attach: bool) -> None:
+                crud.update_design_item_tags(
+                    session=session, company_id=company_id, item_ids=item_ids,
+                    add=tag_ids if attach else [], remove=[] if attach else tag_ids)
+
+            print(f"{args.items} design items, {args.tags} tags, "
+                  f"bulk in transactions of {settings.TAG_LINK_CHUNK_ITEMS} items")
+            for name, run in (("one at a time, before", one_at_a_time), ("bulk", bulk)):
+                timings = []
+                for attach in (True, False):
+                    start = time.perf_counter()
+                    run(attach)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    links = session.exec(text(  # type: ignore[call-overload]
+                        "SELECT count(*) FROM tagitemlink JOIN tag ON tag.id = tag_id "
+                        "WHERE tag.company_id = :company_id"), params=params).scalar()
+                    assert links == (args.items * args.tags if attach else 0)
+                    session.execute(text("ANALYZE tagitemlink"))
+                    session.commit()
+                print(f"{name:<22} attach {timings[0]:>8.0f} ms   detach {timings[1]:>8.0f} ms")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tagitemlink WHERE tag_id IN "
+                                 "(SELECT id FROM tag WHERE company_id = :company_id)"), params)
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark merging large tags.
+
+Creates --items design items of a throwaway company with a target tag and
+three source tags on overlapping thirds of them, merges the sources into
+the target in batches and in one transaction, and reports the total time
+and the longest transaction, for which the moved links stay locked, then
+removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_tag_merge.py
+"""
+import argparse
+import time
+import uuid
+
+from sqlmodel import Session, text
+
+from app import crud
+from app.core.db import engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, action="append", help="links per transaction, repeatable")
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, :items, 0)
+            """), {**params, "items": args.items})
+            session.execute(text("""
+                INSERT INTO designitem (id, company_id, creator_id, title, file_path, preview_path, created_date,
+                                        file_size)
+                SELECT gen_random_uuid(), :company_id, :user_id, 'item ' || n, 'bench/' || n, 'bench/' || n,
+                       current_date - n % 1000, 0
+                FROM generate_series(1, :items) AS n
+            """), {**params, "items": args.items})
+            session.commit()
+            session.execute(text("ANALYZE designitem"))
+
+            def setup(run: int) -> tuple[uuid.UUID, list[uuid.UUID]]:
+                # "logo" on a third of the items, "logos", "Logo final" and
+                # "logo-v2" on overlapping thirds
+                tag_ids = [uuid.uuid4() for _ in range(4)]
+                for n, tag_id in enumerate(tag_ids):
+                    session.execute(text("""
+                        INSERT INTO tag (id, company_id, title)
+                        VALUES (:tag_id, :company_id, 'logo ' || :n || ' ' || :run || ' ' || left(CAST(:company_id AS text), 8))
+                    """), {**params, "tag_id": tag_id, "n": n, "run": run})
+                    session.execute(text("""
+                        INSERT INTO tagitemlink (design_item_id, tag_id)
+                        SELECT id, :tag_id FROM designitem
+                        WHERE company_id = :company_id AND abs(hashtext(id::text)) % 6 BETWEEN :n AND :n + 1
+                    """), {**params, "tag_id": tag_id, "n": n})
+                session.commit()
+                session.execute(text("ANALYZE tagitemlink"))
+                return tag_ids[0], tag_ids[1:]
+
+            print(f"{args.items} design items")
+            for run, batch_size in enumerate(args.batch_size or [1_000, 5_000, 20_000, 10**9]):
+                target_id, source_ids = setup(run)
+                transactions = []
+                start = last = time.perf_counter()
+                for progress in crud.merge_tags(session=session, company_id=company_id, target_id=target_id,
+                                                source_ids=source_ids, batch_size=batch_size):
+                    now = time.perf_counter()
+                    transactions.append((now - last) * 1000)
+                    last = now
+                elapsed = (time.perf_counter() - start) * 1000
+                label = "one transaction" if batch_size >= progress.total else f"batches of {batch_size}"
+                print(f"{label:<20} {progress.moved} links, {progress.duplicates} duplicates: {elapsed:>7.0f} ms, "
+                      f"{len(transactions)} transactions, longest {max(transactions):.0f} ms")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tagitemlink WHERE tag_id IN "
+                                 "(SELECT id FROM tag WHERE company_id = :company_id)"), params)
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
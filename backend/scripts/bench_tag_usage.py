@@ -0,0 +1,140 @@
+"""
+Benchmark the stored tag usage counts.
+
+Creates --tags tags of a throwaway company, linked to its items with a
+skewed usage, then reports the latency of the first page of its tags by
+usage counted per request as before and read from Tag.usage_count, and the
+throughput of --writers threads tagging items with the same hot tag with
+and without maintaining the count, and removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_tag_usage.py
+"""
+import argparse
+import contextlib
+import statistics
+import threading
+import time
+import uuid
+from unittest import mock
+
+from sqlmodel import Session, select, text
+
+from app import crud
+from app.core.db import engine
+from app.models import DesignItem, Tag
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tags", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=5_000)
+    parser.add_argument("--links", type=int, default=500_000)
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, :items, 0)
+            """), {**params, "items": args.items})
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title)
+                SELECT gen_random_uuid(), :company_id, 'topic ' || n || ' ' || left(CAST(:company_id AS text), 8)
+                FROM generate_series(1, :tags) AS n
+            """), {**params, "tags": args.tags})
+            session.execute(text("""
+                INSERT INTO designitem (id, company_id, creator_id, title, file_path, preview_path, created_date,
+                                        file_size)
+                SELECT gen_random_uuid(), :company_id, :user_id, 'item ' || n, 'bench/' || n, 'bench/' || n,
+                       current_date, 0
+                FROM generate_series(1, :items) AS n
+            """), {**params, "items": args.items})
+            # Few tags are on many items, most on a handful
+            session.execute(text("""
+                INSERT INTO tagitemlink (design_item_id, tag_id)
+                SELECT DISTINCT items.ids[1 + floor(random() * :items)::int],
+                                tags.ids[1 + floor(:tags * power(random(), 3))::int]
+                FROM (SELECT array_agg(id ORDER BY id) AS ids FROM tag WHERE company_id = :company_id) AS tags,
+                     (SELECT array_agg(id) AS ids FROM designitem WHERE company_id = :company_id) AS items,
+                     generate_series(1, :links)
+            """), {**params, "tags": args.tags, "items": args.items, "links": args.links})
+            session.execute(text("""
+                UPDATE tag SET usage_count = counts.usage
+                FROM (SELECT tag_id, count(*) AS usage FROM tagitemlink GROUP BY tag_id) AS counts
+                WHERE tag.id = counts.tag_id AND tag.company_id = :company_id
+            """), params)
+            session.commit()
+            session.execute(text("ANALYZE tag"))
+            session.execute(text("ANALYZE tagitemlink"))
+
+            print(f"{args.tags} tags, {args.links} links drawn")
+            for name, key in (("counted, as before", crud.tag_usage()), ("usage_count", Tag.usage_count)):
+                statement = (select(Tag.id, Tag.title, key.label("key"))
+                             .where(Tag.company_id == company_id)
+                             .order_by(key.desc(), Tag.id)
+                             .limit(100))
+                timings = []
+                for _ in range(args.lookups):
+                    start = time.perf_counter()
+                    session.exec(statement).all()
+                    timings.append((time.perf_counter() - start) * 1000)
+                print(f"first page by usage, {name:<20} median {statistics.median(timings):>8.2f} ms")
+
+            hot_id = session.exec(select(Tag.id).where(Tag.company_id == company_id)
+                                  .order_by(Tag.usage_count.desc())).first()
+            item_ids = list(session.exec(select(DesignItem.id).where(DesignItem.company_id == company_id)).all())
+            # Every run detaches it from all the items and attaches it back
+            crud.update_design_item_tags(session=session, company_id=company_id, item_ids=item_ids,
+                                         add=[hot_id], remove=[])
+
+            def write(item_ids: list[uuid.UUID], attach: bool) -> None:
+                # One request per item, as the tagging UI sends them
+                for item_id in item_ids:
+                    with Session(engine) as session:
+                        crud.update_design_item_tags(
+                            session=session, company_id=company_id, item_ids=[item_id],
+                            add=[hot_id] if attach else [], remove=[] if attach else [hot_id])
+
+            def run(attach: bool) -> float:
+                share = len(item_ids) // args.writers
+                threads = [threading.Thread(target=write, args=(item_ids[n * share:(n + 1) * share], attach))
+                           for n in range(args.writers)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                return share * args.writers / (time.perf_counter() - start)
+
+            for name, patch in (("with usage_count", contextlib.nullcontext()),
+                                ("without usage_count", mock.patch.object(crud, "update_tag_usage"))):
+                with patch:
+                    detach, attach = run(False), run(True)
+                print(f"hot tag, {args.writers} writers, {name:<20} detach {detach:>6.0f}/s   attach {attach:>6.0f}/s")
+            session.expire_all()
+            hot = session.get(Tag, hot_id)
+            actual = session.execute(text("SELECT count(*) FROM tagitemlink WHERE tag_id = :tag_id"),
+                                     {"tag_id": hot_id}).scalar()
+            print(f"hot tag usage_count {hot.usage_count if hot else None}, links {actual}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tagitemlink WHERE tag_id IN "
+                                 "(SELECT id FROM tag WHERE company_id = :company_id)"), params)
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark the company tag listing of a company with many tags.
+
+Creates --tags tags of a throwaway company, then reports time, response
+size and peak Python memory of one page of the listing, of the NDJSON
+stream of all tags and of loading every tag at once as the listing did
+before it was paginated, and removes everything again. The route
+functions are called directly, so the memory is the server's alone.
+
+    cd backend && PYTHONPATH=. python scripts/bench_tags.py
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from sqlmodel import Session, select, text
+
+from app.api.routes.company import ndjson_tags, read_company_tags
+from app.core.db import engine
+from app.models import Tag, TagsPublic, TagsQuery
+
+
+def measure(run: Callable[[], int]) -> tuple[float, int, int]:
+    start = time.perf_counter()
+    size = run()
+    elapsed = (time.perf_counter() - start) * 1000
+    # Tracing slows everything down, memory is measured on a second run
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tags", type=int, default=50_000)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO usercompanylink (company_id, user_id, role) VALUES (:company_id, :user_id, 'owner')
+            """), params)
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title, description)
+                SELECT gen_random_uuid(), :company_id, left(md5(CAST(:company_id AS text) || n), 31),
+                       'Tag number ' || n || ' of the benchmark'
+                FROM generate_series(1, :tags) AS n
+            """), {**params, "tags": args.tags})
+            session.commit()
+            session.execute(text("ANALYZE tag"))
+
+            employee: Any = None
+
+            def unpaginated() -> int:
+                # What the listing did before: every tag entity in one response
+                with Session(engine) as session:
+                    tags = session.exec(select(Tag).where(Tag.company_id == company_id)).all()
+                    return len(TagsPublic(data=tags).model_dump_json())  # type: ignore[arg-type]
+
+            def page(sort: str) -> Callable[[], int]:
+                def run() -> int:
+                    with Session(engine) as session:
+                        tags = read_company_tags(session, company_id, employee, TagsQuery(sort=sort))
+                        return len(tags.model_dump_json())
+                return run
+
+            def stream(sort: str) -> Callable[[], int]:
+                return lambda: sum(len(chunk) for chunk in ndjson_tags(company_id, sort))  # type: ignore[arg-type]
+
+            print(f"{args.tags} tags")
+            for name, run in (
+                ("all at once, before", unpaginated),
+                ("page of 100 by title", page("title")),
+                ("page of 100 by usage", page("usage")),
+                ("NDJSON stream by title", stream("title")),
+                ("NDJSON stream by usage", stream("usage")),
+            ):
+                run()
+                elapsed, size, peak = measure(run)
+                print(f"{name:<26} {elapsed:>8.1f} ms {size / 1024:>9.0f} KiB sent {peak / 2**20:>8.1f} MiB peak")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
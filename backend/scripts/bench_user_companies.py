@@ -0,0 +1,113 @@
+"""
+Benchmark the caller's company listing.
+
+Creates a user employed by --companies throwaway companies of --employees
+employees and --tags tags each, reports the latency percentiles of the
+first page of GET /users/me/companies against the per company queries the
+home screen ran before (company with its usage, employee and tag counts,
+each checking the caller's role first), and removes everything again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_user_companies.py
+"""
+import argparse
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+
+from sqlmodel import Session, func, select, text
+
+from app import crud
+from app.core.db import engine
+from app.models import Company, Tag, UserCompanyLink
+
+
+def percentiles(run: Callable[[], object], repeat: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    cuts = statistics.quantiles(timings, n=100)
+    return cuts[49], cuts[98]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--companies", type=int, default=200)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--tags", type=int, default=1_000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    user_id, prefix = uuid.uuid4(), f"bench-{uuid.uuid4().hex[:8]}-"
+    params = {"user_id": user_id, "prefix": prefix}
+    with Session(engine) as session:
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                SELECT CASE WHEN n = 0 THEN :user_id ELSE gen_random_uuid() END,
+                       :prefix || n || '@example.com', true, false, '-', false
+                FROM generate_series(0, :employees) AS n
+            """), {**params, "employees": args.employees})
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                SELECT gen_random_uuid(), :prefix || n, 'public', false FROM generate_series(1, :companies) AS n
+            """), {**params, "companies": args.companies})
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews)
+                SELECT id, 0, 0, 0 FROM company WHERE title LIKE :prefix || '%'
+            """), params)
+            session.execute(text("""
+                INSERT INTO usercompanylink (company_id, user_id, role)
+                SELECT company.id, "user".id, CASE WHEN "user".id = :user_id THEN 'owner' ELSE 'reader' END::companyrole
+                FROM company, "user"
+                WHERE company.title LIKE :prefix || '%' AND "user".email LIKE :prefix || '%'
+            """), params)
+            session.execute(text("""
+                INSERT INTO tag (id, company_id, title)
+                SELECT gen_random_uuid(), company.id, 'topic ' || n || ' ' || left(CAST(company.id AS text), 8)
+                FROM company, generate_series(1, :tags) AS n
+                WHERE company.title LIKE :prefix || '%'
+            """), {**params, "tags": args.tags})
+            session.commit()
+            for table in ("company", "companyusage", "usercompanylink", "tag"):
+                session.execute(text(f"ANALYZE {table}"))
+
+            def per_company() -> None:
+                company_ids = session.exec(
+                    select(UserCompanyLink.company_id).where(UserCompanyLink.user_id == user_id)
+                    .limit(args.page)).all()
+                for company_id in company_ids:
+                    for _ in range(3):
+                        crud.get_user_company_role(session=session, company_id=company_id, user_id=user_id)
+                    session.exec(select(Company).where(Company.id == company_id)).one()
+                    crud.get_company_usage(session=session, company_id=company_id)
+                    session.exec(select(func.count()).select_from(UserCompanyLink)
+                                 .where(UserCompanyLink.company_id == company_id)).one()
+                    session.exec(select(func.count()).select_from(Tag).where(Tag.company_id == company_id)).one()
+                session.expunge_all()
+
+            cases: list[tuple[str, Callable[[], object]]] = [
+                ("one statement", lambda: crud.list_user_companies(
+                    session=session, user_id=user_id, limit=args.page + 1)),
+                ("queries per company", per_company),
+            ]
+            print(f"{args.companies} companies of {args.employees} employees and {args.tags} tags, "
+                  f"pages of {args.page}")
+            print(f"{'home screen':<28}{'p50 ms':>9}{'p99 ms':>9}")
+            for label, run in cases:
+                p50, p99 = percentiles(run, args.repeat)
+                print(f"{label:<28}{p50:>9.2f}{p99:>9.2f}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM tag WHERE company_id IN "
+                                 "(SELECT id FROM company WHERE title LIKE :prefix || '%')"), params)
+            session.execute(text("DELETE FROM company WHERE title LIKE :prefix || '%'"), params)
+            session.execute(text('DELETE FROM "user" WHERE email LIKE :prefix || \'%\''), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark design item version history stored as zstd patches.
+
+Records --versions successive edits of a few kinds of design files as
+versions of design items of a throwaway company in a temporary MEDIA_ROOT,
+then reports what their history takes in storage next to keeping every
+version whole, the time to store a version and to read old versions back
+at each distance from their last whole version, and removes everything
+again.
+
+    cd backend && PYTHONPATH=. python scripts/bench_versions.py
+"""
+import argparse
+import io
+import json
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from collections.abc import Callable
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+from sqlmodel import Session, text
+
+from app import crud, versions
+from app.core.config import settings
+from app.core.db import engine
+from app.storage import get_storage
+from app.storage.compression import compress_file
+
+
+def svg_history(rng: random.Random, count: int) -> list[bytes]:
+    lines = [f'<path d="M{rng.randrange(1000)} {rng.randrange(1000)} L{rng.randrange(1000)} {rng.randrange(1000)}Z" '
+             f'fill="#{rng.randrange(1 << 24):06x}"/>\n' for _ in range(20_000)]
+    history = []
+    for _ in range(count):
+        history.append(f'<svg viewBox="0 0 1000 1000">\n{"".join(lines)}</svg>\n'.encode())
+        # Recolor a few shapes, draw some new ones
+        for n in rng.sample(range(len(lines)), 50):
+            lines[n] = lines[n][:lines[n].index("fill=")] + f'fill="#{rng.randrange(1 << 24):06x}"/>\n'
+        for _ in range(20):
+            lines.insert(rng.randrange(len(lines)), f'<circle cx="{rng.randrange(1000)}" fill="none"/>\n')
+    return history
+
+
+def json_history(rng: random.Random, count: int) -> list[bytes]:
+    nodes = [{"id": f"{n:x}", "name": f"Layer {n}", "x": rng.randrange(1440), "y": rng.randrange(4000),
+              "opacity": 1.0, "text": rng.choice(["Buy now", "Sign up", "", "Learn more"])} for n in range(15_000)]
+    history = []
+    for _ in range(count):
+        history.append(json.dumps({"document": nodes, "schemaVersion": 14}, indent=2).encode())
+        for node in rng.sample(nodes, 30):
+            node["x"] += rng.randrange(-20, 20)
+            node["opacity"] = round(rng.random(), 2)
+    return history
+
+
+def pdf_history(rng: random.Random, count: int) -> list[bytes]:
+    ops = [f"{rng.uniform(0, 600):.2f} {rng.uniform(0, 800):.2f} {rng.uniform(1, 200):.2f} {rng.uniform(1, 200):.2f} "
+           f"re {rng.random():.3f} {rng.random():.3f} {rng.random():.3f} rg f\n" for _ in range(30_000)]
+    history = []
+    for _ in range(count):
+        stream = "".join(ops)
+        history.append(f"%PDF-1.7\n1 0 obj\n<< /Length {len(stream)} >>\nstream\n{stream}endstream\nendobj\n%%EOF\n"
+                       .encode())
+        for n in rng.sample(range(len(ops)), 40):
+            ops[n] = f"{rng.uniform(0, 600):.2f} {rng.uniform(0, 800):.2f} 10.00 10.00 re 0.000 0.000 0.000 rg f\n"
+    return history
+
+
+def image_history(rng: random.Random, count: int, format: str) -> list[bytes]:
+    image = Image.new("RGB", (2000, 1500), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(2000), rng.randrange(1500)
+        draw.ellipse([x, y, x + rng.randrange(50, 400), y + rng.randrange(50, 400)],
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    history = []
+    for _ in range(count):
+        output = io.BytesIO()
+        image.save(output, format)
+        history.append(output.getvalue())
+        # Touch up one area
+        x, y = rng.randrange(1800), rng.randrange(1300)
+        draw.rectangle([x, y, x + 200, y + 200], fill=tuple(rng.randrange(256) for _ in range(3)))
+    return history
+
+
+KINDS: dict[str, tuple[str, Callable[[random.Random, int], list[bytes]]]] = {
+    "svg": ("logo.svg", svg_history),
+    "json": ("screen.json", json_history),
+    "pdf": ("flyer.pdf", pdf_history),
+    "tiff": ("scan.tiff", lambda rng, count: image_history(rng, count, "TIFF")),
+    "png": ("banner.png", lambda rng, count: image_history(rng, count, "PNG")),
+}
+
+
+def store(media_root: str, key: str, content: bytes) -> str | None:
+    # As chunked uploads store files
+    path = Path(media_root, ".spool")
+    path.write_bytes(content)
+    codec = compress_file(path)
+    get_storage().put_file(key, path)
+    return codec
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--versions", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    params = {"company_id": company_id, "user_id": user_id}
+    with tempfile.TemporaryDirectory() as media_root, Session(engine) as session:
+        settings.MEDIA_ROOT = media_root
+        get_storage.cache_clear()
+        storage = get_storage()
+        try:
+            session.execute(text("""
+                INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, is_delited)
+                VALUES (:user_id, 'bench-' || :user_id || '@example.com', true, false, '-', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO company (id, title, status, is_deleted)
+                VALUES (:company_id, 'bench-' || :company_id, 'public', false)
+            """), params)
+            session.execute(text("""
+                INSERT INTO companyusage (company_id, bytes, items, previews) VALUES (:company_id, 0, 0, 0)
+            """), params)
+            session.commit()
+
+            print(f"{args.versions} versions each, a whole version every {settings.VERSION_SNAPSHOT_INTERVAL}, "
+                  f"patches at zstd level {settings.VERSION_DELTA_LEVEL}")
+            print(f"{'':<6}{'file MiB':>10}{'whole MiB':>11}{'history MiB':>13}{'saved':>8}"
+                  f"{'store ms':>10}   read ms by patches applied")
+            for kind, (filename, make_history) in KINDS.items():
+                history = make_history(random.Random(1), args.versions)
+                item_id = uuid.uuid4()
+                key = f"{company_id}/{item_id}/{filename}"
+                item = crud.create_design_item(
+                    session=session, company_id=company_id, creator_id=user_id, item_id=item_id, title=kind,
+                    description=None, file_path=key, file_size=len(history[0]),
+                    file_codec=store(media_root, key, history[0]))
+                whole = storage.stat(key).size  # type: ignore[union-attr]
+                store_ms = []
+                for content in history[1:]:
+                    key = f"{company_id}/{uuid.uuid4()}/{filename}"
+                    codec = store(media_root, key, content)
+                    whole += storage.stat(key).size  # type: ignore[union-attr]
+                    replaced = item.file_path
+                    start = time.perf_counter()
+                    version, previous = versions.store_version(
+                        session=session, item=item, creator_id=user_id, filename=filename,
+                        file_path=key, file_size=len(content), file_codec=codec)
+                    item = crud.add_design_item_version(
+                        session=session, db_item=item, version=version, previous=previous,
+                        file_path=key, file_codec=codec)
+                    store_ms.append((time.perf_counter() - start) * 1000)
+                    if previous.base_number is not None:
+                        storage.delete(replaced)
+                rows = crud.list_design_item_versions(session=session, design_item_id=item.id)
+                stored = storage.stat(item.file_path).size + sum(  # type: ignore[union-attr]
+                    row.stored_size for row in rows if row.file_path != item.file_path)
+
+                # Older versions by the number of patches applied to read them
+                read_ms: dict[int, list[float]] = {}
+                for row in rows[1:]:
+                    chain = versions.version_chain(session, item.id, row.number)
+                    timings = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        content = b"".join(versions.iter_version_content(chain))
+                        timings.append((time.perf_counter() - start) * 1000)
+                    assert content == history[row.number - 1]
+                    read_ms.setdefault(len(chain) - 1, []).append(statistics.median(timings))
+                reads = " ".join(f"{depth}:{statistics.median(timings):.0f}"
+                                 for depth, timings in sorted(read_ms.items()))
+                print(f"{kind:<6}{len(history[-1]) / 2**20:>10.1f}{whole / 2**20:>11.1f}{stored / 2**20:>13.2f}"
+                      f"{1 - stored / whole:>8.0%}{statistics.median(store_ms):>10.0f}   {reads}")
+        finally:
+            session.rollback()
+            session.execute(text("DELETE FROM company WHERE id = :company_id"), params)
+            session.execute(text('DELETE FROM "user" WHERE id = :user_id'), params)
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import json
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.api.routes import company as company_routes
+from app.core.config import settings
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, create_random_tag
+from tests.utils.user import create_random_user
+
+
+def test_read_company_tags_pages(
+    client: TestClient, normal_user_token_headers: dict[str, str], superuser_token_headers: dict[str, str],
+    db: Session, media_root: object
+) -> None:
+    company = create_random_company(db, create_random_user(db))
+    items = [create_random_design_item(db, company) for _ in range(4)]
+    tags = [create_random_tag(db, company, items[:usage]) for usage in (0, 3, 1, 3, 4, 2, 1)]
+    usage = {str(tag.id): tag.design_items for tag in tags}
+    url = f"{settings.API_V1_STR}/company/{company.id}/tags"
+
+    for sort, expected in (
+        ("title", sorted(tags, key=lambda tag: tag.title)),
+        # Ties in usage go by id
+        ("usage", sorted(tags, key=lambda tag: (-len(tag.design_items), tag.id))),
+    ):
+        pages, cursor = [], None
+        while True:
+            r = client.get(url, headers=superuser_token_headers,
+                           params={"sort": sort, "limit": 3, **({"cursor": cursor} if cursor else {})})
+            assert r.status_code == 200
+            pages.append([tag["id"] for tag in r.json()["data"]])
+            assert all(tag["usage_count"] == len(usage[tag["id"]]) for tag in r.json()["data"])
+            cursor = r.json()["next_cursor"]
+            if not cursor:
+                break
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert sum(pages, []) == [str(tag.id) for tag in expected]
+
+        r = client.get(f"{url}/stream", headers=superuser_token_headers, params={"sort": sort})
+        assert r.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line)["id"] for line in r.text.splitlines()] == [str(tag.id) for tag in expected]
+
+    # Cursors only continue the sort they come from
+    r = client.get(url, headers=superuser_token_headers, params={"sort": "title", "limit": 3})
+    r = client.get(url, headers=superuser_token_headers, params={"sort": "usage", "cursor": r.json()["next_cursor"]})
+    assert r.status_code == 400
+
+
+def test_read_company_overview(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session, media_root: object
+) -> None:
+    owner = create_random_user(db)
+    company = create_random_company(db, owner)
+    items = [create_random_design_item(db, company) for _ in range(2)]
+    tags = [create_random_tag(db, company, items[:usage]) for usage in (0, 1, 2)]
+    url = f"{settings.API_V1_STR}/company/{company.id}/overview"
+
+    r = client.get(url, headers=superuser_token_headers, params={"limit": 2})
+    assert r.status_code == 200
+    overview = r.json()
+    assert overview["company"]["id"] == str(company.id)
+    assert overview["company"]["usage"]["items"] == 2
+    # The superuser isn't an employee
+    assert overview["role"] is None
+    assert (overview["employee_count"], overview["tag_count"]) == (1, 3)
+    assert [tag["id"] for tag in overview["tags"]["data"]] == [
+        str(tag.id) for tag in sorted(tags, key=lambda tag: tag.title)[:2]]
+    assert overview["tags"]["next_cursor"]
+    assert [employee["id"] for employee in overview["employees"]["data"]] == [str(owner.id)]
+    assert overview["employees"]["next_cursor"] is None
+
+    etag = r.headers["ETag"]
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag}, params={"limit": 2})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["ETag"] == etag
+
+    create_random_tag(db, company)
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag}, params={"limit": 2})
+    assert r.status_code == 200
+    assert r.json()["tag_count"] == 4
+    assert r.headers["ETag"] != etag
+
+    # With every overview thread busy, the parts run in the request
+    etag = r.headers["ETag"]
+    for _ in range(settings.COMPANY_OVERVIEW_WORKERS):
+        assert company_routes.overview_slots.acquire(blocking=False)
+    try:
+        r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag}, params={"limit": 2})
+        assert r.status_code == 304
+    finally:
+        for _ in range(settings.COMPANY_OVERVIEW_WORKERS):
+            company_routes.overview_slots.release()
@@ -0,0 +1,423 @@
+import io
+import uuid
+import zipfile
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlmodel import Session, func, select
+
+from app import crud
+from app.core.config import settings
+from app.jobs import related_items
+from app.models import Company, CompanyUsage, DesignItemFilter, TagItemLink
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, create_random_tag, random_design_image
+from tests.utils.user import create_random_user
+
+pytestmark = pytest.mark.usefixtures("media_root")
+
+
+def test_read_design_item_file(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    item = create_random_design_item(db, company, content=b"layers")
+    r = client.get(f"{settings.API_V1_STR}/{company.id}/item/{item.id}/file",
+                   headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.content == b"layers"
+
+    r = client.get(f"{settings.API_V1_STR}/{company.id}/item/{uuid.uuid4()}/file",
+                   headers=normal_user_token_headers)
+    assert r.status_code == 404
+
+    # Names outside latin-1 go in filename*, the plain filename gets an ASCII stand-in
+    item = create_random_design_item(db, company, filename='Логотип "final".psd', content=b"layers")
+    disposition = """attachment; filename="_final_.psd"; filename*=UTF-8''""" \
+        "%D0%9B%D0%BE%D0%B3%D0%BE%D1%82%D0%B8%D0%BF%20%22final%22.psd"
+    for path in ("file", "versions/1/file"):
+        r = client.get(f"{settings.API_V1_STR}/{company.id}/item/{item.id}/{path}",
+                       headers=normal_user_token_headers)
+        assert r.status_code == 200
+        assert r.headers["content-disposition"] == disposition
+        assert r.content == b"layers"
+
+
+def test_read_compressed_design_item_file(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    svg = b"<svg xmlns='http://www.w3.org/2000/svg'>" + b"<rect width='10' height='10'/>" * 5000 + b"</svg>"
+    item = create_random_design_item(db, company, filename="logo.svg", content=svg, compress=True)
+    bitmap = create_random_design_item(
+        db, company, filename="scan.bmp", content=random_design_image(5, "BMP"), compress=True)
+    photo = create_random_design_item(
+        db, company, filename="photo.jpg", content=random_design_image(5, "JPEG"), compress=True)
+    assert (item.file_codec, bitmap.file_codec, photo.file_codec) == ("zstd", "zstd", None)
+    # Readers of the preview see through the codec
+    assert (bitmap.image_width, bitmap.image_format) == (400, "BMP")
+    assert bitmap.perceptual_hash is not None and bitmap.thumbnail_hash
+    url = f"{settings.API_V1_STR}/{company.id}/item/{item.id}/file"
+
+    r = client.get(url, headers={**normal_user_token_headers, "Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.content == svg
+    assert r.headers["content-length"] == str(len(svg))
+    assert "content-encoding" not in r.headers and "Accept-Encoding" in r.headers["vary"]
+
+    with client.stream("GET", url, headers={**normal_user_token_headers, "Accept-Encoding": "gzip, zstd"}) as r:
+        assert r.headers["content-encoding"] == "zstd"
+        stored = b"".join(r.iter_raw())
+    assert len(stored) < len(svg) // 10
+    assert zstandard.decompress(stored) == svg
+
+    r = client.get(url, headers={**normal_user_token_headers, "Accept-Encoding": "zstd;q=0"})
+    assert "content-encoding" not in r.headers
+
+    r = client.post(f"{settings.API_V1_STR}/{company.id}/item/export", headers=normal_user_token_headers,
+                    json={"ids": [str(item.id)]})
+    with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+        assert archive.read("logo.svg") == svg
+
+
+def test_read_similar_design_items(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    item = create_random_design_item(db, company, filename="logo.png", content=random_design_image(3))
+    copy = create_random_design_item(db, company, filename="logo.webp", content=random_design_image(3, "WEBP"))
+    create_random_design_item(db, company, filename="other.png", content=random_design_image(4))
+    url = f"{settings.API_V1_STR}/{company.id}/item"
+
+    r = client.get(f"{url}/{item.id}/similar", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert [similar["id"] for similar in r.json()["data"]] == [str(copy.id)]
+
+    r = client.get(f"{url}/{item.id}/similar", params={"max_distance": 64}, headers=normal_user_token_headers)
+    assert r.status_code == 422
+
+    untagged = create_random_design_item(db, company, filename="brief.txt")
+    r = client.get(f"{url}/{untagged.id}/similar", headers=normal_user_token_headers)
+    assert r.json()["data"] == []
+
+
+def test_read_related_design_items(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    item, same, close, other = (create_random_design_item(db, company, content=b"x") for _ in range(4))
+    create_random_tag(db, company, [item, same, close])
+    create_random_tag(db, company, [item, same])
+    create_random_tag(db, company, [other])
+    related_items.refresh(db, company.id, full=True)
+    url = f"{settings.API_V1_STR}/{company.id}/item"
+
+    r = client.get(f"{url}/{item.id}/related", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert [(related["id"], related["score"]) for related in r.json()["data"]] == [
+        (str(same.id), 1.0), (str(close.id), 0.5)]
+    r = client.get(f"{url}/{item.id}/related", params={"limit": 1}, headers=normal_user_token_headers)
+    assert [related["id"] for related in r.json()["data"]] == [str(same.id)]
+    r = client.get(f"{url}/{other.id}/related", headers=normal_user_token_headers)
+    assert r.json()["data"] == []
+    r = client.get(f"{url}/{uuid.uuid4()}/related", headers=normal_user_token_headers)
+    assert r.status_code == 404
+
+
+def test_export_design_items(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    psd = create_random_design_item(db, company, filename="a.psd", content=b"a" * 10000)
+    png = create_random_design_item(db, company, filename="b.png", content=b"\x89PNG" * 100)
+    same_name = create_random_design_item(db, company, filename="a.psd", content=b"other")
+    untagged = create_random_design_item(db, company, filename="c.svg")
+    tag = create_random_tag(db, company, [png, same_name])
+
+    r = client.post(f"{settings.API_V1_STR}/{company.id}/item/export", headers=normal_user_token_headers,
+                    json={"ids": [str(psd.id)], "tag_ids": [str(tag.id)]})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/zip"
+
+    archive = zipfile.ZipFile(io.BytesIO(r.content))
+    assert archive.testzip() is None
+    infos = {info.filename: info for info in archive.infolist()}
+    assert len(infos) == 3
+    assert infos["a.psd"].compress_type == zipfile.ZIP_DEFLATED
+    assert infos["b.png"].compress_type == zipfile.ZIP_STORED
+    duplicate = next(name for name in infos if name.endswith("/a.psd"))
+    assert duplicate in (f"{psd.id}/a.psd", f"{same_name.id}/a.psd")
+    assert {archive.read("a.psd"), archive.read(duplicate)} == {b"a" * 10000, b"other"}
+    assert untagged.file_path.split("/")[-1] not in infos
+
+
+def test_export_design_items_unknown_size(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    # Stored before sizes were recorded
+    item = create_random_design_item(db, company, filename="old.psd", content=b"a" * 10000)
+    item.file_size = 0
+    db.add(item)
+    db.commit()
+
+    r = client.post(f"{settings.API_V1_STR}/{company.id}/item/export", headers=normal_user_token_headers,
+                    json={"ids": [str(item.id)]})
+    assert r.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(r.content))
+    assert archive.testzip() is None
+    assert archive.read("old.psd") == b"a" * 10000
+
+
+def test_export_design_items_empty_selection(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company
+) -> None:
+    r = client.post(f"{settings.API_V1_STR}/{company.id}/item/export",
+                    headers=normal_user_token_headers, json={})
+    assert r.status_code == 400
+
+
+def test_delete_design_item_updates_usage(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session, media_root: Path
+) -> None:
+    before = crud.get_company_usage(session=db, company_id=company.id)
+    item = create_random_design_item(db, company, content=b"x" * 42)
+    r = client.get(f"{settings.API_V1_STR}/company/{company.id}", headers=normal_user_token_headers)
+    assert r.json()["usage"]["bytes"] == before.bytes + 42
+    assert r.json()["usage"]["items"] == before.items + 1
+
+    r = client.delete(f"{settings.API_V1_STR}/{company.id}/item/{item.id}", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert not (media_root / item.file_path).exists()
+    r = client.get(f"{settings.API_V1_STR}/company/{company.id}", headers=normal_user_token_headers)
+    assert r.json()["usage"]["bytes"] == before.bytes
+    assert r.json()["usage"]["items"] == before.items
+
+
+def test_read_design_items_tag_filters(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    both, red, blue = (create_random_design_item(db, company) for _ in range(3))
+    red_tag = create_random_tag(db, company, [both, red])
+    blue_tag = create_random_tag(db, company, [both, blue])
+    url = f"{settings.API_V1_STR}/{company.id}/item/"
+
+    def ids(**params: Any) -> set[str]:
+        r = client.get(url, headers=normal_user_token_headers, params=params)
+        assert r.status_code == 200
+        return {item["id"] for item in r.json()["data"]}
+
+    assert ids(tags_all=[str(red_tag.id), str(blue_tag.id)]) == {str(both.id)}
+    assert ids(tags_any=[str(red_tag.id), str(blue_tag.id)]) == {str(both.id), str(red.id), str(blue.id)}
+    assert ids(tags_any=[str(red_tag.id)], tags_none=[str(blue_tag.id)]) == {str(red.id)}
+    tomorrow = date.today() + timedelta(days=1)
+    assert ids(tags_any=[str(red_tag.id)], created_from=tomorrow.isoformat()) == set()
+    assert ids(tags_any=[str(red_tag.id)], created_to=tomorrow.isoformat()) == {str(both.id), str(red.id)}
+
+
+def test_update_design_items_tags(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "TAG_LINK_CHUNK_ITEMS", 2)
+    items = [create_random_design_item(db, company) for _ in range(5)]
+    red = create_random_tag(db, company, items[:2])
+    blue = create_random_tag(db, company, items[1:3])
+    other = create_random_tag(db, create_random_company(db, create_random_user(db)))
+    url = f"{settings.API_V1_STR}/{company.id}/item/tags"
+    usage = db.get(CompanyUsage, company.id)
+    assert usage
+    revision = usage.revision
+
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "ids": [str(item.id) for item in items] + [str(uuid.uuid4())],
+        "add": [str(red.id), str(other.id)],
+        "remove": [str(blue.id)],
+    })
+    assert r.status_code == 200
+    assert r.json() == {"items": 5, "added": 3, "removed": 2}
+    for tag, expected in ((red, items), (blue, []), (other, [])):
+        db.refresh(tag)
+        assert {item.id for item in tag.design_items} == {item.id for item in expected}
+        assert tag.usage_count == len(expected)
+    # One revision per chunk of items with changes
+    db.refresh(usage)
+    assert usage.revision == revision + 3
+
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "ids": [str(items[0].id)], "add": [str(red.id)], "remove": [str(red.id)]})
+    assert r.status_code == 400
+
+
+def test_read_design_items_image_filters(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    tag = create_random_tag(db, company)
+    wide = create_random_design_item(db, company, filename="wide.png", content=random_design_image(7, size=(800, 200)))
+    tall = create_random_design_item(
+        db, company, filename="tall.jpg", content=random_design_image(7, "JPEG", size=(300, 900)))
+    square = create_random_design_item(
+        db, company, filename="square.png", content=random_design_image(7, "PNG", size=(500, 500)))
+    text = create_random_design_item(db, company, filename="brief.txt")
+    for item in (wide, tall, square, text):
+        db.add(TagItemLink(design_item_id=item.id, tag_id=tag.id))
+    db.commit()
+
+    def ids(**params: Any) -> set[str]:
+        r = client.get(f"{settings.API_V1_STR}/{company.id}/item/", headers=normal_user_token_headers,
+                       params={"tags_all": [str(tag.id)], **params})
+        assert r.status_code == 200
+        return {item["id"] for item in r.json()["data"]}
+
+    assert ids() == {str(item.id) for item in (wide, tall, square, text)}
+    assert ids(width_min=500) == {str(wide.id), str(square.id)}
+    assert ids(width_min=400, height_max=500) == {str(wide.id), str(square.id)}
+    assert ids(aspect_min=1.5) == {str(wide.id)}
+    assert ids(aspect_max=1) == {str(tall.id), str(square.id)}
+    assert ids(image_format=["jpeg"]) == {str(tall.id)}
+    assert ids(image_format=["PNG"], image_mode=["RGB"]) == {str(wide.id), str(square.id)}
+    assert ids(height_min=10_000) == set()
+
+    r = client.get(f"{settings.API_V1_STR}/{company.id}/item/{tall.id}", headers=normal_user_token_headers)
+    assert (r.json()["image_width"], r.json()["image_height"], r.json()["image_format"]) == (300, 900, "JPEG")
+
+
+def test_read_design_items_sprite(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    tag = create_random_tag(db, company)
+    transparent = io.BytesIO()
+    Image.new("RGBA", (64, 64), (255, 0, 0, 128)).save(transparent, "PNG")
+    wide = create_random_design_item(db, company, filename="wide.png", content=random_design_image(8, size=(800, 200)))
+    copy = create_random_design_item(db, company, filename="copy.png", content=random_design_image(8, size=(800, 200)))
+    badge = create_random_design_item(db, company, filename="badge.png", content=transparent.getvalue())
+    legacy = create_random_design_item(db, company, filename="old.jpg", content=random_design_image(9, "JPEG"))
+    text = create_random_design_item(db, company, filename="brief.txt")
+    legacy.thumbnail_hash = None
+    db.add(legacy)
+    for item in (wide, copy, badge, legacy, text):
+        db.add(TagItemLink(design_item_id=item.id, tag_id=tag.id))
+    db.commit()
+
+    def read_page() -> dict[str, Any]:
+        r = client.get(f"{settings.API_V1_STR}/{company.id}/item/sprite", headers=normal_user_token_headers,
+                       params={"tags_all": [str(tag.id)]})
+        assert r.status_code == 200
+        return r.json()
+
+    page = read_page()
+    cells = {item["id"]: item["sprite"] for item in page["data"]}
+    assert len(cells) == 5
+    assert cells[str(text.id)] is None
+    assert cells[str(wide.id)] == cells[str(copy.id)]
+    assert (cells[str(wide.id)]["width"], cells[str(wide.id)]["height"]) == (128, 32)
+    assert (cells[str(badge.id)]["width"], cells[str(badge.id)]["height"]) == (64, 64)
+    assert (cells[str(legacy.id)]["width"], cells[str(legacy.id)]["height"]) == (128, 96)
+    db.refresh(legacy)
+    assert legacy.thumbnail_hash
+
+    r = client.get(page["sprite_url"], headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert "immutable" in r.headers["cache-control"]
+    sprite = Image.open(io.BytesIO(r.content))
+    assert sprite.format == "WEBP" and sprite.mode == "RGBA"
+    assert sprite.size == (
+        max(cell["x"] + cell["width"] for cell in cells.values() if cell),
+        max(cell["y"] + cell["height"] for cell in cells.values() if cell),
+    )
+    badge_cell = cells[str(badge.id)]
+    red, _, _, alpha = sprite.getpixel((badge_cell["x"] + 32, badge_cell["y"] + 32))  # type: ignore[misc]
+    assert red > 240 and 120 < alpha < 136
+
+    # Cached by content, a lost thumbnail is made again from the preview
+    assert read_page() == page
+    Path(settings.thumbnail_dir, "sprites").rename(Path(settings.thumbnail_dir, "old-sprites"))
+    assert legacy.thumbnail_hash
+    Path(settings.thumbnail_dir, legacy.thumbnail_hash[:2], legacy.thumbnail_hash).unlink()
+    assert read_page() == page
+
+    # Only so many thumbnails are made per request, the rest come later
+    monkeypatch.setattr(settings, "SPRITE_MAX_NEW_THUMBNAILS", 1)
+    for item in (badge, legacy):
+        item.thumbnail_hash = None
+        db.add(item)
+    db.commit()
+    partial = read_page()
+    made = [item["id"] for item in partial["data"] if item["sprite"] and item["id"] in (str(badge.id), str(legacy.id))]
+    assert len(made) == 1
+    assert partial["sprite_url"] != page["sprite_url"]
+    assert read_page() == page
+
+    r = client.get(f"{settings.API_V1_STR}/{company.id}/item/sprite/{'0' * 64}", headers=normal_user_token_headers)
+    assert r.status_code == 404
+    r = client.get(f"{settings.API_V1_STR}/{company.id}/item/sprite/..%2Fx", headers=normal_user_token_headers)
+    assert r.status_code in (404, 422)
+
+
+def test_read_design_items_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    items = [create_random_design_item(db, company) for _ in range(5)]
+    tag = create_random_tag(db, company, items)
+    url = f"{settings.API_V1_STR}/{company.id}/item/"
+
+    seen: list[str] = []
+    params: dict[str, Any] = {"tags_all": [str(tag.id)], "limit": 2}
+    while True:
+        r = client.get(url, headers=normal_user_token_headers, params=params)
+        assert r.status_code == 200
+        page = r.json()
+        assert len(page["data"]) <= 2
+        seen += [item["id"] for item in page["data"]]
+        if not page["next_cursor"]:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert sorted(seen) == sorted(str(item.id) for item in items)
+    # Same day for all of them, so the id breaks the tie
+    assert seen == sorted(seen, reverse=True)
+
+    r = client.get(url, headers=normal_user_token_headers, params={"cursor": "garbage"})
+    assert r.status_code == 400
+
+
+def test_read_design_item_facets(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    items = [create_random_design_item(db, company) for _ in range(4)]
+    scope = create_random_tag(db, company, items[:3])
+    common = create_random_tag(db, company, items[:2])
+    single = create_random_tag(db, company, items[2:])
+    url = f"{settings.API_V1_STR}/{company.id}/item/facets"
+
+    r = client.get(url, headers=normal_user_token_headers, params={"tags_all": [str(scope.id)]})
+    assert r.status_code == 200
+    assert not r.json()["approximate"]
+    counts = {facet["id"]: facet["count"] for facet in r.json()["data"]}
+    assert counts == {str(scope.id): 3, str(common.id): 2, str(single.id): 1}
+
+    r = client.get(url, headers=normal_user_token_headers, params={"tags_all": [str(scope.id)], "limit": 1})
+    assert [facet["id"] for facet in r.json()["data"]] == [str(scope.id)]
+
+    r = client.get(url, headers=normal_user_token_headers, params={
+        "tags_all": [str(scope.id)], "tags_none": [str(common.id)], "approximate": True})
+    assert r.status_code == 200
+    counts = {facet["id"]: facet["count"] for facet in r.json()["data"]}
+    assert counts == {str(scope.id): 1, str(single.id): 1}
+
+
+def test_count_design_item_tags_sampled(company: Company, db: Session) -> None:
+    items = [create_random_design_item(db, company) for _ in range(3)]
+    tag = create_random_tag(db, company, items)
+    facets = crud.count_design_item_tags(
+        session=db, company_id=company.id, item_filter=DesignItemFilter(tags_all=[tag.id]), sample_percent=100)
+    assert [(facet.id, facet.count) for facet in facets] == [(tag.id, 3)]
+
+    # Half of the company's items, each counting twice
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(60)]
+    tag = create_random_tag(db, company, items)
+    db.exec(select(func.setseed(0.5)))
+    facets = crud.count_design_item_tags(
+        session=db, company_id=company.id, item_filter=DesignItemFilter(), sample_percent=50)
+    assert [facet.id for facet in facets] == [tag.id]
+    assert facets[0].count % 2 == 0 and 30 <= facets[0].count <= 90
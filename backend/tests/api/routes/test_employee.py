@@ -0,0 +1,112 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.models import CompanyRole, UserCompanyLink, UserCreate
+from tests.utils.company import create_random_company
+from tests.utils.user import create_random_user, user_authentication_headers
+from tests.utils.utils import random_email, random_lower_string
+
+
+def test_add_employees_in_bulk(client: TestClient, db: Session) -> None:
+    company = create_random_company(db, create_random_user(db))
+    email, password = random_email(), random_lower_string()
+    creator = crud.create_user(session=db, user_create=UserCreate(email=email, password=password))
+    new, by_email, promoted, peer, kept, too_high = (create_random_user(db) for _ in range(6))
+    for user, role in ((creator, CompanyRole.creator), (promoted, CompanyRole.reader),
+                       (peer, CompanyRole.creator), (kept, CompanyRole.reader)):
+        db.add(UserCompanyLink(company_id=company.id, user_id=user.id, role=role))
+    db.commit()
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    url = f"{settings.API_V1_STR}/{company.id}/employee/bulk"
+
+    r = client.post(url, headers=headers, json={"data": [
+        {"user_id": str(new.id)},
+        {"email": by_email.email, "role": CompanyRole.creator.value},
+        {"user_id": str(promoted.id), "role": CompanyRole.creator.value},
+        {"user_id": str(peer.id), "role": CompanyRole.reader.value},
+        {"user_id": str(kept.id), "role": CompanyRole.reader.value},
+        {"email": new.email, "role": CompanyRole.creator.value},
+        {"user_id": str(too_high.id), "role": CompanyRole.owner.value},
+        {"email": random_email()},
+    ]})
+    assert r.status_code == 200
+    body = r.json()
+    assert [(result["user_id"], result["status"]) for result in body["data"]] == [
+        (str(new.id), "added"), (str(by_email.id), "added"), (str(promoted.id), "updated"),
+        (str(peer.id), "skipped"), (str(kept.id), "unchanged"), (str(new.id), "skipped"),
+        (str(too_high.id), "skipped"), (None, "skipped")]
+    assert [result["detail"] for result in body["data"] if result["status"] == "skipped"] == [
+        "Employee with the same or higher role than yours", "User repeated", "Role higher than your own",
+        "User not found"]
+    assert (body["added"], body["updated"], body["unchanged"], body["skipped"]) == (2, 1, 1, 4)
+    roles = dict(db.exec(select(UserCompanyLink.user_id, UserCompanyLink.role)
+                         .where(UserCompanyLink.company_id == company.id)).all())
+    assert (roles[new.id], roles[by_email.id], roles[promoted.id], roles[peer.id]) == (
+        CompanyRole.reader, CompanyRole.creator, CompanyRole.creator, CompanyRole.creator)
+    assert too_high.id not in roles
+
+    r = client.post(url, headers=headers, json={"data": [{"user_id": str(new.id), "email": new.email}]})
+    assert r.status_code == 422
+
+    # Readers can't add anyone
+    link = db.get(UserCompanyLink, (company.id, creator.id))
+    assert link
+    link.role = CompanyRole.reader
+    db.add(link)
+    db.commit()
+    r = client.post(url, headers=headers, json={"data": [{"user_id": str(too_high.id)}]})
+    assert r.status_code == 400
+
+
+def test_read_employees_search(client: TestClient, db: Session) -> None:
+    email, password = random_email(), random_lower_string()
+    company = create_random_company(db, crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)))
+    prefix = random_lower_string()[:12]
+    people = {}
+    for key, address, full_name, role in (
+        ("bob", f"{prefix}.Bob@example.com", "Bob 100% Smith", CompanyRole.reader),
+        ("alice", f"{prefix}.alice@example.com", "Alice Stone", CompanyRole.creator),
+        ("carol", f"{prefix}.carol@example.com", "Carol_Smith", CompanyRole.reader),
+        ("dave", f"x{prefix}@example.com", "Dave Smith", CompanyRole.reader),
+    ):
+        user = crud.create_user(session=db, user_create=UserCreate(
+            email=address, password=random_lower_string(), full_name=full_name))
+        db.add(UserCompanyLink(company_id=company.id, user_id=user.id, role=role))
+        people[key] = user
+    db.commit()
+    # Not an employee
+    crud.create_user(session=db, user_create=UserCreate(
+        email=f"{prefix}.eve@example.com", password=random_lower_string(), full_name="Eve Smith"))
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    url = f"{settings.API_V1_STR}/{company.id}/employee/"
+
+    def search(**params: object) -> list[str]:
+        r = client.get(url, headers=headers, params=params)
+        assert r.status_code == 200
+        return [employee["email"] for employee in r.json()["data"]]
+
+    # Email prefix ignoring case, by lowercased email
+    r = client.get(url, headers=headers, params={"email": prefix.upper(), "limit": 2})
+    assert r.status_code == 200
+    page = r.json()
+    assert [(employee["email"], employee["role"]) for employee in page["data"]] == [
+        (people["alice"].email, CompanyRole.creator.value), (people["bob"].email, CompanyRole.reader.value)]
+    r = client.get(url, headers=headers, params={"email": prefix.upper(), "limit": 2, "cursor": page["next_cursor"]})
+    page = r.json()
+    assert [(employee["id"], employee["full_name"]) for employee in page["data"]] == [
+        (str(people["carol"].id), "Carol_Smith")]
+    assert page["next_cursor"] is None
+
+    # Any part of the full name, LIKE wildcards taken literally
+    assert search(name="SMITH", email=prefix) == [people["bob"].email, people["carol"].email]
+    assert search(name="smith", email=f"x{prefix}") == [people["dave"].email]
+    assert search(name="100%") == [people["bob"].email]
+    assert search(name="_") == [people["carol"].email]
+    assert search(email=prefix, role="reader") == [people["bob"].email, people["carol"].email]
+    assert search(email=prefix, role="owner") == []
+
+    r = client.get(url, headers=headers, params={"cursor": "nope"})
+    assert r.status_code == 400
@@ -0,0 +1,156 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.models import Company, Tag, TagItemLink
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, create_random_tag
+from tests.utils.user import create_random_user
+from tests.utils.utils import random_lower_string
+
+
+def test_complete_tags(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session, company: Company, media_root: object
+) -> None:
+    items = [create_random_design_item(db, company) for _ in range(3)]
+    tags = [create_random_tag(db, company, items[:usage]) for usage in (1, 3, 0, 2)]
+    url = f"{settings.API_V1_STR}/{company.id}/tag"
+
+    r = client.get(f"{url}/complete", headers=normal_user_token_headers, params={"limit": 3})
+    assert r.status_code == 200
+    assert [(tag["id"], tag["usage"]) for tag in r.json()["data"]] == [
+        (str(tags[1].id), 3), (str(tags[3].id), 2), (str(tags[0].id), 1)]
+
+    # Created and deleted tags show up right away, whether served by SQL or the index
+    r = client.post(f"{url}/", headers=normal_user_token_headers, json={"title": f"{tags[2].title[:5].upper()}new"})
+    assert r.status_code == 200
+    created = r.json()["id"]
+    r = client.get(f"{url}/complete", headers=normal_user_token_headers, params={"prefix": tags[2].title[:5]})
+    assert sorted(tag["id"] for tag in r.json()["data"]) == sorted([str(tags[2].id), created])
+    r = client.delete(f"{url}/{created}", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    r = client.get(f"{url}/complete", headers=normal_user_token_headers, params={"prefix": tags[2].title[:5]})
+    assert [tag["id"] for tag in r.json()["data"]] == [str(tags[2].id)]
+
+    r = client.get(f"{url}/complete", headers=normal_user_token_headers, params={"prefix": "x" * 32})
+    assert r.status_code == 422
+
+
+def test_suggest_tags(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session, company: Company, media_root: object
+) -> None:
+    items = [create_random_design_item(db, company) for _ in range(4)]
+    logo, flat, dark, print_ = (create_random_tag(db, company, items[:2]), create_random_tag(db, company, items[:3]),
+                                create_random_tag(db, company, items[1:]), create_random_tag(db, company, items[3:]))
+    url = f"{settings.API_V1_STR}/{company.id}/tag/suggest"
+
+    r = client.get(url, headers=normal_user_token_headers, params={"tag_ids": [str(logo.id)]})
+    assert r.status_code == 200
+    assert [(tag["id"], tag["count"]) for tag in r.json()["data"]] == [(str(flat.id), 2), (str(dark.id), 1)]
+    r = client.get(url, headers=normal_user_token_headers, params={"tag_ids": [str(logo.id), str(dark.id)], "limit": 1})
+    assert [(tag["id"], tag["count"]) for tag in r.json()["data"]] == [(str(flat.id), 4)]
+    assert print_.id
+
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 422
+
+
+def test_create_tags_bulk(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session, company: Company
+) -> None:
+    url = f"{settings.API_V1_STR}/{company.id}/tag/bulk"
+    stem = random_lower_string()[:8]
+    existing = Tag(title=f"{stem}-old", description="before", company_id=company.id)
+    other = create_random_tag(db, create_random_company(db, create_random_user(db)))
+    db.add(existing)
+    db.commit()
+
+    data = [
+        {"title": f"{stem}-new"},
+        {"title": f"{stem}-OLD", "description": "after"},
+        {"title": f"{stem}-New"},
+        {"title": other.title},
+    ]
+    r = client.post(url, headers=normal_user_token_headers, json={"data": data})
+    assert r.status_code == 200
+    body = r.json()
+    assert [result["status"] for result in body["data"]] == ["created", "skipped", "skipped", "skipped"]
+    assert (body["created"], body["updated"], body["skipped"]) == (1, 0, 3)
+    created = body["data"][0]["id"]
+    assert [result["id"] for result in body["data"]] == [created, str(existing.id), created, None]
+
+    r = client.post(url, headers=normal_user_token_headers, json={"data": data, "on_conflict": "update"})
+    body = r.json()
+    # Unchanged tags count as skipped
+    assert [result["status"] for result in body["data"]] == ["skipped", "updated", "skipped", "skipped"]
+    db.refresh(existing)
+    assert (existing.title, existing.description) == (f"{stem}-OLD", "after")
+    db.refresh(other)
+    assert other.company_id != company.id
+
+    r = client.post(url, headers=normal_user_token_headers,
+                    json={"data": [{"title": f"{stem}{n}"} for n in range(settings.TAG_BULK_MAX_TAGS + 1)]})
+    assert r.status_code == 400
+
+
+def test_update_tag(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session, company: Company
+) -> None:
+    tag = create_random_tag(db, company)
+    other = create_random_tag(db, create_random_company(db, create_random_user(db)))
+    url = f"{settings.API_V1_STR}/{company.id}/tag"
+    title = random_lower_string()[:20]
+
+    r = client.put(f"{url}/{tag.id}", headers=normal_user_token_headers, json={"title": title})
+    assert r.status_code == 200
+    assert (r.json()["id"], r.json()["title"]) == (str(tag.id), title)
+
+    # Tags of other companies can't be reached through this one
+    r = client.put(f"{url}/{other.id}", headers=normal_user_token_headers, json={"title": title})
+    assert r.status_code == 404
+    db.refresh(other)
+    assert other.title != title and other.company_id != company.id
+
+
+def test_merge_tags(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session, company: Company, media_root: object,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "TAG_MERGE_BATCH_LINKS", 1)
+    items = [create_random_design_item(db, company) for _ in range(4)]
+    target = create_random_tag(db, company, items[:2])
+    sources = [create_random_tag(db, company, items[1:3]), create_random_tag(db, company, items[3:])]
+    source_ids = [tag.id for tag in sources]
+    url = f"{settings.API_V1_STR}/{company.id}/tag"
+
+    r = client.post(f"{url}/{target.id}/merge", headers=normal_user_token_headers,
+                    json={"source_ids": [str(tag_id) for tag_id in source_ids]})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [line["moved"] for line in lines] == [1, 2, 3, 3]
+    assert lines[-1] == {"total": 3, "moved": 3, "duplicates": 1, "done": True}
+    db.refresh(target)
+    assert {item.id for item in target.design_items} == {item.id for item in items}
+    assert target.usage_count == 4
+    db.expire_all()
+    assert all(db.get(Tag, tag_id) is None for tag_id in source_ids)
+
+    r = client.post(f"{url}/{target.id}/merge", headers=normal_user_token_headers,
+                    json={"source_ids": [str(source_ids[0])]})
+    assert r.status_code == 404
+
+    # Deleting an item takes it off the counts of its tags
+    crud.delete_design_item(session=db, db_item=items[0])
+    db.refresh(target)
+    assert target.usage_count == 3
+
+    # Deleting a tag takes its links with it
+    target_id = target.id
+    r = client.delete(f"{url}/{target_id}", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert not db.exec(select(TagItemLink).where(TagItemLink.tag_id == target_id)).first()
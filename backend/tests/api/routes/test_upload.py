@@ -0,0 +1,334 @@
+import struct
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any
+
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud, thumbnails, uploads, versions
+from app.core.config import settings
+from app.core.db import engine
+from app.jobs.quota_reconcile import find_drift
+from app.models import Company, DesignItem, DesignItemVersion
+from tests.utils.design_item import create_random_design_item, random_design_image
+
+pytestmark = pytest.mark.usefixtures("media_root")
+
+
+def test_chunked_upload_out_of_order(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session, media_root: Path
+) -> None:
+    content = bytes(range(256)) * 40
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "title": "Poster", "filename": "poster.psd", "size": len(content), "chunk_size": 4096})
+    assert r.status_code == 200
+    upload = r.json()
+    assert upload["chunk_count"] == 3
+    assert upload["received"] == []
+
+    upload_url = f"{url}{upload['id']}"
+    for offset in (8192, 0):
+        r = client.put(upload_url, params={"offset": offset},
+                       headers=normal_user_token_headers, content=content[offset:offset + 4096])
+        assert r.status_code == 200
+    assert r.json()["received"] == [[0, 4096], [8192, len(content)]]
+    assert not r.json()["complete"]
+
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 400
+
+    r = client.put(upload_url, params={"offset": 4096},
+                   headers=normal_user_token_headers, content=content[4096:8192])
+    assert r.json()["received"] == [[0, len(content)]]
+    assert r.json()["complete"]
+
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    item = db.get(DesignItem, r.json()["id"])
+    assert item
+    assert item.file_size == len(content)
+    # Repetitive content is stored compressed
+    assert item.file_codec == "zstd"
+    assert zstandard.decompress((media_root / item.file_path).read_bytes()) == content
+
+    r = client.get(upload_url, headers=normal_user_token_headers)
+    assert r.status_code == 404
+
+
+def test_complete_upload_once(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    content = b"x" * 100
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "title": "Logo", "filename": "logo.ai", "size": len(content), "chunk_size": 64})
+    upload = uploads.get_session(r.json()["id"])
+    assert upload
+    upload_url = f"{url}{upload.id}"
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 400
+    for offset in (0, 64):
+        client.put(upload_url, params={"offset": offset},
+                   headers=normal_user_token_headers, content=content[offset:offset + 64])
+
+    # As while another request is finalizing it
+    uploads.claim(upload)
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 409
+    r = client.put(upload_url, params={"offset": 0}, headers=normal_user_token_headers, content=content[:64])
+    assert r.status_code == 409
+
+    uploads.release(upload)
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 404
+
+
+def test_upload_chunk_misaligned(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company
+) -> None:
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "title": "Logo", "filename": "logo.ai", "size": 100, "chunk_size": 64})
+    upload_url = f"{url}{r.json()['id']}"
+
+    r = client.put(upload_url, params={"offset": 10},
+                   headers=normal_user_token_headers, content=b"x" * 64)
+    assert r.status_code == 400
+    r = client.put(upload_url, params={"offset": 64},
+                   headers=normal_user_token_headers, content=b"x" * 64)
+    assert r.status_code == 400
+    # Sent without a Content-Length
+    r = client.put(upload_url, params={"offset": 0},
+                   headers=normal_user_token_headers, content=iter([b"x" * 40] * 3))
+    assert r.status_code == 413
+    r = client.put(upload_url, params={"offset": 0},
+                   headers=normal_user_token_headers, content=iter([b"x" * 32] * 2))
+    assert r.status_code == 200
+
+    r = client.delete(upload_url, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    r = client.get(upload_url, headers=normal_user_token_headers)
+    assert r.status_code == 404
+
+
+def test_upload_not_enough_permissions(
+    client: TestClient, superuser_token_headers: dict[str, str], company: Company
+) -> None:
+    r = client.post(f"{settings.API_V1_STR}/{company.id}/upload/", headers=superuser_token_headers, json={
+        "title": "Logo", "filename": "logo.ai", "size": 100})
+    assert r.status_code == 400
+
+
+def test_direct_upload_needs_object_storage(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company
+) -> None:
+    r = client.post(f"{settings.API_V1_STR}/{company.id}/upload/direct", headers=normal_user_token_headers, json={
+        "title": "Logo", "filename": "logo.ai", "size": 100})
+    assert r.status_code == 400
+
+
+def test_upload_quota_exceeded(
+    client: TestClient, normal_user_token_headers: dict[str, str], superuser_token_headers: dict[str, str], company: Company
+) -> None:
+    r = client.put(f"{settings.API_V1_STR}/company/{company.id}/quota",
+                   headers=superuser_token_headers, json={"quota_bytes": 1000})
+    assert r.status_code == 200
+    assert r.json()["quota_bytes"] == 1000
+
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "title": "Video", "filename": "video.mov", "size": 5000})
+    assert r.status_code == 413
+
+    r = client.put(f"{settings.API_V1_STR}/company/{company.id}/quota",
+                   headers=superuser_token_headers, json={"quota_bytes": None})
+    assert r.json()["quota_bytes"] is None
+
+
+def test_upload_warns_about_near_duplicates(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+
+    def upload(filename: str, content: bytes) -> dict[str, Any]:
+        r = client.post(url, headers=normal_user_token_headers, json={
+            "title": filename, "filename": filename, "size": len(content)})
+        upload_url = f"{url}{r.json()['id']}"
+        client.put(upload_url, params={"offset": 0}, headers=normal_user_token_headers, content=content)
+        r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+        assert r.status_code == 200
+        return r.json()
+
+    original = upload("banner.png", random_design_image(1))
+    assert original["near_duplicates"] == []
+    assert upload("other.png", random_design_image(2))["near_duplicates"] == []
+
+    # Smaller lossy re-export of the first design
+    copy = upload("banner.jpg", random_design_image(1, "JPEG", size=(300, 225), quality=60))
+    assert [item["id"] for item in copy["near_duplicates"]] == [original["id"]]
+    assert copy["near_duplicates"][0]["distance"] <= settings.SIMILARITY_MAX_DISTANCE
+
+    notes = upload("notes.txt", b"not an image")
+    assert notes["near_duplicates"] == []
+
+    # The same decode gives the thumbnail
+    item = db.get(DesignItem, uuid.UUID(original["id"]))
+    assert item and item.thumbnail_hash
+    assert thumbnails.thumbnail_path(item.thumbnail_hash).exists()
+    item = db.get(DesignItem, uuid.UUID(notes["id"]))
+    assert item and item.thumbnail_hash == thumbnails.NO_THUMBNAIL
+
+
+def test_upload_image_past_decompression_bomb_limit(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session
+) -> None:
+    # Start of a 20000x10000 PNG, Pillow refuses to open it
+    content = b"\x89PNG\r\n\x1a\n"
+    for chunk in (b"IHDR" + struct.pack(">IIBBBBB", 20000, 10000, 8, 6, 0, 0, 0), b"IDAT" + bytes(1024)):
+        content += struct.pack(">I", len(chunk) - 4) + chunk + struct.pack(">I", zlib.crc32(chunk))
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "title": "Mural", "filename": "mural.png", "size": len(content)})
+    upload_url = f"{url}{r.json()['id']}"
+    client.put(upload_url, params={"offset": 0}, headers=normal_user_token_headers, content=content)
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.json()["near_duplicates"] == []
+
+    item = db.get(DesignItem, uuid.UUID(r.json()["id"]))
+    assert item
+    assert item.perceptual_hash is None
+    assert item.thumbnail_hash == thumbnails.NO_THUMBNAIL
+    assert (item.image_width, item.image_height) == (20000, 10000)
+
+
+def test_upload_design_item_versions(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session,
+    media_root: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "VERSION_SNAPSHOT_INTERVAL", 3)
+    lines = [f'<path d="M{n} {n * 7 % 1000} L{n * 13 % 1000} {n}" fill="#{n * 2654435761 % (1 << 24):06x}"/>\n'
+             for n in range(3000)]
+    contents = [b"<svg>" + "".join(lines).encode() + b"</svg>"]
+    for n in range(1, 5):
+        lines[n * 500] = f'<circle r="{n}"/>\n'
+        contents.append(b"<svg>" + "".join(lines).encode() + b"</svg>")
+    item = create_random_design_item(db, company, filename="logo.svg", content=contents[0], compress=True)
+    before = crud.get_company_usage(session=db, company_id=company.id)
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+    whole_files = [item.file_path]
+
+    for content in contents[1:]:
+        r = client.post(f"{url}version", headers=normal_user_token_headers, json={
+            "design_item_id": str(item.id), "filename": "logo.svg", "size": len(content)})
+        assert r.status_code == 200
+        upload_url = f"{url}{r.json()['id']}"
+        client.put(upload_url, params={"offset": 0}, headers=normal_user_token_headers, content=content)
+        r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+        assert r.status_code == 200
+        assert r.json()["id"] == str(item.id)
+        db.refresh(item)
+        whole_files.append(item.file_path)
+
+    item_url = f"{settings.API_V1_STR}/{company.id}/item/{item.id}"
+    r = client.get(f"{item_url}/versions", headers=normal_user_token_headers)
+    versions = r.json()["data"]
+    assert [version["number"] for version in versions] == [5, 4, 3, 2, 1]
+    # Every third version stays whole, the ones between are small patches
+    assert [version["is_delta"] for version in versions] == [True, False, True, True, False]
+    assert all(version["stored_size"] < 200 for version in versions if version["is_delta"])
+    for number, content in enumerate(contents, 1):
+        r = client.get(f"{item_url}/versions/{number}/file", headers=normal_user_token_headers)
+        assert r.status_code == 200
+        assert r.content == content
+    r = client.get(f"{item_url}/file", headers=normal_user_token_headers)
+    assert r.content == contents[-1]
+    r = client.get(f"{item_url}/versions/6/file", headers=normal_user_token_headers)
+    assert r.status_code == 404
+
+    # Replaced files of versions stored as patches are gone
+    rows = db.exec(select(DesignItemVersion).where(DesignItemVersion.design_item_id == item.id)).all()
+    keys = {row.file_path for row in rows} | {item.file_path}
+    assert [(media_root / path).exists() for path in whole_files] == [True, False, False, True, True]
+    assert all((media_root / key).exists() for key in keys)
+    usage = crud.get_company_usage(session=db, company_id=company.id)
+    assert usage.items == before.items
+    assert usage.bytes - before.bytes == len(contents[-1]) - len(contents[0]) + sum(
+        row.stored_size for row in rows if row.file_path != item.file_path)
+    assert company.id not in find_drift(db)
+    db.commit()
+
+    r = client.delete(item_url, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert not any((media_root / key).exists() for key in keys)
+    assert crud.get_company_usage(session=db, company_id=company.id).bytes == before.bytes - len(contents[0])
+
+
+def test_store_version_base_replaced_while_diffing(
+    client: TestClient, normal_user_token_headers: dict[str, str], company: Company, db: Session,
+    media_root: Path
+) -> None:
+    content = b"<svg>" + b"".join(f'<path d="M{n} {n * 7 % 1000}"/>\n'.encode() for n in range(3000)) + b"</svg>"
+    item = create_random_design_item(db, company, filename="logo.svg", content=content)
+    with Session(engine) as other:
+        # Loaded before another version of the item is stored
+        stale = other.get(DesignItem, item.id)
+        assert stale
+
+        new_content = content.replace(b"M1 7", b"M2 8")
+        url = f"{settings.API_V1_STR}/{company.id}/upload/"
+        r = client.post(f"{url}version", headers=normal_user_token_headers, json={
+            "design_item_id": str(item.id), "filename": "logo.svg", "size": len(new_content)})
+        upload_url = f"{url}{r.json()['id']}"
+        client.put(upload_url, params={"offset": 0}, headers=normal_user_token_headers, content=new_content)
+        r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+        assert r.status_code == 200
+
+        file_path = f"{company.id}/{uuid.uuid4()}/logo.svg"
+        (media_root / file_path).parent.mkdir(parents=True)
+        (media_root / file_path).write_bytes(content.replace(b"M1 7", b"M3 9"))
+        version, previous = versions.store_version(
+            session=other, item=stale, creator_id=item.creator_id, filename="logo.svg",
+            file_path=file_path, file_size=len(content))
+        # The patch against the replaced file is dropped
+        assert (version.number, previous.number) == (3, 2)
+        assert version.base_number is None and version.file_path == file_path
+        assert not (media_root / f"{file_path}{versions.PATCH_SUFFIX}").exists()
+        other.rollback()
+
+
+def test_upload_version_at_item_quota(
+    client: TestClient, normal_user_token_headers: dict[str, str], superuser_token_headers: dict[str, str],
+    company: Company, db: Session
+) -> None:
+    item = create_random_design_item(db, company, filename="logo.svg", content=b"<svg/>")
+    usage = crud.get_company_usage(session=db, company_id=company.id)
+    quota_url = f"{settings.API_V1_STR}/company/{company.id}/quota"
+    r = client.put(quota_url, headers=superuser_token_headers, json={"quota_items": usage.items})
+    assert r.status_code == 200
+
+    url = f"{settings.API_V1_STR}/{company.id}/upload/"
+    r = client.post(url, headers=normal_user_token_headers, json={
+        "title": "Logo", "filename": "logo.svg", "size": 10})
+    assert r.status_code == 413
+
+    # A new version adds no item
+    content = b"<svg></svg>"
+    r = client.post(f"{url}version", headers=normal_user_token_headers, json={
+        "design_item_id": str(item.id), "filename": "logo.svg", "size": len(content)})
+    assert r.status_code == 200
+    upload_url = f"{url}{r.json()['id']}"
+    client.put(upload_url, params={"offset": 0}, headers=normal_user_token_headers, content=content)
+    r = client.post(f"{upload_url}/complete", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.json()["id"] == str(item.id)
+
+    r = client.put(quota_url, headers=superuser_token_headers, json={"quota_items": None})
+    assert r.json()["quota_items"] is None
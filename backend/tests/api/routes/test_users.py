@@ -7,7 +7,10 @@ from sqlmodel import Session, select
 from app import crud
 from app.core.config import settings
 from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.models import CompanyRole, CompanyUsage, User, UserCompanyLink, UserCreate
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_tag
+from tests.utils.user import user_authentication_headers
 from tests.utils.utils import random_email, random_lower_string
 
 
@@ -484,3 +487,41 @@ def test_delete_user_without_privileges(
     )
     assert r.status_code == 403
     assert r.json()["detail"] == "The user doesn't have enough privileges"
+
+
+def test_read_user_me_companies(client: TestClient, db: Session) -> None:
+    email, password = random_email(), random_lower_string()
+    user = crud.create_user(session=db, user_create=UserCreate(email=email, password=password))
+    other = crud.create_user(session=db, user_create=UserCreate(email=random_email(), password=password))
+    owned = create_random_company(db, user)
+    joined = create_random_company(db, other)
+    create_random_company(db, other)
+    db.add(UserCompanyLink(company_id=joined.id, user_id=user.id, role=CompanyRole.creator))
+    db.add(UserCompanyLink(company_id=owned.id, user_id=other.id, role=CompanyRole.reader))
+    for _ in range(3):
+        create_random_tag(db, joined)
+    usage = db.get(CompanyUsage, joined.id)
+    assert usage
+    usage.items = 7
+    db.add(usage)
+    db.commit()
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    url = f"{settings.API_V1_STR}/users/me/companies"
+
+    r = client.get(url, headers=headers, params={"limit": 1})
+    assert r.status_code == 200
+    first = r.json()
+    r = client.get(url, headers=headers, params={"limit": 1, "cursor": first["next_cursor"]})
+    assert r.status_code == 200
+    second = r.json()
+    assert second["next_cursor"] is None
+    companies = {company["id"]: company for company in first["data"] + second["data"]}
+    assert [company["title"] for company in first["data"] + second["data"]] == sorted(
+        [owned.title, joined.title])
+    assert {key: companies[str(owned.id)][key] for key in ("role", "employee_count", "tag_count", "item_count")} == {
+        "role": CompanyRole.owner.value, "employee_count": 2, "tag_count": 0, "item_count": 0}
+    assert {key: companies[str(joined.id)][key] for key in ("role", "employee_count", "tag_count", "item_count")} == {
+        "role": CompanyRole.creator.value, "employee_count": 2, "tag_count": 3, "item_count": 7}
+
+    r = client.get(url, headers=headers, params={"cursor": "nope"})
+    assert r.status_code == 400
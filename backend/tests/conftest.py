@@ -1,13 +1,17 @@
 from collections.abc import Generator
+from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, delete
 
+from app import crud
 from app.core.config import settings
 from app.core.db import engine, init_db
 from app.main import app
-from app.models import Item, User
+from app.models import Company, Item, TagItemLink, User
+from app.storage import get_storage
+from tests.utils.company import create_random_company
 from tests.utils.user import authentication_token_from_email
 from tests.utils.utils import get_superuser_token_headers
 
@@ -17,6 +21,10 @@ def db() -> Generator[Session, None, None]:
     with Session(engine) as session:
         init_db(session)
         yield session
+        statement = delete(TagItemLink)
+        session.execute(statement)
+        statement = delete(Company)
+        session.execute(statement)
         statement = delete(Item)
         session.execute(statement)
         statement = delete(User)
@@ -40,3 +48,21 @@ def normal_user_token_headers(client: TestClient, db: Session) -> dict[str, str]
     return authentication_token_from_email(
         client=client, email=settings.EMAIL_TEST_USER, db=db
     )
+
+
+@pytest.fixture
+def media_root(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Generator[Path, None, None]:
+    monkeypatch.setattr(settings, "MEDIA_ROOT", str(tmp_path))
+    get_storage.cache_clear()
+    yield tmp_path
+    get_storage.cache_clear()
+
+
+@pytest.fixture(scope="module")
+def company(db: Session, normal_user_token_headers: dict[str, str]) -> Company:
+    """
+    Company owned by the normal test user.
+    """
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    return create_random_company(db, user)
@@ -0,0 +1,68 @@
+import random
+import uuid
+
+import pytest
+from sqlmodel import Session
+
+from app import crud, similarity
+from app.core.config import settings
+from app.models import Company, DesignItem
+from app.similarity import HashIndex, HashIndexCache
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item
+
+pytestmark = pytest.mark.usefixtures("media_root")
+
+
+def _hashed_item(db: Session, company: Company, perceptual_hash: int) -> DesignItem:
+    item = create_random_design_item(db, company, content=b"x")
+    item.perceptual_hash = perceptual_hash
+    db.add(item)
+    db.commit()
+    return item
+
+
+def _similar(db: Session, company: Company, perceptual_hash: int, max_distance: int) -> list[tuple[uuid.UUID, int]]:
+    return [(item.id, item.distance) for item in similarity.find_similar(
+        session=db, company_id=company.id, perceptual_hash=perceptual_hash, max_distance=max_distance)]
+
+
+def _sql(db: Session, company: Company, perceptual_hash: int, max_distance: int) -> list[tuple[uuid.UUID, int]]:
+    return similarity._search_sql(db, company.id, perceptual_hash, max_distance, 20, None)
+
+
+def test_hash_index_matches_sql(db: Session, company: Company, monkeypatch: pytest.MonkeyPatch) -> None:
+    rng = random.Random(11)
+    company = create_random_company(db, company.employee[0])
+    base = rng.getrandbits(63)
+    # A cluster of near copies around base, the rest random
+    for bits in [0, 0b1, 0b11, 0b111, 0b1111] + [rng.getrandbits(16) << 16 for _ in range(5)]:
+        _hashed_item(db, company, base ^ bits)
+    for _ in range(30):
+        _hashed_item(db, company, rng.getrandbits(64) - (1 << 63))
+    queries = [(base, 0), (base, 2), (base ^ 0b110, 3), (-base - 1, 64)]
+    expected = [_sql(db, company, perceptual_hash, distance) for perceptual_hash, distance in queries]
+    assert [len(found) for found in expected] == [1, 3, 5, 20]
+
+    monkeypatch.setattr(settings, "SIMILARITY_INDEX_MAX_BYTES", 1 << 30)
+    monkeypatch.setattr(settings, "SIMILARITY_INDEX_MIN_ITEMS", 0)
+    cache = HashIndexCache()
+    monkeypatch.setattr(similarity, "hash_indexes", cache)
+    assert _similar(db, company, base, 0) == expected[0]
+    cache.rebuild(company.id).result()
+    index = cache.indexes[company.id]
+    assert isinstance(index, HashIndex) and index.size == 40
+    batched = HashIndex.build(db, company.id, batch_size=7)
+    assert (batched.ids.tolist(), batched.hashes.tolist()) == (index.ids.tolist(), index.hashes.tolist())
+    assert [_similar(db, company, perceptual_hash, distance) for perceptual_hash, distance in queries] == expected
+
+    # Uploads and deletes of this process are applied in place
+    copy = _hashed_item(db, company, base ^ 2)
+    similarity.item_added(company.id, crud.update_company_usage(session=db, company_id=company.id),
+                          copy.id, copy.perceptual_hash)
+    db.commit()
+    crud.delete_design_item(session=db, db_item=db.get(DesignItem, expected[0][0][0]))
+    found = _similar(db, company, base, 2)
+    assert cache.indexes[company.id] is index
+    assert copy.id in dict(found) and expected[0][0][0] not in dict(found)
+    assert found == _sql(db, company, base, 2)
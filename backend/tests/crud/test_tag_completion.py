@@ -0,0 +1,107 @@
+import random
+
+import pytest
+from sqlmodel import Session, select
+
+from app import crud, tag_completion
+from app.core.config import settings
+from app.models import Company, DesignItem, Tag, TagItemLink
+from app.tag_completion import TagPrefixIndex, TagPrefixIndexCache
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item
+from tests.utils.utils import random_lower_string
+
+pytestmark = pytest.mark.usefixtures("media_root")
+
+
+@pytest.fixture
+def tagged_company(db: Session, company: Company) -> tuple[Company, str]:
+    rng = random.Random(5)
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(6)]
+    # Tag titles are unique across companies, they all start with a stem of their own
+    stem = random_lower_string()[:6]
+    for n in range(30):
+        tagged = rng.sample(items, rng.randrange(len(items) + 1))
+        tag = Tag(title=f"{stem}{rng.choice(['a', 'ab', 'abc', 'b', 'B'])}{n}", company_id=company.id,
+                  usage_count=len(tagged))
+        db.add(tag)
+        for item in tagged:
+            db.add(TagItemLink(design_item_id=item.id, tag_id=tag.id))
+    db.commit()
+    return company, stem
+
+
+def _titles(completions: list) -> list[tuple[str, int]]:  # type: ignore[type-arg]
+    return [(tag.title, tag.usage) for tag in completions]
+
+
+def test_tag_prefix_index_matches_sql(db: Session, tagged_company: tuple[Company, str]) -> None:
+    company, stem = tagged_company
+    index = TagPrefixIndex.build(db, company.id)
+    assert index.size == 30
+    for prefix in ["", stem, stem.upper(), f"{stem}a", f"{stem}AB", f"{stem}abc", f"{stem}b", f"{stem}x", "%", "_"]:
+        for limit in (1, 5, 50):
+            expected = _titles(tag_completion._complete_sql(db, company.id, prefix, limit))
+            assert _titles(index.complete(prefix, limit)) == expected
+    assert len(index.complete(f"{stem}b", 50)) == len(tag_completion._complete_sql(db, company.id, f"{stem}B", 50))
+
+
+def test_tag_prefix_index_incremental_updates(
+    db: Session, tagged_company: tuple[Company, str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    company, stem = tagged_company
+    monkeypatch.setattr(settings, "TAG_COMPLETION_INDEX_MAX_BYTES", 1 << 30)
+    cache = TagPrefixIndexCache()
+    monkeypatch.setattr(tag_completion, "prefix_indexes", cache)
+    cache.rebuild(company.id).result()
+    index = cache.indexes[company.id]
+
+    def check(prefix: str) -> None:
+        completions = tag_completion.complete(session=db, company_id=company.id, prefix=prefix, limit=50)
+        assert cache.indexes[company.id] is index
+        assert _titles(completions) == _titles(tag_completion._complete_sql(db, company.id, prefix, 50))
+
+    # Created, renamed and removed in this process, applied in place
+    tag = Tag(title=f"{stem}Zed", company_id=company.id)
+    db.add(tag)
+    revision = crud.update_company_usage(session=db, company_id=company.id)
+    db.commit()
+    tag_completion.tags_saved(company.id, revision, {tag.id: tag.title})
+    check(f"{stem}z")
+
+    tag.title = f"{stem}abz"
+    db.add(tag)
+    revision = crud.update_company_usage(session=db, company_id=company.id)
+    db.commit()
+    tag_completion.tags_saved(company.id, revision, {tag.id: tag.title})
+    check(f"{stem}z")
+    check(f"{stem}ab")
+
+    db.delete(db.get(Tag, tag.id))
+    revision = crud.update_company_usage(session=db, company_id=company.id)
+    db.commit()
+    tag_completion.usage_changed(company.id, revision, removed_tags=[tag.id])
+    check(stem)
+
+    # New items don't move usage, deleted ones take it off their tags
+    create_random_design_item(db, company, content=b"x")
+    top = index.complete(stem, 1)[0]
+    link = db.exec(select(TagItemLink).where(TagItemLink.tag_id == top.id)).first()
+    assert link
+    item = db.get(DesignItem, link.design_item_id)
+    assert item
+    crud.delete_design_item(session=db, db_item=item)
+    check(stem)
+    assert {tag.id: tag.usage for tag in index.complete(stem, 50)}[top.id] == top.usage - 1
+
+    # A change made elsewhere skips a revision, the index keeps serving and
+    # is rebuilt once it is INDEX_REBUILD_MIN_SECONDS old
+    crud.update_company_usage(session=db, company_id=company.id)
+    db.commit()
+    assert tag_completion.complete(session=db, company_id=company.id, prefix=stem) == index.complete(stem, 10)
+    assert company.id not in cache.building
+    index.built_at -= settings.INDEX_REBUILD_MIN_SECONDS
+    assert tag_completion.complete(session=db, company_id=company.id, prefix=stem) == index.complete(stem, 10)
+    cache.rebuild(company.id).result()
+    assert cache.indexes[company.id] is not index
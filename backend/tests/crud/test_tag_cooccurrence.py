@@ -0,0 +1,60 @@
+import random
+
+import pytest
+from sqlmodel import Session
+
+from app import crud, tag_cooccurrence
+from app.core.config import settings
+from app.models import Company
+from app.tag_cooccurrence import TagCooccurrenceIndex, TagCooccurrenceIndexCache
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, create_random_tag
+
+pytestmark = pytest.mark.usefixtures("media_root")
+
+
+def test_tag_cooccurrence_index_matches_sql(
+    db: Session, company: Company, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    rng = random.Random(7)
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(12)]
+    tags = [create_random_tag(db, company, rng.sample(items, rng.randrange(len(items) + 1))) for _ in range(15)]
+    tag_ids = [tag.id for tag in tags]
+    # Small chunks so the build merges several of them
+    monkeypatch.setattr(tag_cooccurrence, "CHUNK_PAIRS", 20)
+    index = TagCooccurrenceIndex.build(db, company.id)
+    assert index.size == 15
+    for chosen in ([tag_ids[0]], tag_ids[3:6], tag_ids[:14], [tags[0].id, tags[0].id]):
+        for limit in (1, 5, 50):
+            assert index.suggest(chosen, limit) == tag_cooccurrence._suggest_sql(db, company.id, chosen, limit)
+
+
+def test_tag_suggestions_refresh(db: Session, company: Company, monkeypatch: pytest.MonkeyPatch) -> None:
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(3)]
+    logo, red, blue = create_random_tag(db, company, items), create_random_tag(db, company, items[:2]), \
+        create_random_tag(db, company, items[2:])
+    cache = TagCooccurrenceIndexCache()
+    monkeypatch.setattr(tag_cooccurrence, "cooccurrence_indexes", cache)
+    monkeypatch.setattr(settings, "TAG_SUGGEST_REFRESH_SECONDS", 3600)
+
+    def suggest() -> list[tuple[str, int]]:
+        return [(tag.title, tag.count) for tag in tag_cooccurrence.suggest(
+            session=db, company_id=company.id, tag_ids=[logo.id])]
+
+    # SQL until the index is built, then the index
+    assert suggest() == [(red.title, 2), (blue.title, 1)]
+    cache.rebuild(company.id).result()
+    index = cache.indexes[company.id]
+
+    # Behind the database, it serves as built until it is old enough
+    crud.update_design_item_tags(session=db, company_id=company.id, item_ids=[item.id for item in items],
+                                 add=[blue.id], remove=[])
+    assert suggest() == [(red.title, 2), (blue.title, 1)]
+    assert company.id not in cache.building
+    monkeypatch.setattr(settings, "TAG_SUGGEST_REFRESH_SECONDS", 0)
+    assert suggest() == [(red.title, 2), (blue.title, 1)]
+    cache.rebuild(company.id).result()
+    assert cache.indexes[company.id] is not index
+    assert suggest() == [(blue.title, 3), (red.title, 2)]
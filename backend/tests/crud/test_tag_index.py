@@ -0,0 +1,120 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+from sqlmodel import Session, update
+
+from app import crud, tag_index
+from app.core.config import settings
+from app.models import Company, DesignItem, DesignItemFilter, Tag, TagItemLink
+from app.tag_index import TagBitmapIndex, TagIndexCache
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, create_random_tag
+
+pytestmark = pytest.mark.usefixtures("media_root")
+
+
+@pytest.fixture
+def tagged_company(db: Session, company: Company) -> tuple[Company, list[Tag]]:
+    rng = random.Random(7)
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(80)]
+    for item in items:
+        db.exec(update(DesignItem).where(DesignItem.id == item.id).values(  # type: ignore[call-overload]
+            created_date=date(2024, 1, 1) + timedelta(days=rng.randrange(20))))
+    db.commit()
+    # Common tags end up as bitsets, rare ones as ordinal arrays
+    tags = [create_random_tag(db, company, rng.sample(items, k)) for k in (50, 30, 12, 2, 1)]
+    return company, tags
+
+
+def _sql_ids(db: Session, company: Company, item_filter: DesignItemFilter, after=None, limit=1000) -> list:  # type: ignore[no-untyped-def]
+    return [item.id for item in crud.list_design_items(
+        session=db, company_id=company.id, item_filter=item_filter, after=after, limit=limit)]
+
+
+def test_tag_index_matches_sql(db: Session, tagged_company: tuple[Company, list[Tag]]) -> None:
+    company, tags = tagged_company
+    index = TagBitmapIndex.build(db, company.id)
+    assert {bits.dtype.name for bits in index.tags.values()} == {"uint8", "uint32"}
+
+    a, b, c, d, e = (tag.id for tag in tags)
+    filters = [
+        DesignItemFilter(tags_all=[a]),
+        DesignItemFilter(tags_all=[a, b]),
+        DesignItemFilter(tags_all=[d, a]),
+        DesignItemFilter(tags_any=[c, d, e]),
+        DesignItemFilter(tags_all=[a], tags_any=[b, c], tags_none=[d]),
+        DesignItemFilter(tags_none=[a, b]),
+        DesignItemFilter(tags_all=[b], created_from=date(2024, 1, 5), created_to=date(2024, 1, 12)),
+    ]
+    for item_filter in filters:
+        expected = _sql_ids(db, company, item_filter)
+        assert index.page(item_filter, None, 1000) == expected
+
+        # Walk it in pages of 3 with the listing cursor
+        seen, after = [], None
+        while page := index.page(item_filter, after, 3):
+            seen += page
+            last = db.get(DesignItem, page[-1])
+            assert last
+            after = (last.created_date, last.id)
+        assert seen == expected
+
+
+def test_tag_index_incremental_updates(
+    db: Session, tagged_company: tuple[Company, list[Tag]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    company, tags = tagged_company
+    monkeypatch.setattr(settings, "TAG_INDEX_MAX_BYTES", 1 << 30)
+    monkeypatch.setattr(settings, "TAG_INDEX_MIN_ITEMS", 0)
+    cache = TagIndexCache()
+    monkeypatch.setattr(tag_index, "tag_indexes", cache)
+    item_filter = DesignItemFilter(tags_any=[tags[0].id, tags[4].id])
+
+    assert tag_index.find_design_items(session=db, company_id=company.id, item_filter=item_filter) is None
+    cache.rebuild(company.id).result()
+    index = cache.indexes[company.id]
+
+    # New item, linked in the same process, is applied in place
+    item = create_random_design_item(db, company, content=b"x")
+    db.add(TagItemLink(design_item_id=item.id, tag_id=tags[4].id))
+    revision = crud.update_company_usage(session=db, company_id=company.id)
+    db.commit()
+    tag_index.links_changed(company.id, revision, added=[(tags[4].id, item.id, item.created_date)])
+    removed = crud.list_design_items(
+        session=db, company_id=company.id, item_filter=DesignItemFilter(tags_all=[tags[0].id]), limit=1)[0]
+    crud.delete_design_item(session=db, db_item=removed)
+
+    found = tag_index.find_design_items(session=db, company_id=company.id, item_filter=item_filter, limit=1000)
+    assert cache.indexes[company.id] is index
+    assert found is not None
+    assert [i.id for i in found] == _sql_ids(db, company, item_filter)
+    assert found[0].id == item.id
+
+    # A change made elsewhere skips a revision and sends queries back to SQL,
+    # the index is rebuilt once it is INDEX_REBUILD_MIN_SECONDS old
+    crud.update_company_usage(session=db, company_id=company.id)
+    db.commit()
+    assert tag_index.find_design_items(session=db, company_id=company.id, item_filter=item_filter) is None
+    assert company.id not in cache.building
+    index.built_at -= settings.INDEX_REBUILD_MIN_SECONDS
+    assert tag_index.find_design_items(session=db, company_id=company.id, item_filter=item_filter) is None
+    cache.rebuild(company.id).result()
+    assert cache.indexes[company.id] is not index
+    assert tag_index.find_design_items(session=db, company_id=company.id, item_filter=item_filter) is not None
+    # Filters the index doesn't cover go to SQL
+    image_filter = DesignItemFilter(tags_any=item_filter.tags_any, width_min=100)
+    assert tag_index.find_design_items(session=db, company_id=company.id, item_filter=image_filter) is None
+
+
+def test_tag_index_memory_budget(
+    db: Session, tagged_company: tuple[Company, list[Tag]], company: Company, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    first, _ = tagged_company
+    cache = TagIndexCache()
+    monkeypatch.setattr(settings, "TAG_INDEX_MAX_BYTES", 1 << 30)
+    cache.rebuild(first.id).result()
+    monkeypatch.setattr(settings, "TAG_INDEX_MAX_BYTES", cache.indexes[first.id].nbytes - 1)
+    cache.rebuild(company.id).result()
+    assert list(cache.indexes) == [company.id]
@@ -0,0 +1,30 @@
+from sqlmodel import Session, update
+
+from app import crud
+from app.jobs.file_size_backfill import backfill
+from app.models import CompanyUsage, DesignItem
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item
+from tests.utils.user import create_random_user
+
+
+def test_backfill_file_sizes(db: Session, media_root: object) -> None:
+    company = create_random_company(db, create_random_user(db))
+    legacy = create_random_design_item(db, company, content=b"a" * 1000)
+    sized = create_random_design_item(db, company, content=b"b" * 10)
+    # As the column's default left items stored before it, not counted either
+    db.exec(update(DesignItem).where(DesignItem.id == legacy.id).values(file_size=0))
+    crud.update_company_usage(session=db, company_id=company.id, bytes=-1000)
+    db.commit()
+
+    result = backfill(db, batch_size=1, workers=2)
+    assert result.sized >= 1
+    db.refresh(legacy)
+    db.refresh(sized)
+    assert (legacy.file_size, sized.file_size) == (1000, 10)
+    usage = db.get(CompanyUsage, company.id)
+    assert usage
+    db.refresh(usage)
+    assert usage.bytes == 1010
+
+    assert backfill(db, after=result.last_id).scanned == 0
@@ -0,0 +1,31 @@
+from sqlmodel import Session, update
+
+from app import crud
+from app.jobs.hash_backfill import backfill
+from app.models import DesignItem
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, random_design_image
+from tests.utils.user import create_random_user
+
+
+def test_backfill_hashes_images(db: Session, media_root: object) -> None:
+    company = create_random_company(db, create_random_user(db))
+    image = create_random_design_item(db, company, filename="a.png", content=random_design_image(5))
+    text = create_random_design_item(db, company, filename="b.txt", content=b"not an image")
+    hashed = image.perceptual_hash
+    assert hashed is not None
+    db.exec(update(DesignItem).where(DesignItem.company_id == company.id).values(perceptual_hash=None))
+    db.commit()
+    revision = crud.update_company_usage(session=db, company_id=company.id)
+    db.commit()
+
+    result = backfill(db, batch_size=1, workers=2)
+    assert result.hashed >= 1 and result.scanned >= 2
+    db.refresh(image)
+    db.refresh(text)
+    assert (image.perceptual_hash, text.perceptual_hash) == (hashed, None)
+    # Cached hash indexes of the company go stale
+    assert crud.update_company_usage(session=db, company_id=company.id) == revision + 2  # type: ignore[operator]
+    db.commit()
+
+    assert backfill(db, after=result.last_id).scanned == 0
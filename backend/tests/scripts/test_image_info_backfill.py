@@ -0,0 +1,32 @@
+from sqlmodel import Session, update
+
+from app.jobs.image_info_backfill import backfill
+from app.models import DesignItem
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, random_design_image
+from tests.utils.user import create_random_user
+
+
+def test_backfill_reads_image_headers(db: Session, media_root: object) -> None:
+    company = create_random_company(db, create_random_user(db))
+    png = create_random_design_item(db, company, filename="a.png", content=random_design_image(6, size=(640, 480)))
+    jpeg = create_random_design_item(
+        db, company, filename="b.jpg", content=random_design_image(6, "JPEG", size=(200, 400)))
+    webp = create_random_design_item(
+        db, company, filename="c.webp", content=random_design_image(6, "WEBP", size=(320, 90), lossless=True))
+    text = create_random_design_item(db, company, filename="d.txt", content=b"not an image")
+    db.exec(update(DesignItem).where(DesignItem.company_id == company.id).values(
+        image_width=None, image_height=None, image_aspect=None, image_format=None, image_mode=None))
+    db.commit()
+
+    result = backfill(db, batch_size=2, workers=2)
+    assert result.images >= 3 and result.scanned >= 4
+    for item in (png, jpeg, webp, text):
+        db.refresh(item)
+    assert (png.image_width, png.image_height, png.image_aspect, png.image_format, png.image_mode) == (
+        640, 480, 640 / 480, "PNG", "RGB")
+    assert (jpeg.image_width, jpeg.image_height, jpeg.image_aspect, jpeg.image_format) == (200, 400, 0.5, "JPEG")
+    assert (webp.image_width, webp.image_height, webp.image_format, webp.image_mode) == (320, 90, "WEBP", "RGB")
+    assert text.image_format is None
+
+    assert backfill(db, after=result.last_id).scanned == 0
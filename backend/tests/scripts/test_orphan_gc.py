@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+
+from sqlmodel import Session
+
+from app.jobs.orphan_gc import collect_garbage
+from app.models import Company
+from app.storage import get_storage
+from tests.utils.design_item import create_random_design_item
+
+
+def test_collect_garbage(db: Session, company: Company, media_root: Path) -> None:
+    item = create_random_design_item(db, company)
+    storage = get_storage()
+    orphans = [f"{company.id}/gone/old.psd", f"{company.id}/gone-2.svg"]
+    for key in [*orphans, f"{company.id}/fresh.psd", ".uploads/x/data.part"]:
+        path = media_root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"12345")
+    for key in [*orphans, item.file_path]:
+        os.utime(media_root / key, (0, 0))
+
+    result = collect_garbage(db, storage, grace_seconds=3600, dry_run=True)
+    assert result.orphaned == 2
+    assert result.orphaned_bytes == 10
+    assert result.too_recent == 1
+    assert result.deleted == 0
+    assert all((media_root / key).exists() for key in orphans)
+
+    result = collect_garbage(db, storage, grace_seconds=3600, dry_run=False)
+    assert result.deleted == 2
+    assert not any((media_root / key).exists() for key in orphans)
+    assert (media_root / item.file_path).exists()
+    assert (media_root / ".uploads/x/data.part").exists()
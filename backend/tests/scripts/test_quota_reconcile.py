@@ -0,0 +1,24 @@
+from sqlmodel import Session, update
+
+from app import crud
+from app.jobs.quota_reconcile import find_drift, reconcile
+from app.models import CompanyUsage
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item
+from tests.utils.user import create_random_user
+
+
+def test_reconcile_repairs_drift(db: Session, media_root: object) -> None:
+    company = create_random_company(db, create_random_user(db))
+    create_random_design_item(db, company, content=b"x" * 10)
+    create_random_design_item(db, company, content=b"x" * 20)
+    assert company.id not in find_drift(db)
+
+    db.exec(update(CompanyUsage).where(CompanyUsage.company_id == company.id).values(bytes=7, items=9))
+    db.commit()
+    assert company.id in find_drift(db)
+
+    assert reconcile(db) >= 1
+    usage = crud.get_company_usage(session=db, company_id=company.id)
+    assert (usage.bytes, usage.items, usage.previews) == (30, 2, 0)
+    assert company.id not in find_drift(db)
@@ -0,0 +1,104 @@
+import random
+import uuid
+
+import pytest
+from sqlmodel import Session, select
+
+from app import crud, related_items
+from app.core.config import settings
+from app.jobs.related_items import refresh
+from app.models import Company, RelatedDesignItem, RelatedDesignItemStale
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, create_random_tag
+
+pytestmark = pytest.mark.usefixtures("media_root")
+
+
+def stored(db: Session, item_id: uuid.UUID) -> list[tuple[uuid.UUID, float]]:
+    rows = db.exec(select(RelatedDesignItem).where(RelatedDesignItem.design_item_id == item_id)
+                   .order_by(RelatedDesignItem.rank)).all()
+    return [(row.related_id, round(row.score, 5)) for row in rows]
+
+
+def ranked(scores: list[tuple[uuid.UUID, float]]) -> list[tuple[uuid.UUID, float]]:
+    # Closest first, ties in item id order
+    return sorted(scores, key=lambda pair: (-pair[1], pair[0]))
+
+
+def brute_force(tag_sets: dict[uuid.UUID, set[uuid.UUID]], item_id: uuid.UUID,
+                common: set[uuid.UUID]) -> list[tuple[uuid.UUID, float]]:
+    tags = tag_sets[item_id]
+    scores = [(other, round(len(tags & other_tags) / len(tags | other_tags), 5))
+              for other, other_tags in tag_sets.items()
+              if other != item_id and (tags & other_tags) - common]
+    return ranked(scores)[:settings.RELATED_ITEMS_TOP_K]
+
+
+@pytest.mark.parametrize("max_tag_items", [1_000, 6])
+def test_related_items_match_brute_force(
+    db: Session, company: Company, monkeypatch: pytest.MonkeyPatch, max_tag_items: int
+) -> None:
+    rng = random.Random(max_tag_items)
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(20)]
+    samples = [rng.sample(items, rng.choice([1, 2, 3, 5, 8, 12])) for _ in range(15)]
+    tags = [create_random_tag(db, company, sample) for sample in samples]
+    tag_sets: dict[uuid.UUID, set[uuid.UUID]] = {}
+    for tag, sample in zip(tags, samples):
+        for item in sample:
+            tag_sets.setdefault(item.id, set()).add(tag.id)
+    # Tags on more items than the cap only count towards found candidates
+    monkeypatch.setattr(settings, "RELATED_ITEMS_MAX_TAG_ITEMS", max_tag_items)
+    monkeypatch.setattr(related_items, "CHUNK_PAIRS", 10)
+    monkeypatch.setattr(related_items, "CHUNK_BITSETS", 7)
+    common = {tag.id for tag, sample in zip(tags, samples) if len(sample) > max_tag_items}
+
+    assert refresh(db, company.id, full=True) == len(tag_sets)
+    for item in items:
+        assert stored(db, item.id) == (brute_force(tag_sets, item.id, common) if item.id in tag_sets else [])
+
+
+def test_related_items_skip_pairs_sharing_only_common_tags(
+    db: Session, company: Company, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(4)]
+    ids = [item.id for item in items]
+    create_random_tag(db, company, items)
+    create_random_tag(db, company, items[2:])
+    monkeypatch.setattr(settings, "RELATED_ITEMS_MAX_TAG_ITEMS", 3)
+
+    # Items 0 and 1 have the same tags, but only the common one
+    refresh(db, company.id, full=True)
+    assert stored(db, ids[0]) == stored(db, ids[1]) == []
+    assert stored(db, ids[2]) == [(ids[3], 1.0)]
+
+
+def test_related_items_refresh_queued(db: Session, company: Company) -> None:
+    company = create_random_company(db, company.employee[0])
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(4)]
+    logo, red = create_random_tag(db, company, items[:3]), create_random_tag(db, company, items[:2])
+    blue = create_random_tag(db, company)
+    ids = [item.id for item in items]
+    refresh(db, company.id, full=True)
+    assert stored(db, ids[0]) == [(ids[1], 1.0), (ids[2], 0.5)]
+    assert stored(db, ids[3]) == []
+
+    # Tagging queues the items, the job recomputes them and their neighbours
+    crud.update_design_item_tags(session=db, company_id=company.id, item_ids=[ids[2], ids[3]],
+                                 add=[red.id, blue.id], remove=[logo.id])
+    queued = db.exec(select(RelatedDesignItemStale.design_item_id)
+                     .where(RelatedDesignItemStale.design_item_id.in_(ids))).all()
+    assert set(queued) == {ids[2], ids[3]}
+    refresh(db, company.id)
+    third = round(1 / 3, 5)
+    assert stored(db, ids[0]) == ranked([(ids[1], 1.0), (ids[2], third), (ids[3], third)])
+    assert stored(db, ids[3]) == ranked([(ids[2], 1.0), (ids[0], third), (ids[1], third)])
+    assert not db.exec(select(RelatedDesignItemStale).where(RelatedDesignItemStale.design_item_id.in_(ids))).all()
+
+    # Deleting an item queues those that listed it
+    crud.delete_design_item(session=db, db_item=items[1])
+    assert stored(db, ids[0]) == ranked([(ids[2], third), (ids[3], third)])
+    queued = db.exec(select(RelatedDesignItemStale.design_item_id)
+                     .where(RelatedDesignItemStale.design_item_id.in_(ids))).all()
+    assert set(queued) == {ids[0], ids[2], ids[3]}
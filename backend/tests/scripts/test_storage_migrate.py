@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from app.jobs.storage_migrate import migrate
+from app.storage.local import LocalStorage
+
+
+def test_migrate_copies_and_skips_identical(tmp_path: Path) -> None:
+    source = LocalStorage(tmp_path / "source")
+    target = LocalStorage(tmp_path / "target")
+    for key, data in {"a/1/x.psd": b"x" * 3000, "a/2/y.svg": b"<svg/>", "b-c.txt": b""}.items():
+        path = source.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    result = migrate(source, target, workers=2)
+    assert (result.copied, result.skipped, result.failed) == (3, 0, 0)
+    assert result.bytes == 3006
+    assert target.path("a/1/x.psd").read_bytes() == b"x" * 3000
+    assert [o.key for o in target.iter_objects()] == ["a/1/x.psd", "a/2/y.svg", "b-c.txt"]
+
+    result = migrate(source, target, workers=2)
+    assert (result.copied, result.skipped) == (0, 3)
@@ -0,0 +1,26 @@
+from sqlmodel import Session, update
+
+from app.jobs.tag_usage_reconcile import find_drift, reconcile
+from app.models import Tag
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, create_random_tag
+from tests.utils.user import create_random_user
+
+
+def test_reconcile_repairs_drift(db: Session, media_root: object) -> None:
+    company = create_random_company(db, create_random_user(db))
+    items = [create_random_design_item(db, company, content=b"x") for _ in range(3)]
+    used = create_random_tag(db, company, items)
+    unused = create_random_tag(db, company)
+    used_id, unused_id = used.id, unused.id
+    assert company.id not in find_drift(db)
+
+    db.exec(update(Tag).where(Tag.id == used_id).values(usage_count=7))
+    db.exec(update(Tag).where(Tag.id == unused_id).values(usage_count=-2))
+    db.commit()
+    assert company.id in find_drift(db)
+
+    assert reconcile(db) >= 1
+    db.expire_all()
+    assert (db.get(Tag, used_id).usage_count, db.get(Tag, unused_id).usage_count) == (3, 0)  # type: ignore[union-attr]
+    assert company.id not in find_drift(db)
@@ -0,0 +1,26 @@
+from sqlmodel import Session, update
+
+from app import thumbnails
+from app.jobs.thumbnail_backfill import backfill
+from app.models import DesignItem
+from tests.utils.company import create_random_company
+from tests.utils.design_item import create_random_design_item, random_design_image
+from tests.utils.user import create_random_user
+
+
+def test_backfill_thumbnails(db: Session, media_root: object) -> None:
+    company = create_random_company(db, create_random_user(db))
+    image = create_random_design_item(db, company, filename="a.png", content=random_design_image(5))
+    text = create_random_design_item(db, company, filename="b.txt", content=b"not an image")
+    made = image.thumbnail_hash
+    assert made
+    db.exec(update(DesignItem).where(DesignItem.company_id == company.id).values(thumbnail_hash=None))
+    db.commit()
+
+    result = backfill(db, batch_size=1, workers=2)
+    assert result.made >= 2
+    db.refresh(image)
+    db.refresh(text)
+    assert (image.thumbnail_hash, text.thumbnail_hash) == (made, thumbnails.NO_THUMBNAIL)
+
+    assert backfill(db, after=result.last_id).scanned == 0
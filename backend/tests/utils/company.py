@@ -0,0 +1,16 @@
+from sqlmodel import Session
+
+from app.models import Company, CompanyRole, CompanyUsage, User, UserCompanyLink
+from tests.utils.utils import random_lower_string
+
+
+def create_random_company(db: Session, owner: User) -> Company:
+    company = Company(title=random_lower_string())
+    link = UserCompanyLink(
+        company_id=company.id, user_id=owner.id, role=CompanyRole.owner)
+    db.add(company)
+    db.add(link)
+    db.add(CompanyUsage(company_id=company.id))
+    db.commit()
+    db.refresh(company)
+    return company
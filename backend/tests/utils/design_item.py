@@ -0,0 +1,72 @@
+import io
+import random
+import uuid
+from typing import Any
+
+from PIL import Image, ImageDraw
+from sqlmodel import Session
+
+from app import crud, similarity, thumbnails
+from app.image_info import read_stored_image_info
+from app.models import Company, DesignItem, Tag, TagItemLink
+from app.storage import get_storage
+from app.storage.compression import compress_file
+from tests.utils.utils import random_lower_string
+
+
+def create_random_design_item(
+    db: Session, company: Company, *, filename: str = "design.psd", content: bytes | None = None,
+    compress: bool = False,
+) -> DesignItem:
+    content = random_lower_string().encode() * 100 if content is None else content
+    item_id = uuid.uuid4()
+    file_path = f"{company.id}/{item_id}/{filename}"
+    path = get_storage().path(file_path)  # type: ignore[attr-defined]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    # As chunked uploads store it
+    file_codec = compress_file(path) if compress else None
+    owner = company.employee[0]
+    return crud.create_design_item(
+        session=db,
+        company_id=company.id,
+        creator_id=owner.id,
+        item_id=item_id,
+        title=random_lower_string(),
+        description=None,
+        file_path=file_path,
+        file_size=len(content),
+        file_codec=file_codec,
+        perceptual_hash=similarity.preview_hash(file_path, len(content), file_codec),
+        image_info=read_stored_image_info(file_path, file_codec),
+        thumbnail_hash=thumbnails.preview_thumbnail(file_path, len(content), file_codec),
+    )
+
+
+def random_design_image(
+    seed: int, format: str = "PNG", size: tuple[int, int] = (400, 300), **save_options: Any
+) -> bytes:
+    """
+    Colored ellipses on white, the same seed draws the same design at any
+    size and in any format.
+    """
+    rng = random.Random(seed)
+    image = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(400), rng.randrange(300)
+        draw.ellipse([x, y, x + rng.randrange(40, 160), y + rng.randrange(40, 160)],
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    output = io.BytesIO()
+    image.resize(size).save(output, format, **save_options)
+    return output.getvalue()
+
+
+def create_random_tag(db: Session, company: Company, items: list[DesignItem] | None = None) -> Tag:
+    tag = Tag(title=random_lower_string()[:31], company_id=company.id, usage_count=len(items or []))
+    db.add(tag)
+    for item in items or []:
+        db.add(TagItemLink(design_item_id=item.id, tag_id=tag.id))
+    db.commit()
+    db.refresh(tag)
+    return tag